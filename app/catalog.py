@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Any, Literal
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from app.config import COURSE_FILES_DUAL_READ
+from app.database.models.course import Course, CourseFile, _catalog_collection, archive_link
+from app.database.models.ordinal import Ordinal
+from app.tenants import tenants
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = "public, max-age=60"
+
+CourseKind = Literal["practical", "theoretical"]
+
+
+@dataclass(frozen=True)
+class Representation:
+    """One JSON document of the snapshot, pre-serialized and pre-compressed, with its strong ETags."""
+
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+    @classmethod
+    def of(cls, payload: Any) -> Representation:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        return cls(body, gzip.compress(body, mtime=0), hashlib.sha256(body).hexdigest()[:32])
+
+    def response(self, request: Request) -> Response:
+        """Serve the document, gzipped if accepted, or a 304 if the client already holds this version."""
+        compress = "gzip" in request.headers.get("Accept-Encoding", "")
+        etag = f'"{self.etag}-gz"' if compress else f'"{self.etag}"'
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+
+        if _matches(request.headers.get("If-None-Match"), etag):
+            return Response(status_code=304, headers=headers)
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return Response(self.gzipped if compress else self.body, media_type="application/json", headers=headers)
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against `etag`, as RFC 9110 prescribes for it."""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+async def _file_ids_by_title() -> dict[tuple[Any, str], set[int]]:
+    """Archive message ids of every file, grouped by (course id, title)."""
+    group = {
+        "$group": {"_id": {"course": "$courseId", "title": "$title"}, "ids": {"$push": "$archiveTelegramMessageId"}}
+    }
+    pipelines = [(_catalog_collection(CourseFile), [{"$match": {"missingSince": None}}, group])]
+    if COURSE_FILES_DUAL_READ:
+        embedded = [
+            {"$match": {"files.0": {"$exists": True}}},
+            {"$unwind": "$files"},
+            {
+                "$project": {
+                    "courseId": "$_id",
+                    "title": "$files.title",
+                    "archiveTelegramMessageId": "$files.archiveTelegramMessageId",
+                }
+            },
+        ]
+        pipelines.append((_catalog_collection(Course), [*embedded, group]))
+
+    ids: defaultdict[tuple[Any, str], set[int]] = defaultdict(set)
+    for collection, pipeline in pipelines:
+        async for row in await collection.aggregate(pipeline):
+            ids[(row["_id"]["course"], row["_id"]["title"])].update(row["ids"])
+    return ids
+
+
+async def build_snapshot() -> dict[str, Representation]:
+    """Build every catalog document: per batch, the index and one per (semester, kind) section.
+
+    Documents are keyed `{namespace}/index` and `{namespace}/{semester}/{kind}`.
+    """
+    generated_at = datetime.now(UTC).isoformat(timespec="seconds")
+    projection = {"courseName": 1, "tutorName": 1, "semester": 1, "isPractical": 1, "namespace": 1}
+    courses = await _catalog_collection(Course).find({}, projection).sort("courseName").to_list()
+    file_ids = await _file_ids_by_title()
+    course_tenants = {
+        course["_id"]: tenant
+        for course in courses
+        if (tenant := tenants.by_namespace(course.get("namespace", tenants.default.namespace)))
+    }
+
+    titles_by_course: defaultdict[Any, list[dict[str, Any]]] = defaultdict(list)
+    for (course_id, title), ids in sorted(file_ids.items(), key=lambda item: item[0][1]):
+        if tenant := course_tenants.get(course_id):
+            link = archive_link(tenant.archiveChatId, min(ids))
+            titles_by_course[course_id].append({"title": title, "files": len(ids), "link": link})
+
+    sections: defaultdict[tuple[str, int, CourseKind], list[dict[str, Any]]] = defaultdict(list)
+    for course in courses:
+        if not (titles := titles_by_course.get(course["_id"])):
+            continue  # no files, or a batch this process doesn't serve
+        kind: CourseKind = "practical" if course["isPractical"] else "theoretical"
+        namespace = course_tenants[course["_id"]].namespace
+        sections[(namespace, course["semester"], kind)].append(
+            {
+                "name": course["courseName"],
+                "tutor": course["tutorName"],
+                "files": sum(title["files"] for title in titles),
+                "titles": titles,
+            }
+        )
+
+    snapshot = {
+        f"{namespace}/{semester}/{kind}": Representation.of(
+            {"batch": namespace, "semester": semester, "type": kind, "generatedAt": generated_at, "courses": section}
+        )
+        for (namespace, semester, kind), section in sections.items()
+    }
+    for tenant in tenants.all:
+        snapshot[f"{tenant.namespace}/index"] = Representation.of(
+            {
+                "batch": tenant.namespace,
+                "title": tenant.label,
+                "generatedAt": generated_at,
+                "sections": [
+                    {
+                        "semester": semester,
+                        "semesterName": Ordinal.get_name(semester),
+                        "level": Ordinal.current_level(semester, tenant.startYear),
+                        "type": kind,
+                        "courses": len(section),
+                        "files": sum(course["files"] for course in section),
+                        "url": f"/catalog/{tenant.namespace}/{semester}/{kind}",
+                    }
+                    for (namespace, semester, kind), section in sorted(sections.items())
+                    if namespace == tenant.namespace
+                ],
+            }
+        )
+    return snapshot
+
+
+class CatalogSnapshot:
+    """The catalog documents, rebuilt on first use after `Course.catalog_version` changes (tenant reloads bump it)."""
+
+    def __init__(self) -> None:
+        self._version = -1
+        self._documents: dict[str, Representation] = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Representation | None:
+        if self._version != Course.catalog_version:
+            async with self._lock:
+                if self._version != Course.catalog_version:
+                    version = Course.catalog_version
+                    self._documents = await build_snapshot()
+                    self._version = version
+                    logger.info("Rebuilt catalog snapshot (%d documents)", len(self._documents))
+        return self._documents.get(key)
+
+
+snapshot = CatalogSnapshot()
+
+router = APIRouter(prefix="/catalog", tags=["catalog"])
+
+
+@router.get("")
+async def get_catalog(request: Request) -> Response:
+    """The default batch's semester/type sections with their course and file counts."""
+    return await get_batch_catalog(request, tenants.default.namespace)
+
+
+@router.get("/{semester}/{kind}")
+async def get_section(request: Request, semester: int, kind: CourseKind) -> Response:
+    """Courses of one semester and type of the default batch, with their file titles, counts and archive links."""
+    return await get_batch_section(request, tenants.default.namespace, semester, kind)
+
+
+@router.get("/{namespace}")
+async def get_batch_catalog(request: Request, namespace: str) -> Response:
+    """Every semester/type section of one batch with its course and file counts."""
+    if not (document := await snapshot.get(f"{namespace}/index")):
+        if not tenants.by_namespace(namespace):
+            raise HTTPException(status_code=404, detail="Unknown batch")
+        raise HTTPException(status_code=503, detail="Catalog unavailable")
+    return document.response(request)
+
+
+@router.get("/{namespace}/{semester}/{kind}")
+async def get_batch_section(request: Request, namespace: str, semester: int, kind: CourseKind) -> Response:
+    """Courses of one batch, semester and type, with their file titles, counts and archive links."""
+    if not (document := await snapshot.get(f"{namespace}/{semester}/{kind}")):
+        raise HTTPException(status_code=404, detail="No materials for this batch, semester and type")
+    return document.response(request)
@@ -15,12 +15,92 @@ SEMESTER_START_YEAR = env.int("SEMESTER_START_YEAR", 2025)
 
 CHANNEL_ID = env.int("CHANNEL_ID", default=0)
 ARCHIVE_CHANNEL = env.int("ARCHIVE_CHANNEL", default=0)
+
+# The channels above (with SEMESTER_START_YEAR) are the default batch, whose courses live under TENANT_NAMESPACE.
+# More batches are rows of the `tenants` collection (see scripts/addTenant.py), reloaded every TENANT_RELOAD_INTERVAL
+# seconds.
+TENANT_NAMESPACE = env.str("TENANT_NAMESPACE", "default")
+TENANT_RELOAD_INTERVAL = env.float("TENANT_RELOAD_INTERVAL", 300.0)
+
 LOG_CHANNEL_ID = env.int("LOG_CHANNEL_ID", default=None)
 
+# Console logging runs on a background thread fed by a bounded queue (records beyond it are dropped and counted).
+# LOG_FORMAT is "text" or "json" (one object per line); LOG_SAMPLING keeps only a fraction of the records below
+# WARNING from noisy loggers, e.g. "app.database.models.course=0.1,app.handlers.channel=0.5".
+LOG_FORMAT = env.str("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = env.int("LOG_QUEUE_SIZE", 10_000)
+LOG_SAMPLING = env.dict("LOG_SAMPLING", {}, subcast_values=float)
+
+# Seconds between paced edits in the archive channel (Telegram allows ~20 messages/minute per chat).
+ARCHIVE_EDIT_INTERVAL = env.float("ARCHIVE_EDIT_INTERVAL", 3.0)
+
+# Seconds a caption edit waits for further edits of the same post before being applied (only the latest is kept).
+CAPTION_EDIT_DEBOUNCE = env.float("CAPTION_EDIT_DEBOUNCE", 2.0)
+
+# Seconds concurrent file upserts for the same course are collected before being written together.
+FILE_WRITE_WINDOW = env.float("FILE_WRITE_WINDOW", 0.2)
+
+# Whether a source post whose file is already archived under its course is answered with a link to the archived copy
+# (it is never copied again either way).
+DUPLICATE_FILE_REPORT = env.bool("DUPLICATE_FILE_REPORT", False)
+
+# Seconds file downloads are counted in memory before being written to MongoDB in one bulk update, and whether browse
+# menus list a course's most downloaded titles first.
+DOWNLOAD_FLUSH_INTERVAL = env.float("DOWNLOAD_FLUSH_INTERVAL", 30.0)
+BROWSE_POPULAR_FIRST = env.bool("BROWSE_POPULAR_FIRST", False)
+
+# Chat the archive verifier copies archive posts to (deleting the copies right away) to find posts deleted by hand,
+# and the seconds between its Bot API calls. Without a chat only failed deliveries are checked; use a private chat.
+ARCHIVE_VERIFY_CHAT = env.int("ARCHIVE_VERIFY_CHAT", default=None)
+ARCHIVE_VERIFY_INTERVAL = env.float("ARCHIVE_VERIFY_INTERVAL", 1.0)
+
 HOST_URL = env.str("HOST_URL", None)
 WEBHOOK_EP = env.str("WEBHOOK_ENDPOINT", "webhook")
 WEBHOOK_SECRET = env.str("WEBHOOK_SECRET", secrets.token_hex(32))
 
+# Optional bearer token required to scrape /metrics.
+METRICS_TOKEN = env.str("METRICS_TOKEN", None)
+
+# Optional token (sent as X-Debug-Token) enabling the /debug endpoints; they are disabled when unset.
+DEBUG_TOKEN = env.str("DEBUG_TOKEN", None)
+TRACE_SLOW_THRESHOLD = env.float("TRACE_SLOW_THRESHOLD", 1.0)
+TRACE_BUFFER_SIZE = env.int("TRACE_BUFFER_SIZE", 50)
+LOOP_LAG_INTERVAL = env.float("LOOP_LAG_INTERVAL", 0.5)
+
+# Optional path; when set, sanitized webhook payloads are appended there for offline replay (see loadtest/).
+WEBHOOK_RECORD_PATH = env.str("WEBHOOK_RECORD_PATH", None)
+
+# Optional Bot API server base URL (a local Bot API server, or the load-test fake in loadtest/).
+TELEGRAM_API_URL = env.str("TELEGRAM_API_URL", None)
+
+# Dropping repeated updates (webhook retries, replays): how many recent keys each worker remembers, whether
+# claims are also shared through MongoDB (for several workers), and how long shared claims are kept.
+UPDATE_DEDUP_WINDOW = env.int("UPDATE_DEDUP_WINDOW", 10_000)
+UPDATE_DEDUP_SHARED = env.bool("UPDATE_DEDUP_SHARED", False)
+UPDATE_DEDUP_TTL = env.int("UPDATE_DEDUP_TTL", 86_400)
+
+# Per-user limits in private chats: token buckets (actions per second refilled, burst size) per action class, and
+# how many of a user's updates may be handled at once. Actions over a limit get a short notice and are dropped.
+THROTTLE_NAVIGATION_RATE = env.float("THROTTLE_NAVIGATION_RATE", 2.0)
+THROTTLE_NAVIGATION_BURST = env.int("THROTTLE_NAVIGATION_BURST", 8)
+THROTTLE_DOWNLOAD_RATE = env.float("THROTTLE_DOWNLOAD_RATE", 0.2)
+THROTTLE_DOWNLOAD_BURST = env.int("THROTTLE_DOWNLOAD_BURST", 3)
+THROTTLE_CONVERT_RATE = env.float("THROTTLE_CONVERT_RATE", 0.02)
+THROTTLE_CONVERT_BURST = env.int("THROTTLE_CONVERT_BURST", 2)
+THROTTLE_MAX_IN_FLIGHT = env.int("THROTTLE_MAX_IN_FLIGHT", 2)
+
+# Image-to-PDF conversions: how many run at once (the rest wait in a per-user round-robin queue), and the largest
+# job admitted, by image count and by total pixels (pages are decoded in memory, ~3 bytes per pixel).
+IMG2PDF_MAX_CONCURRENT = env.int("IMG2PDF_MAX_CONCURRENT", 2)
+IMG2PDF_MAX_IMAGES = env.int("IMG2PDF_MAX_IMAGES", 100)
+IMG2PDF_MAX_PIXELS = env.int("IMG2PDF_MAX_PIXELS", 150_000_000)
+
+# Images sent for conversion are downloaded in the background as they arrive: downloads at once overall, pending
+# prefetches per user, and whether to also re-save non-RGB images as RGB JPEGs ahead of time.
+IMG2PDF_PREFETCH_CONCURRENCY = env.int("IMG2PDF_PREFETCH_CONCURRENCY", 4)
+IMG2PDF_PREFETCH_PER_USER = env.int("IMG2PDF_PREFETCH_PER_USER", 20)
+IMG2PDF_PREFETCH_NORMALIZE = env.bool("IMG2PDF_PREFETCH_NORMALIZE", False)
+
 WEBHOOK_URL: str | None = None
 if HOST_URL and WEBHOOK_EP:
     WEBHOOK_URL = f"{HOST_URL}/{WEBHOOK_EP}"
@@ -36,3 +116,19 @@ if MONGO_USER and MONGO_PASS:
     MONGO_URL = (
         f"mongodb://{urllib.parse.quote(MONGO_USER)}:{urllib.parse.quote(MONGO_PASS)}@{MONGO_HOST}:{MONGO_PORT}/"
     )
+
+# Skip index checks/creation in init_beanie (safe once indexes exist; speeds up cold starts).
+SKIP_INDEXES = env.bool("SKIP_INDEXES", False)
+
+# Connection pool bounds per worker (driver defaults: 100 / 0).
+MONGO_MAX_POOL_SIZE = env.int("MONGO_MAX_POOL_SIZE", 100)
+MONGO_MIN_POOL_SIZE = env.int("MONGO_MIN_POOL_SIZE", 0)
+
+# Read preference for read-only catalog queries (browsing); writes and reads right after a write use the primary.
+# On a standalone server this has no effect. Max staleness must be at least 90 seconds (or -1 for no bound).
+CATALOG_READ_PREFERENCE = env.str("CATALOG_READ_PREFERENCE", "secondaryPreferred")
+CATALOG_MAX_STALENESS = env.int("CATALOG_MAX_STALENESS", 90)
+
+# While course files are being moved out of the course documents (scripts/migrateFiles.py), reads also merge in
+# files still embedded there and writes migrate the files they touch first. Turn off once the migration is done.
+COURSE_FILES_DUAL_READ = env.bool("COURSE_FILES_DUAL_READ", True)
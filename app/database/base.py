@@ -1,6 +1,41 @@
 from pymongo import AsyncMongoClient
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 
-from app.config import MONGO_NAME, MONGO_URL
+from app.config import (
+    CATALOG_MAX_STALENESS,
+    CATALOG_READ_PREFERENCE,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_NAME,
+    MONGO_URL,
+)
+from app.database.listeners import CommandMetricsListener
 
-client = AsyncMongoClient(MONGO_URL)
+_READ_PREFERENCES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def make_read_preference(
+    name: str, max_staleness: int
+) -> Primary | PrimaryPreferred | Secondary | SecondaryPreferred | Nearest:
+    if name == "primary":
+        return Primary()
+    if name not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {name!r}; expected primary or one of {', '.join(_READ_PREFERENCES)}")
+    return _READ_PREFERENCES[name](max_staleness=max_staleness)
+
+
+client = AsyncMongoClient(
+    MONGO_URL,
+    event_listeners=[CommandMetricsListener()],
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+)
 database = client[MONGO_NAME]
+
+catalog_read_preference = make_read_preference(CATALOG_READ_PREFERENCE, CATALOG_MAX_STALENESS)
+"""Read preference for read-only catalog queries; everything else uses the client default (primary)."""
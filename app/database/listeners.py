@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from pymongo import monitoring
+
+from app.metrics import MONGO_COMMAND_DURATION
+from app.tracing import record_span
+
+if TYPE_CHECKING:
+    from pymongo.monitoring import CommandFailedEvent, CommandStartedEvent, CommandSucceededEvent
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Record the latency of every MongoDB command the driver runs, as a metric and a trace span."""
+
+    def started(self, event: CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: CommandSucceededEvent) -> None:
+        self._record(event, "ok")
+
+    def failed(self, event: CommandFailedEvent) -> None:
+        self._record(event, "error")
+
+    @staticmethod
+    def _record(event: CommandSucceededEvent | CommandFailedEvent, status: str) -> None:
+        duration, (host, port) = event.duration_micros / 1e6, event.connection_id
+        MONGO_COMMAND_DURATION.observe(duration, command=event.command_name, status=status)
+        # The server shows which replica set member served the command (see CATALOG_READ_PREFERENCE).
+        record_span(f"mongo {event.command_name}", duration, status=status, server=f"{host}:{port}")
@@ -1,4 +1,7 @@
 from .course import Course, CourseFile
+from .jobs import RecaptionJob
 from .ordinal import Ordinal
+from .tenant import Tenant
+from .updates import ProcessedUpdate
 
-__all__ = ["Course", "CourseFile", "Ordinal"]
+__all__ = ["Course", "CourseFile", "Ordinal", "ProcessedUpdate", "RecaptionJob", "Tenant"]
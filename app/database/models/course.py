@@ -2,26 +2,54 @@ from __future__ import annotations
 
 import logging
 import re
+import time
 from collections import defaultdict
 from datetime import UTC, datetime
 from enum import StrEnum
 from pathlib import Path
-from typing import TYPE_CHECKING, Annotated, ClassVar, Self
+from typing import TYPE_CHECKING, Annotated, Any, ClassVar, Self
 
 from async_lru import alru_cache
-from beanie import Document, Indexed, Insert, Save, Update, after_event
+from beanie import Document, Indexed, Insert, PydanticObjectId, Save, Update, after_event
+from beanie.operators import In
 from pydantic import BaseModel, Field, model_validator
-from pymongo import IndexModel
-from rapidfuzz import fuzz, process
-
+from pymongo import IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import (
+    ARCHIVE_CHANNEL,
+    CATALOG_MAX_STALENESS,
+    COURSE_FILES_DUAL_READ,
+    DOWNLOAD_FLUSH_INTERVAL,
+    FILE_WRITE_WINDOW,
+    TENANT_NAMESPACE,
+)
+from app.database.base import catalog_read_preference
 from app.database.models.mixins import TimestampMixin
 from app.database.models.ordinal import Ordinal
+from app.metrics import CACHE_STATS, QUEUE_DEPTH
+from app.pacing import Batcher
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+
     from aiogram.types import Message
+    from pymongo.asynchronous.collection import AsyncCollection
+
+    from app.database.models.tenant import Tenant
 
 logger = logging.getLogger(__name__)
 
+# After a write, catalog reads stay on the primary for as long as a secondary may lag behind it.
+_POST_WRITE_PRIMARY_WINDOW = max(CATALOG_MAX_STALENESS, 90)
+_primary_reads_until = 0.0
+
+# Bulk write attempts before the files that keep conflicting are treated as stale.
+_WRITE_ATTEMPTS = 3
+
+# Fields `CourseFile.upsert_ops` always sets; the rest are only written when a file is first stored.
+_UPSERT_SET_FIELDS = {"id", "revision_id", "courseId", "title", "fileId", "updatedAt"}
+
 CAPTION_PATTERN = re.compile(r"(?P<course>.+?)(?:\s*\((?P<tutor>.+?)\))?\s*\|\s*(?P<title>.+)")
 
 
@@ -33,6 +61,8 @@ def _resolve_course_similarity(course: str, existing: list[str], threshold: int
         logger.info(f"Exact match found in database for: '{course}'")
         return course
 
+    from rapidfuzz import fuzz, process  # deferred: only needed when ingesting, keeps startup light
+
     match = process.extractOne(course, existing, scorer=fuzz.token_sort_ratio)
 
     logger.info(f"Best match: {match}")
@@ -58,8 +88,18 @@ class MessageType(StrEnum):
     VIDEO = "video"
 
 
-class CourseFile(BaseModel):
-    """Represents a file associated with a course."""
+class FileAlias(BaseModel):
+    """Another source post of the same file, archived only once (see `CourseFile.add_alias`)."""
+
+    fromChatId: int
+    originalTelegramMessageId: int
+
+
+class CourseFile(Document):
+    """A file archived under a course, stored in its own collection and referencing the course by id."""
+
+    courseId: PydanticObjectId | None = None
+    """Id of the course the file belongs to."""
 
     title: str
     """Human-readable title of the file."""
@@ -68,7 +108,7 @@ class CourseFile(BaseModel):
     """Telegram message ID where the file is stored in the archive channel."""
 
     chatId: int
-    """Chat ID of the archive channel."""
+    """Chat ID of the archive channel; archive message ids are only unique within it."""
 
     originalTelegramMessageId: int
     """Original Telegram message ID from the source chat."""
@@ -76,9 +116,15 @@ class CourseFile(BaseModel):
     fromChatId: int
     """Source chat ID where the file was originally sent."""
 
+    aliases: list[FileAlias] = Field(default_factory=list)
+    """Later source posts of the same file, which edit this file instead of being archived again."""
+
     fileId: str
     """Unique Telegram file identifier."""
 
+    fileUniqueId: str | None = None
+    """Telegram's stable id of the file content, the same for every copy; None for files imported from exports."""
+
     originalName: str
     """Original filename as uploaded by the user."""
 
@@ -94,12 +140,28 @@ class CourseFile(BaseModel):
     sizeBytes: int
     """File size in bytes."""
 
+    downloads: int = 0
+    """How many times the file was sent to a user (counted in memory, flushed periodically)."""
+
+    missingSince: datetime | None = None
+    """When the archive post was found deleted; such files are no longer offered."""
+
     createdAt: datetime = Field(default_factory=lambda: datetime.now(UTC))
     """Date and time when the document was created (UTC)."""
 
     updatedAt: datetime = Field(default_factory=lambda: datetime.now(UTC))
     """Date and time when the document was last updated (UTC)."""
 
+    class Settings:
+        name = "course_files"
+        indexes: ClassVar[list[IndexModel]] = [
+            IndexModel([("courseId", 1), ("title", 1)]),
+            IndexModel([("chatId", 1), ("archiveTelegramMessageId", 1)], unique=True),
+            IndexModel([("fromChatId", 1), ("originalTelegramMessageId", 1)]),
+            IndexModel([("aliases.fromChatId", 1), ("aliases.originalTelegramMessageId", 1)]),
+            IndexModel([("courseId", 1), ("fileUniqueId", 1), ("sizeBytes", 1)]),
+        ]
+
     @model_validator(mode="after")
     def update_timestamp(self) -> Self:
         """Automatically updates the 'updatedAt' field after updates any field."""
@@ -126,6 +188,7 @@ class CourseFile(BaseModel):
         extension = Path(file_name).suffix.lstrip(".")
         return cls(
             fileId=file.file_id,
+            fileUniqueId=file.file_unique_id,
             originalName=file_name,
             mimeType=mime_type,
             sizeBytes=file_size,
@@ -163,9 +226,156 @@ class CourseFile(BaseModel):
 
         return course_files, course_captions
 
+    @property
+    def content_key(self) -> tuple[str, int] | None:
+        """What identifies the file's content: Telegram's unique file id and the size, when the id is known."""
+        return (self.fileUniqueId, self.sizeBytes) if self.fileUniqueId else None
+
+    @classmethod
+    async def find_duplicates(
+        cls, course_id: PydanticObjectId | None, files: Iterable[CourseFile]
+    ) -> dict[tuple[str, int], CourseFile]:
+        """The earliest file of a course already archived with the same content as each of `files`, by content key."""
+        if not (keys := {key for f in files if (key := f.content_key)}):
+            return {}
+
+        query = {
+            "courseId": course_id,
+            "missingSince": None,
+            "$or": [{"fileUniqueId": unique_id, "sizeBytes": size} for unique_id, size in keys],
+        }
+        duplicates: dict[tuple[str, int], CourseFile] = {}
+        async for file in cls.find(query).sort("archiveTelegramMessageId"):
+            if key := file.content_key:
+                duplicates.setdefault(key, file)
+        return duplicates
+
+    async def add_alias(self, file: CourseFile) -> None:
+        """Link `file`'s source post to this archived file, so edits of that post retitle this file."""
+        alias = FileAlias(fromChatId=file.fromChatId, originalTelegramMessageId=file.originalTelegramMessageId)
+        await self.get_pymongo_collection().update_one({"_id": self.id}, {"$addToSet": {"aliases": alias.model_dump()}})
+
+    @classmethod
+    def upsert_ops(cls, files: Iterable[CourseFile], course_id: PydanticObjectId | None) -> list[UpdateOne]:
+        """Build one upsert per file, keyed by archive chat and message id, that files it under `course_id`.
+
+        Only the title, Telegram file id and course of an existing file change;
+        everything else is written once, when the file is first stored. Each
+        file's `updatedAt` (when its message was seen) acts as its revision: a
+        stored copy with a newer one doesn't match, so the upsert fails on the
+        unique archive id instead of overwriting it.
+        """
+        return [
+            UpdateOne(
+                {
+                    "chatId": f.chatId,
+                    "archiveTelegramMessageId": f.archiveTelegramMessageId,
+                    "updatedAt": {"$lte": f.updatedAt},
+                },
+                {
+                    "$set": {"courseId": course_id, "title": f.title, "fileId": f.fileId, "updatedAt": f.updatedAt},
+                    "$setOnInsert": f.model_dump(exclude=_UPSERT_SET_FIELDS),
+                },
+                upsert=True,
+            )
+            for f in files
+        ]
+
+    @classmethod
+    async def _embedded(cls, query: dict[str, Any]) -> list[CourseFile]:
+        """Legacy files still embedded in the courses matching `query`, read only while dual reads are on."""
+        if not COURSE_FILES_DUAL_READ:
+            return []
+
+        documents = _catalog_collection(Course).find({**query, "files.0": {"$exists": True}}, {"files": 1})
+        return [
+            cls.model_validate({**file, "chatId": ARCHIVE_CHANNEL, "courseId": document["_id"]})
+            async for document in documents
+            for file in document["files"]
+        ]
+
+    @classmethod
+    async def for_course(cls, course_id: PydanticObjectId | None, title: str | None = None) -> list[CourseFile]:
+        """Every file of a course (optionally only those titled `title`), in archive order."""
+        query: dict[str, Any] = {"courseId": course_id, "missingSince": None}
+        if title is not None:
+            query["title"] = title
+
+        stored = await _catalog_collection(cls).find(query).sort("archiveTelegramMessageId").to_list()
+        embedded = [f for f in await cls._embedded({"_id": course_id}) if title is None or f.title == title]
+        return _merge_embedded([cls.model_validate(document) for document in stored], embedded)
+
+    @classmethod
+    @alru_cache
+    async def titles(cls, course_id: PydanticObjectId | None) -> list[str]:
+        """Distinct file titles of a course, sorted."""
+        stored = await _catalog_collection(cls).distinct("title", {"courseId": course_id, "missingSince": None})
+        embedded = {f.title for f in await cls._embedded({"_id": course_id})}
+        return sorted({*stored, *embedded})
+
+    @classmethod
+    @alru_cache
+    async def archive_ids(cls, course_id: PydanticObjectId | None, title: str) -> list[int]:
+        """Archive message ids of the files of a course titled `title`, in archive order."""
+        return _archive_ids(await cls.for_course(course_id, title))
+
+    @classmethod
+    @alru_cache
+    async def course_ids_with_files(cls, course_ids: tuple[PydanticObjectId, ...]) -> frozenset[PydanticObjectId]:
+        """The subset of `course_ids` that have at least one file."""
+        query = {"courseId": {"$in": list(course_ids)}, "missingSince": None}
+        ids = set(await _catalog_collection(cls).distinct("courseId", query))
+        if COURSE_FILES_DUAL_READ:
+            legacy = {"_id": {"$in": list(course_ids)}, "files.0": {"$exists": True}}
+            ids.update(await _catalog_collection(Course).distinct("_id", legacy))
+        return frozenset(ids)
+
+    @classmethod
+    @alru_cache(ttl=DOWNLOAD_FLUSH_INTERVAL)
+    async def title_downloads(cls, course_id: PydanticObjectId | None) -> dict[str, int]:
+        """Downloads of each file title of a course (a title is sent whole, so its files share the count)."""
+        pipeline = [
+            {"$match": {"courseId": course_id, "downloads": {"$gt": 0}}},
+            {"$group": {"_id": "$title", "downloads": {"$max": "$downloads"}}},
+        ]
+        return {row["_id"]: row["downloads"] async for row in await _catalog_collection(cls).aggregate(pipeline)}
+
+    @classmethod
+    async def most_downloaded(
+        cls, course_ids: list[PydanticObjectId] | None = None, limit: int = 10
+    ) -> list[tuple[PydanticObjectId, str, int]]:
+        """The `limit` most downloaded (course id, title, downloads), optionally among `course_ids` only."""
+        match: dict[str, Any] = {"downloads": {"$gt": 0}}
+        if course_ids is not None:
+            match["courseId"] = {"$in": course_ids}
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": {"course": "$courseId", "title": "$title"}, "downloads": {"$max": "$downloads"}}},
+            {"$sort": {"downloads": -1}},
+            {"$limit": limit},
+        ]
+        return [
+            (row["_id"]["course"], row["_id"]["title"], row["downloads"])
+            async for row in await cls.get_pymongo_collection().aggregate(pipeline)
+        ]
+
+    @classmethod
+    def clear_caches(cls) -> None:
+        cls.titles.cache_clear()
+        cls.archive_ids.cache_clear()
+        cls.course_ids_with_files.cache_clear()
+        cls.title_downloads.cache_clear()
+
+
+class EditedFile(BaseModel):
+    """What's needed to re-caption a file after its title was set in place."""
+
+    archiveTelegramMessageId: int
+    previousTitle: str
+
 
 class Course(TimestampMixin, Document):
-    """Represents a course linked to a subject and its files."""
+    """Represents a course linked to a subject; its files live in the `course_files` collection."""
 
     courseName: Annotated[str, Indexed()]
     """Name of the course or subject."""
@@ -179,14 +389,23 @@ class Course(TimestampMixin, Document):
     isPractical: bool
     """Indicates whether the subject is practical (True) or theoretical (False)."""
 
-    files: list[CourseFile] = Field(default_factory=list)
-    """List of files associated with this course."""
+    namespace: str = TENANT_NAMESPACE
+    """Namespace of the batch (`Tenant`) the course belongs to."""
+
+    downloads: int = 0
+    """How many times a file of the course was sent to a user (counted in memory, flushed periodically)."""
+
+    files: list[dict[str, Any]] = Field(default_factory=list)
+    """Legacy embedded files not yet moved to `course_files` (see `migrate_embedded_files`)."""
+
+    catalog_version: ClassVar[int] = 0
+    """Bumped whenever the catalog changes, so snapshots built from it know they are stale."""
 
     class Settings:
         indexes: ClassVar[list[str | IndexModel]] = [
             "files.archiveTelegramMessageId",
-            IndexModel([("semester", 1), ("courseName", 1)]),
-            IndexModel([("semester", 1), ("isPractical", 1), ("courseName", 1)]),
+            IndexModel([("namespace", 1), ("semester", 1), ("courseName", 1)]),
+            IndexModel([("namespace", 1), ("semester", 1), ("isPractical", 1), ("courseName", 1)]),
         ]
 
     @property
@@ -195,73 +414,341 @@ class Course(TimestampMixin, Document):
 
     def formatted_info(self, title: str) -> str:
         """Get formatted course information."""
+        return self.format_caption(self.courseName, self.tutorName, self.semester, title)
+
+    @staticmethod
+    def format_caption(course_name: str, tutor_name: str, semester: int, title: str) -> str:
+        """Build the archive caption for a file, without needing a loaded `Course`."""
         return (
-            f"{self.courseName} ({self.tutorName}) | {title}\n\n"
-            f"#المستوى_{self.level} #الفصل_{Ordinal.get_name(self.semester)}"
+            f"{course_name} ({tutor_name}) | {title}\n\n"
+            f"#المستوى_{Ordinal.get_name(Ordinal.current_level(semester))} #الفصل_{Ordinal.get_name(semester)}"
         )
 
     @classmethod
     @alru_cache
-    async def get_courses_name(cls, semester: int) -> list[str]:
-        """Retrieve course names for a given academic semester, defaults to the current semester."""
-        return await cls.distinct(Course.courseName, {"semester": semester})
+    async def get_courses_name(cls, namespace: str, semester: int) -> list[str]:
+        """Retrieve course names of a batch for a given academic semester."""
+        return await _catalog_collection(cls).distinct("courseName", {"namespace": namespace, "semester": semester})
+
+    @classmethod
+    async def resolve_name(cls, namespace: str, courseName: str, semester: int) -> str:
+        """Map a (possibly misspelled) course name to the stored name for `semester` in a batch."""
+        return _resolve_course_similarity(courseName, await cls.get_courses_name(namespace, semester))
 
     @classmethod
     @alru_cache
-    async def _get_course(cls, courseName: str, semester: int) -> Course | None:
-        """Fetch a Course object by name and semester with caching."""
-        courses = await cls.get_courses_name(semester)
-        course = _resolve_course_similarity(courseName, courses)
-        return await cls.find_one(cls.courseName == course, cls.semester == semester)
+    async def _get_course(cls, namespace: str, courseName: str, semester: int) -> Course | None:
+        """Fetch a Course object of a batch by name and semester with caching."""
+        course = await cls.resolve_name(namespace, courseName, semester)
+        return await cls.find_one(cls.namespace == namespace, cls.courseName == course, cls.semester == semester)
 
     @classmethod
-    async def get_course(cls, courseName: str, caption: str) -> Course | None:
-        """Fetch a course by name using semester extracted from a caption."""
-        return await cls._get_course(courseName=courseName, semester=Ordinal.get_semester(caption))
+    async def get_course(cls, courseName: str, caption: str, tenant: Tenant) -> Course | None:
+        """Fetch a course of `tenant` by name using semester extracted from a caption."""
+        semester = Ordinal.get_semester(caption, tenant.startYear)
+        return await cls._get_course(namespace=tenant.namespace, courseName=courseName, semester=semester)
 
     @classmethod
     @alru_cache
-    async def get_courses(cls, semester: int, is_practical: bool, course_name: str | None = None) -> list[Course]:
-        """Fetch courses with caching."""
-        query = {Course.semester: semester, Course.isPractical: is_practical}
+    async def get_courses(
+        cls, namespace: str, semester: int, is_practical: bool, course_name: str | None = None
+    ) -> list[Course]:
+        """Fetch a batch's courses with caching."""
+        query: dict[str, object] = {"namespace": namespace, "semester": semester, "isPractical": is_practical}
         if course_name:
-            query[Course.courseName] = course_name.strip()
+            query["courseName"] = course_name.strip()
 
-        return await Course.find(query).to_list()
+        documents = await _catalog_collection(cls).find(query).to_list()
+        return [cls.model_validate(document) for document in documents]
+
+    @classmethod
+    async def downloads_by_semester(cls, namespace: str) -> dict[int, int]:
+        """Total downloads of each semester's courses in a batch."""
+        pipeline = [
+            {"$match": {"namespace": namespace, "downloads": {"$gt": 0}}},
+            {"$group": {"_id": "$semester", "downloads": {"$sum": "$downloads"}}},
+            {"$sort": {"_id": 1}},
+        ]
+        return {row["_id"]: row["downloads"] async for row in await cls.get_pymongo_collection().aggregate(pipeline)}
+
+    @classmethod
+    def invalidate_caches(cls) -> None:
+        """Clear every course-related cache and pin catalog reads to the primary for a while."""
+        global _primary_reads_until
+        _primary_reads_until = time.monotonic() + _POST_WRITE_PRIMARY_WINDOW
+        Course.catalog_version += 1
+
+        CACHE_STATS.collect()
+        cls.get_courses_name.cache_clear()
+        cls.get_courses.cache_clear()
+        cls._get_course.cache_clear()
+        CourseFile.clear_caches()
+        CACHE_STATS.reset_seen()
 
     @after_event(Insert, Save, Update)
     def _invalidate_caches(self) -> None:
         """Clear every course-related cache whenever a course is created or modified."""
-        Course.get_courses_name.cache_clear()
-        Course.get_courses.cache_clear()
-        Course._get_course.cache_clear()
+        Course.invalidate_caches()
+
+    @classmethod
+    async def migrate_embedded_files(
+        cls, query: dict[str, Any], *, unset: bool = True, batch_size: int = 500
+    ) -> tuple[int, int]:
+        """Copy the files still embedded in the courses matching `query` into `course_files`.
+
+        Files are upserted by archive message id in batches of `batch_size`
+        without overwriting copies already stored, then counted back. A course's
+        embedded array is removed (with `unset`) only once all of its files are
+        verified stored and the array hasn't changed meanwhile. Safe to re-run.
+
+        Returns:
+            The number of files copied and of courses whose embedded files were
+            all verified stored.
+        """
+        collection = CourseFile.get_pymongo_collection()
+        copied = verified = 0
+
+        async for document in (
+            cls.get_pymongo_collection().find({**query, "files.0": {"$exists": True}}, {"files": 1}).sort("_id")
+        ):
+            files: list[dict[str, Any]] = document["files"]
+            # Embedded files predate batches, so they all live in the default batch's archive.
+            for start in range(0, len(files), batch_size):
+                ops = [
+                    UpdateOne(
+                        {"chatId": ARCHIVE_CHANNEL, "archiveTelegramMessageId": f["archiveTelegramMessageId"]},
+                        {"$setOnInsert": {**f, "chatId": ARCHIVE_CHANNEL, "courseId": document["_id"]}},
+                        upsert=True,
+                    )
+                    for f in files[start : start + batch_size]
+                ]
+                copied += (await collection.bulk_write(ops, ordered=False)).upserted_count
+
+            archive_ids = list({f["archiveTelegramMessageId"] for f in files})
+            stored = await collection.count_documents(
+                {"chatId": ARCHIVE_CHANNEL, "archiveTelegramMessageId": {"$in": archive_ids}}
+            )
+            if stored != len(archive_ids):
+                logger.warning("Course %s: only %d of %d files stored", document["_id"], stored, len(archive_ids))
+                continue
+
+            verified += 1
+            if unset:
+                await cls.get_pymongo_collection().update_one(
+                    {"_id": document["_id"], "files": {"$size": len(files)}}, {"$unset": {"files": ""}}
+                )
+
+        if copied or (unset and verified):
+            cls.invalidate_caches()
+        return copied, verified
+
+    @classmethod
+    async def _migrate_before_write(cls, query: dict[str, Any]) -> None:
+        """While dual reads are on, move the legacy files a write may touch into `course_files` first."""
+        if COURSE_FILES_DUAL_READ:
+            await cls.migrate_embedded_files(query)
+
+    async def retitle_file_by_original_id(
+        self, from_chat_id: int, original_message_id: int, title: str
+    ) -> EditedFile | None:
+        """Set the title of this course's file posted as `original_message_id` in `from_chat_id`, in one round trip.
 
-    def find_file_by_original_id(self, original_message_id: int) -> CourseFile | None:
-        """Find a file in this course by its original (source-channel) message id."""
-        return next((f for f in self.files if f.originalTelegramMessageId == original_message_id), None)
+        Reposts linked to an archived file (its `aliases`) match that file.
+
+        Returns:
+            The file's archive message id and previous title, or None if this
+            course doesn't hold that file.
+        """
+        await self._migrate_before_write({"_id": self.id})
+
+        document = await CourseFile.get_pymongo_collection().find_one_and_update(
+            {
+                "courseId": self.id,
+                "$or": [
+                    {"fromChatId": from_chat_id, "originalTelegramMessageId": original_message_id},
+                    {
+                        "aliases": {
+                            "$elemMatch": {"fromChatId": from_chat_id, "originalTelegramMessageId": original_message_id}
+                        }
+                    },
+                ],
+            },
+            {"$set": {"title": title, "updatedAt": datetime.now(UTC)}},
+            projection={"archiveTelegramMessageId": 1, "title": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if not document:
+            return None
+
+        if document["title"] != title:
+            self.invalidate_caches()
+        return EditedFile(
+            archiveTelegramMessageId=document["archiveTelegramMessageId"], previousTitle=document["title"]
+        )
 
     async def upsert_files(self, files: list[CourseFile]) -> bool:
-        """Upsert files by archiveTelegramMessageId."""
-        files_by_id = {f.archiveTelegramMessageId: f for f in self.files}
-        updated = False
+        """Upsert files by archive chat and message id.
 
-        for f in files:
-            existing = files_by_id.get(f.archiveTelegramMessageId)
+        Concurrent calls for the same course within `FILE_WRITE_WINDOW` seconds
+        are coalesced into one bulk write (see `file_writes`).
+        """
+        if not files:
+            return False
+        return await file_writes.submit(self.id, files)
 
-            if not existing:
-                self.files.append(f)
-                updated = True
+    @classmethod
+    async def _write_files(cls, course_id: PydanticObjectId, files: list[CourseFile]) -> bool:
+        """Store a batch of files for one course in one bulk write, retrying write conflicts.
+
+        A duplicate archive id means another write got there first: either a
+        concurrent insert of the same new file (the retry updates it instead) or
+        a newer revision of the file (the retry conflicts again and is dropped).
+        """
+        latest = {(f.chatId, f.archiveTelegramMessageId): f for f in sorted(files, key=lambda f: f.updatedAt)}
+        await cls._migrate_before_write({"_id": course_id})
+
+        ops, written = CourseFile.upsert_ops(latest.values(), course_id), False
+        for _ in range(_WRITE_ATTEMPTS):
+            try:
+                result = await CourseFile.get_pymongo_collection().bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", ())
+                if any(error.get("code") != 11000 for error in errors):
+                    raise
+                written = written or bool(e.details.get("nUpserted") or e.details.get("nModified"))
+                ops = [ops[error["index"]] for error in errors]
                 continue
 
-            if existing.title != f.title:
-                existing.title = f.title
-                updated = True
+            written = written or bool(result.upserted_count or result.modified_count)
+            break
+        else:
+            logger.info("Dropped %d stale file write(s) for course %s", len(ops), course_id)
+
+        if written:
+            cls.invalidate_caches()
+        return written
+
+    async def find_files_by_title(self, title: str) -> list[CourseFile]:
+        """Return every file in this course stored under `title`."""
+        await self._migrate_before_write({"_id": self.id})
+        return await CourseFile.find(CourseFile.courseId == self.id, CourseFile.title == title).to_list()
+
+    @classmethod
+    async def select_files(cls, chat_id: int, message_ids: Iterable[int]) -> list[tuple[Course, list[CourseFile]]]:
+        """Find the files archived in `chat_id` under `message_ids`, grouped by the course that holds them."""
+        ids = list(set(message_ids))
+        await cls._migrate_before_write({"files.archiveTelegramMessageId": {"$in": ids}})
+
+        files_by_course: defaultdict[PydanticObjectId | None, list[CourseFile]] = defaultdict(list)
+        async for file in CourseFile.find(CourseFile.chatId == chat_id, In(CourseFile.archiveTelegramMessageId, ids)):
+            files_by_course[file.courseId].append(file)
+
+        courses = await cls.find(In(cls.id, list(files_by_course))).to_list()
+        return [(course, files_by_course[course.id]) for course in courses]
+
+    @classmethod
+    async def bulk_delete_files(cls, selection: list[tuple[Course, list[CourseFile]]]) -> int:
+        """Delete every selected file in a single write.
+
+        Returns:
+            The number of files deleted.
+        """
+        if not (query := _selected_query(selection)):
+            return 0
+
+        result = await CourseFile.get_pymongo_collection().delete_many(query)
+        cls.invalidate_caches()
+        return result.deleted_count
+
+    @classmethod
+    async def drop_missing_files(cls, chat_id: int, archive_ids: list[int], *, pull: bool = False) -> int:
+        """Mark the files whose posts in archive `chat_id` were deleted as missing, or delete them if `pull` is set.
+
+        Returns:
+            The number of files marked or deleted.
+        """
+        if not archive_ids:
+            return 0
+
+        await cls._migrate_before_write({"files.archiveTelegramMessageId": {"$in": archive_ids}})
+        collection = CourseFile.get_pymongo_collection()
+        query = {"chatId": chat_id, "archiveTelegramMessageId": {"$in": archive_ids}}
+        if pull:
+            count = (await collection.delete_many(query)).deleted_count
+        else:
+            now = datetime.now(UTC)
+            count = (
+                await collection.update_many(query, {"$set": {"missingSince": now, "updatedAt": now}})
+            ).modified_count
+        cls.invalidate_caches()
+        return count
+
+    @classmethod
+    async def bulk_retitle_files(cls, selection: list[tuple[Course, list[CourseFile]]], title: str) -> int:
+        """Rename every selected file to `title` in a single write."""
+        return await cls._update_selected(selection, {"title": title})
+
+    @classmethod
+    async def bulk_move_files(cls, selection: list[tuple[Course, list[CourseFile]]], target: Course) -> int:
+        """Move every selected file into `target` in a single write."""
+        return await cls._update_selected(selection, {"courseId": target.id})
+
+    @classmethod
+    async def _update_selected(cls, selection: list[tuple[Course, list[CourseFile]]], fields: dict[str, Any]) -> int:
+        """Set `fields` on every selected file and invalidate the caches once."""
+        if not (query := _selected_query(selection)):
+            return 0
+
+        result = await CourseFile.get_pymongo_collection().update_many(
+            query,
+            {"$set": {**fields, "updatedAt": datetime.now(UTC)}},
+        )
+        cls.invalidate_caches()
+        return result.modified_count
+
+
+file_writes = Batcher(FILE_WRITE_WINDOW, Course._write_files)
+"""Coalesces concurrent file upserts per course into one bulk write."""
+QUEUE_DEPTH.set_function(lambda: len(file_writes), queue="file_writes")
+
+CACHE_STATS.track("course_names", Course.get_courses_name.cache_info)
+CACHE_STATS.track("course_lookup", Course._get_course.cache_info)
+CACHE_STATS.track("courses", Course.get_courses.cache_info)
+CACHE_STATS.track("file_titles", CourseFile.titles.cache_info)
+CACHE_STATS.track("file_ids", CourseFile.archive_ids.cache_info)
+CACHE_STATS.track("courses_with_files", CourseFile.course_ids_with_files.cache_info)
+CACHE_STATS.track("title_downloads", CourseFile.title_downloads.cache_info)
+
+
+def archive_link(chat_id: int, message_id: int) -> str:
+    """Link to a post of archive `chat_id` (opens for channel members)."""
+    return f"https://t.me/c/{str(chat_id).removeprefix('-100')}/{message_id}"
+
+
+def _archive_ids(files: Iterable[CourseFile]) -> list[int]:
+    return [f.archiveTelegramMessageId for f in files]
+
+
+def _selected_query(selection: list[tuple[Course, list[CourseFile]]]) -> dict[str, Any] | None:
+    """Filter matching every selected file by its archive chat and message id, or None if nothing is selected."""
+    ids_by_chat: defaultdict[int, list[int]] = defaultdict(list)
+    for _, files in selection:
+        for f in files:
+            ids_by_chat[f.chatId].append(f.archiveTelegramMessageId)
+    if not ids_by_chat:
+        return None
+    return {"$or": [{"chatId": chat, "archiveTelegramMessageId": {"$in": ids}} for chat, ids in ids_by_chat.items()]}
+
 
-            if existing.fileId != f.fileId:
-                existing.fileId = f.fileId  # expected to change
-                updated = True
+def _merge_embedded(stored: list[CourseFile], embedded: list[CourseFile]) -> list[CourseFile]:
+    """Add the legacy embedded files that have no stored copy yet; stored copies win."""
+    seen = set(_archive_ids(stored))
+    return stored + [f for f in embedded if f.archiveTelegramMessageId not in seen]
 
-        if updated:
-            await self.save()
 
-        return updated
+def _catalog_collection(model: type[Document]) -> AsyncCollection:
+    """Collection handle for read-only catalog queries, honouring the catalog read preference."""
+    collection = model.get_pymongo_collection()
+    if time.monotonic() < _primary_reads_until:
+        return collection
+    return collection.with_options(read_preference=catalog_read_preference)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from datetime import datetime  # noqa: TC003
+from enum import StrEnum
+from typing import Annotated, Any
+
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic import Field
+
+from app.database.models.mixins import TimestampMixin
+
+
+class JobStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class RecaptionJob(TimestampMixin, Document):
+    """A resumable bulk re-captioning of archive posts.
+
+    Progress is checkpointed as (`lastCourseId`, `lastMessageId`): courses are
+    walked in `_id` order and each course's files in archive message id order,
+    so a restarted job skips everything up to the checkpoint.
+    """
+
+    courseIds: list[PydanticObjectId] = Field(default_factory=list)
+    """Restrict the job to these courses (empty means no restriction)."""
+
+    semesters: list[int] = Field(default_factory=list)
+    """Restrict the job to courses in these semesters (empty means no restriction)."""
+
+    namespace: str | None = None
+    """Restrict the job to the courses of this batch (None means every batch)."""
+
+    description: str = ""
+    """Human-readable summary of what the job targets."""
+
+    status: Annotated[JobStatus, Indexed()] = JobStatus.PENDING
+    """Current lifecycle state of the job."""
+
+    total: int = 0
+    """Number of files the job has to re-caption."""
+
+    edited: int = 0
+    """Number of captions edited (or already up to date) so far."""
+
+    failed: int = 0
+    """Number of captions that couldn't be edited (e.g. the archive post was deleted)."""
+
+    lastCourseId: PydanticObjectId | None = None
+    """Checkpoint: the course currently being processed."""
+
+    lastMessageId: int = 0
+    """Checkpoint: the last archive message id processed within `lastCourseId`."""
+
+    startedAt: datetime | None = None
+    """When the job first started running."""
+
+    finishedAt: datetime | None = None
+    """When the job finished."""
+
+    class Settings:
+        name = "recaption_jobs"
+
+    def course_query(self) -> dict[str, Any]:
+        """Build the (indexed) filter selecting the affected courses, resuming from the checkpoint."""
+        query: dict[str, Any] = {}
+        if self.courseIds:
+            query["_id"] = {"$in": self.courseIds}
+        if self.semesters:
+            query["semester"] = {"$in": self.semesters}
+        if self.namespace:
+            query["namespace"] = self.namespace
+        if self.lastCourseId:
+            query.setdefault("_id", {})["$gte"] = self.lastCourseId
+        return query
+
+    @property
+    def processed(self) -> int:
+        return self.edited + self.failed
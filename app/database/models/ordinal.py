@@ -44,19 +44,20 @@ class Ordinal(int, Enum):
         return cls[name].value
 
     @classmethod
-    def get_semester(cls, text: str | None = None) -> int:
+    def get_semester(cls, text: str | None = None, start_year: int = SEMESTER_START_YEAR) -> int:
         """Extract the semester number from a text containing a hashtag like '#الفصل_<name>'.
 
         If the hashtag is not found, the default is the current semester
 
         Args:
             text (str): The text to search for the semester hashtag.
+            start_year (int): The year the batch started, for the current semester.
 
         Returns:
             int: The semester number corresponding to the ordinal name.
         """
         if not text or not (match := re.search(r"#الفصل_(\w+)", text)):
-            return cls.current_semester()
+            return cls.current_semester(start_year=start_year)
 
         return cls.get_value(match.group(1))
 
@@ -82,20 +83,20 @@ class Ordinal(int, Enum):
         return cls.to_semester(level, term)
 
     @classmethod
-    def current_level(cls, semester: int | None = None) -> int:
+    def current_level(cls, semester: int | None = None, start_year: int = SEMESTER_START_YEAR) -> int:
         """Returns the current academic level based on the semester number.
 
         Each 2 semesters correspond to one level.
         """
-        semester = semester if semester is not None else cls.current_semester()
+        semester = semester if semester is not None else cls.current_semester(start_year=start_year)
         if semester < 1:
             raise ValueError("Semester number must be positive")
         return (semester + 1) // 2
 
     @classmethod
-    def current_term(cls, semester: int | None = None) -> int:
+    def current_term(cls, semester: int | None = None, start_year: int = SEMESTER_START_YEAR) -> int:
         """Returns current academic term (1 or 2)."""
-        semester = semester if semester is not None else cls.current_semester()
+        semester = semester if semester is not None else cls.current_semester(start_year=start_year)
         return 1 if semester % 2 == 1 else 2
 
     @staticmethod
@@ -110,13 +111,13 @@ class Ordinal(int, Enum):
         return (level - 1) * 2 + term
 
     @classmethod
-    def available_levels(cls) -> list[str]:
+    def available_levels(cls, start_year: int = SEMESTER_START_YEAR) -> list[str]:
         """Returns available academic levels as Arabic words."""
-        current_level = cls.current_level()
+        current_level = cls.current_level(start_year=start_year)
         return [cls.get_name(i) for i in range(1, current_level + 1)]
 
     @classmethod
-    def available_terms(cls) -> list[str]:
+    def available_terms(cls, start_year: int = SEMESTER_START_YEAR) -> list[str]:
         """Returns available academic terms as Arabic words."""
-        current_term = cls.current_term()
+        current_term = cls.current_term(start_year=start_year)
         return [cls.get_name(i) for i in range(1, current_term + 1)]
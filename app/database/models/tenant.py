@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from typing import Annotated
+
+from beanie import Document, Indexed
+
+
+class Tenant(Document):
+    """One batch (cohort) served by the bot: its source and archive channels, calendar and catalog namespace."""
+
+    namespace: Annotated[str, Indexed(unique=True)]
+    """Key partitioning the batch's courses (`Course.namespace`) and catalog."""
+
+    title: str = ""
+    """Name students pick the batch by; defaults to the namespace."""
+
+    sourceChatId: Annotated[int, Indexed(unique=True)]
+    """Channel where the batch's materials are posted."""
+
+    archiveChatId: Annotated[int, Indexed(unique=True)]
+    """Channel the batch's files are archived in and delivered from."""
+
+    startYear: int
+    """Year the batch's level 1 / term 1 began."""
+
+    class Settings:
+        name = "tenants"
+
+    @property
+    def label(self) -> str:
+        return self.title or self.namespace
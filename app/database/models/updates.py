@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from typing import ClassVar
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+from pymongo.errors import BulkWriteError
+
+from app.config import UPDATE_DEDUP_TTL
+
+
+class ProcessedUpdate(Document):
+    """A claimed dedup key (an update id or a channel post), shared by every worker.
+
+    The key is the document id, so claiming it is a single insert that fails
+    with a duplicate key error when another worker (or an earlier delivery)
+    already claimed it. Claims expire after `UPDATE_DEDUP_TTL` seconds.
+    """
+
+    id: str  # pyright: ignore[reportIncompatibleVariableOverride]
+    """The dedup key, e.g. `update:123` or `post:-100123:45`."""
+
+    createdAt: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    """When the key was claimed (UTC); drives the TTL index."""
+
+    class Settings:
+        name = "processed_updates"
+        indexes: ClassVar[list[IndexModel]] = [
+            IndexModel("createdAt", expireAfterSeconds=UPDATE_DEDUP_TTL),
+        ]
+
+    @classmethod
+    async def claim(cls, keys: list[str]) -> bool:
+        """Claim every key in `keys`; return False if any of them was already claimed."""
+        now = datetime.now(UTC)
+        documents = [{"_id": key, "createdAt": now} for key in keys]
+        try:
+            await cls.get_pymongo_collection().insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", ())):
+                raise
+            return False
+        return True
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from app.config import DEBUG_TOKEN
+from app.tracing import slow_updates
+
+MAX_PROFILE_SECONDS = 60.0
+
+
+def require_debug_token(request: Request) -> None:
+    """Hide the debug endpoints unless DEBUG_TOKEN is configured and presented."""
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404)
+    if request.headers.get("X-Debug-Token") != DEBUG_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+
+router = APIRouter(prefix="/debug", include_in_schema=False, dependencies=[Depends(require_debug_token)])
+
+_profile_lock = asyncio.Lock()
+_tracemalloc_baseline: tracemalloc.Snapshot | None = None
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> Counter[str]:
+    """Sample `thread_id`'s Python stack every `interval` seconds, for `seconds`, as collapsed stacks."""
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if frame := sys._current_frames().get(thread_id):
+            names = []
+            while frame:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+@router.get("/slow")
+async def get_slow_updates() -> list[dict]:
+    """Span trees of the most recent slow updates, newest first."""
+    return list(reversed(slow_updates))
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: Annotated[float, Query(gt=0, le=MAX_PROFILE_SECONDS)] = 10.0,
+    interval: Annotated[float, Query(ge=0.001, le=1.0)] = 0.005,
+) -> str:
+    """Sample the event loop thread's stack for `seconds` and return collapsed stacks (flamegraph input)."""
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with _profile_lock:
+        stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds, interval)
+
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+@router.post("/tracemalloc", response_class=PlainTextResponse)
+async def tracemalloc_snapshot(limit: Annotated[int, Query(gt=0, le=200)] = 25) -> str:
+    """Start tracing allocations, or diff a new snapshot against the previous one."""
+    global _tracemalloc_baseline
+
+    if not tracemalloc.is_tracing() or _tracemalloc_baseline is None:
+        tracemalloc.start(25)
+        _tracemalloc_baseline = tracemalloc.take_snapshot()
+        return "tracemalloc started; call again to diff against this snapshot\n"
+
+    snapshot = tracemalloc.take_snapshot()
+    stats = snapshot.compare_to(_tracemalloc_baseline, "lineno")
+    _tracemalloc_baseline = snapshot
+    return "\n".join(str(stat) for stat in stats[:limit]) + "\n"
+
+
+@router.delete("/tracemalloc", response_class=PlainTextResponse)
+async def tracemalloc_stop() -> str:
+    """Stop tracing allocations and drop the baseline snapshot."""
+    global _tracemalloc_baseline
+
+    tracemalloc.stop()
+    _tracemalloc_baseline = None
+    return "tracemalloc stopped\n"
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
 from aiogram.filters import Filter
 
+from app.tenants import tenants
+
 if TYPE_CHECKING:
     from aiogram.types import Message
 
+    from app.database.models.tenant import Tenant
+
 
 class IdFilter(Filter):
     """Restrict a handler to updates coming from a specific chat id."""
@@ -16,3 +20,19 @@ class IdFilter(Filter):
 
     async def __call__(self, message: Message) -> bool:
         return message.chat.id == self.chat_id
+
+
+class TenantFilter(Filter):
+    """Restrict a handler to the source (or archive) channels of the served batches, injecting the batch as `tenant`.
+
+    The chat is routed with one dict lookup in the tenant registry, however many batches are served.
+    """
+
+    def __init__(self, role: Literal["source", "archive"]) -> None:
+        self.role = role
+
+    async def __call__(self, message: Message) -> bool | dict[str, Tenant]:
+        lookup = tenants.by_source if self.role == "source" else tenants.by_archive
+        if tenant := lookup(message.chat.id):
+            return {"tenant": tenant}
+        return False
@@ -4,30 +4,47 @@ import logging
 import re
 from typing import TYPE_CHECKING
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.exceptions import TelegramBadRequest
-from beanie.operators import Pull
 
-from app.config import ARCHIVE_CHANNEL
 from app.database.models.course import CAPTION_PATTERN, Course, CourseFile, MessageType
-from app.filters import IdFilter
+from app.database.models.ordinal import Ordinal
+from app.filters import TenantFilter
+from app.jobs.downloads import download_report, downloads
+from app.jobs.integrity import verifier
+from app.jobs.recaption import start_recaption
+from app.pacing import archive_pacer, caption_edits, edit_captions, run_in_background
 
 if TYPE_CHECKING:
     from aiogram.types import Message
 
+    from app.database.models.tenant import Tenant
+
 router = Router(name=__name__)
 
 logger = logging.getLogger(__name__)
 
-router.channel_post.filter(IdFilter(ARCHIVE_CHANNEL))
-router.edited_channel_post.filter(IdFilter(ARCHIVE_CHANNEL))
+router.channel_post.filter(TenantFilter("archive"))
+router.edited_channel_post.filter(TenantFilter("archive"))
 
 DELETE_COMMAND = re.compile(r"^/?del(ete)?$", re.IGNORECASE)
 EDIT_COMMAND = re.compile(r"^/?edit$", re.IGNORECASE)
 
+BULK_DELETE_COMMAND = re.compile(r"^/?del(?:ete)?\s+(?P<selector>.+)$", re.IGNORECASE)
+BULK_RETITLE_COMMAND = re.compile(r"^/?retitle\s+(?P<selector>.+?)\s*=>\s*(?P<value>.+)$", re.IGNORECASE)
+BULK_MOVE_COMMAND = re.compile(r"^/?move\s+(?P<selector>.+?)\s*=>\s*(?P<value>.+)$", re.IGNORECASE)
+RECAPTION_COMMAND = re.compile(r"^/?recaption(?:\s+(?P<selector>.+))?$", re.IGNORECASE)
+VERIFY_COMMAND = re.compile(r"^/?verify(?:\s+(?P<mode>pull))?$", re.IGNORECASE)
+STATS_COMMAND = re.compile(r"^/?stats(?:\s+(?P<selector>.+))?$", re.IGNORECASE)
+
+MESSAGE_IDS_PATTERN = re.compile(r"\d+(?:\s*-\s*\d+)?(?:\s*,\s*\d+(?:\s*-\s*\d+)?)*")
+HASHTAG_PATTERN = re.compile(r"\s*#\S+")
+
+MAX_BULK_MESSAGE_IDS = 1000
+
 
 @router.channel_post(F.content_type.in_(MessageType))
-async def handle_archive_media(message: Message, media_events: list[Message]) -> None:
+async def handle_archive_media(message: Message, media_events: list[Message], tenant: Tenant) -> None:
     """Handle new media posts with caption."""
     logger.info("Handling new media post")
 
@@ -35,7 +52,7 @@ async def handle_archive_media(message: Message, media_events: list[Message]) ->
 
     for name, files in course_files.items():
         caption = course_captions[name]
-        if course := await Course.get_course(name, caption):
+        if course := await Course.get_course(name, caption, tenant):
             await course.upsert_files(files)
 
 
@@ -45,15 +62,13 @@ async def handle_archive_media(message: Message, media_events: list[Message]) ->
     F.reply_to_message.as_("replied"),
     F.text.regexp(DELETE_COMMAND),
 )
-async def on_del_archive(message: Message, replied: Message) -> None:
+async def on_del_archive(message: Message, replied: Message, tenant: Tenant) -> None:
     """Remove an archived file from its course when a delete command is sent in reply to it."""
     logger.info("Delete command (%s) received", message.text)
 
-    if course := await Course.find_one(
-        Course.files.archiveTelegramMessageId == replied.message_id  # pyright: ignore[reportAttributeAccessIssue]
-    ):
-        await course.update(Pull({"files": {"archiveTelegramMessageId": replied.message_id}}))
-        logger.info("Deleted file (message_id=%d) from course %r", replied.message_id, course.courseName)
+    if selection := await Course.select_files(tenant.archiveChatId, [replied.message_id]):
+        await Course.bulk_delete_files(selection)
+        logger.info("Deleted file (message_id=%d) from course %r", replied.message_id, selection[0][0].courseName)
     else:
         logger.warning("No course found containing file (message_id=%d)", replied.message_id)
 
@@ -70,12 +85,13 @@ async def on_edit_archive_reply(
     message: Message,
     match: re.Match[str],
     replied: Message,
+    tenant: Tenant,
 ) -> None:
     """Handle edit command sent as a reply."""
     logger.info("Edit command (%s) received", message.text)
 
     course_name: str = match.group("course")
-    if course := await Course.get_course(course_name, match.string):
+    if course := await Course.get_course(course_name, match.string, tenant):
         file = await CourseFile.from_message(replied, match)
         try:
             await course.upsert_files([file])
@@ -103,15 +119,163 @@ async def on_edit_archive_reply(
     F.content_type.in_(MessageType),
     F.caption.regexp(CAPTION_PATTERN).as_("match"),
 )
-async def on_edit_archive_direct(message: Message, match: re.Match[str]) -> None:
-    """Handle direct media edit in channel."""
+async def on_edit_archive_direct(message: Message, match: re.Match[str], tenant: Tenant) -> None:
+    """Handle direct media edit in channel, coalescing quick successive edits of the same post into one."""
     logger.info("Direct edit received")
+    caption_edits.submit((message.chat.id, message.message_id), lambda: _apply_direct_edit(message, match, tenant))
+
 
+async def _apply_direct_edit(message: Message, match: re.Match[str], tenant: Tenant) -> None:
+    """Store the latest direct edit of an archived post."""
     course_name: str = match.group("course")
-    if course := await Course.get_course(course_name, match.string):
+    if course := await Course.get_course(course_name, match.string, tenant):
         file = await CourseFile.from_message(message, match)
         await course.upsert_files([file])
         logger.info(
             "Updated course with message_id %d (direct edit)",
             file.archiveTelegramMessageId,
         )
+
+
+def _parse_message_ids(selector: str) -> list[int]:
+    """Expand a selector like `120-125, 130` into a list of message ids."""
+    ids: list[int] = []
+    for part in selector.split(","):
+        start, _, end = part.partition("-")
+        first, last = int(start), int(end or start)
+        if len(ids) + abs(last - first) + 1 > MAX_BULK_MESSAGE_IDS:  # checked before expanding huge ranges
+            raise ValueError(f"Selection is limited to {MAX_BULK_MESSAGE_IDS} message ids.")
+        ids.extend(range(min(first, last), max(first, last) + 1))
+    return ids
+
+
+async def _resolve_selection(selector: str, tenant: Tenant) -> list[tuple[Course, list[CourseFile]]]:
+    """Resolve a bulk-command selector into the files of `tenant` it targets, grouped by course.
+
+    A selector is either a list of archive message ids / ranges (`120-140, 150`)
+    or a `Course Name | Title` pair, optionally tagged with `#الفصل_<name>`.
+    """
+    if MESSAGE_IDS_PATTERN.fullmatch(selector):
+        try:
+            return await Course.select_files(tenant.archiveChatId, _parse_message_ids(selector))
+        except ValueError as e:
+            logger.warning("Rejected bulk selector %r: %s", selector, e)
+            return []
+
+    if (match := CAPTION_PATTERN.search(selector)) and (
+        course := await Course.get_course(match.group("course"), selector, tenant)
+    ):
+        return [(course, await course.find_files_by_title(HASHTAG_PATTERN.sub("", match.group("title")).strip()))]
+
+    return []
+
+
+async def _apply_captions(bot: Bot, chat_id: int, captions: dict[int, str]) -> None:
+    """Rewrite captions of archive `chat_id` through the shared pacer and log the outcome."""
+    edited, failed = await edit_captions(bot, chat_id, captions, archive_pacer)
+    logger.info("Bulk caption update finished: %d edited, %d failed", edited, failed)
+
+
+@router.channel_post(~F.reply_to_message, F.text.regexp(BULK_DELETE_COMMAND).as_("command"))
+async def on_bulk_delete(message: Message, command: re.Match[str], tenant: Tenant) -> None:
+    """Remove every selected file from the catalog in one bulk write."""
+    logger.info("Bulk delete command (%s) received", message.text)
+
+    selection = await _resolve_selection(command.group("selector").strip(), tenant)
+    count = sum(len(files) for _, files in selection)
+    if count:
+        await Course.bulk_delete_files(selection)
+        logger.info("Bulk deleted %d file(s) from %d course(s)", count, len(selection))
+    else:
+        logger.warning("Bulk delete matched no files: %r", command.group("selector"))
+
+    await message.delete()
+
+
+@router.channel_post(~F.reply_to_message, F.text.regexp(BULK_RETITLE_COMMAND).as_("command"))
+async def on_bulk_retitle(message: Message, bot: Bot, command: re.Match[str], tenant: Tenant) -> None:
+    """Rename every selected file in one bulk write, then re-caption the archive posts."""
+    logger.info("Bulk retitle command (%s) received", message.text)
+
+    title = command.group("value").strip()
+    selection = await _resolve_selection(command.group("selector").strip(), tenant)
+    captions = {f.archiveTelegramMessageId: course.formatted_info(title) for course, files in selection for f in files}
+    if captions:
+        await Course.bulk_retitle_files(selection, title)
+        logger.info("Bulk retitled %d file(s) to %r", len(captions), title)
+        run_in_background(_apply_captions(bot, tenant.archiveChatId, captions), name="bulk-retitle-captions")
+    else:
+        logger.warning("Bulk retitle matched no files: %r", command.group("selector"))
+
+    await message.delete()
+
+
+@router.channel_post(~F.reply_to_message, F.text.regexp(BULK_MOVE_COMMAND).as_("command"))
+async def on_bulk_move(message: Message, bot: Bot, command: re.Match[str], tenant: Tenant) -> None:
+    """Move every selected file to another course of the batch in one bulk write, then re-caption the archive posts."""
+    logger.info("Bulk move command (%s) received", message.text)
+
+    value = command.group("value").strip()
+    if not (target := await Course.get_course(HASHTAG_PATTERN.sub("", value).strip(), value, tenant)):
+        logger.warning("Bulk move target course not found: %r", value)
+        await message.delete()
+        return
+
+    selection = await _resolve_selection(command.group("selector").strip(), tenant)
+    captions = {f.archiveTelegramMessageId: target.formatted_info(f.title) for _, files in selection for f in files}
+    if captions:
+        await Course.bulk_move_files(selection, target)
+        logger.info("Bulk moved %d file(s) to course %r", len(captions), target.courseName)
+        run_in_background(_apply_captions(bot, tenant.archiveChatId, captions), name="bulk-move-captions")
+    else:
+        logger.warning("Bulk move matched no files: %r", command.group("selector"))
+
+    await message.delete()
+
+
+@router.channel_post(~F.reply_to_message, F.text.regexp(RECAPTION_COMMAND).as_("command"))
+async def on_recaption(message: Message, bot: Bot, command: re.Match[str], tenant: Tenant) -> None:
+    """Queue a background job that rewrites stale archive captions of the batch.
+
+    Without a selector (or with `all`) every archive post is re-captioned; a bare
+    `#الفصل_<name>` selects one semester, and a course name selects one course.
+    """
+    logger.info("Recaption command (%s) received", message.text)
+
+    selector = (command.group("selector") or "").strip()
+    course_name = HASHTAG_PATTERN.sub("", selector).strip()
+    namespace = tenant.namespace
+
+    if not selector or selector.lower() == "all":
+        await start_recaption(bot, namespace=namespace, description=f"{namespace}: all")
+    elif not course_name:
+        semester = Ordinal.get_semester(selector, tenant.startYear)
+        await start_recaption(bot, semesters=[semester], namespace=namespace, description=f"{namespace}: {selector}")
+    elif course := await Course.get_course(course_name, selector, tenant):
+        await start_recaption(bot, course_ids=[course.id], description=course.courseName)  # pyright: ignore[reportArgumentType]
+    else:
+        logger.warning("Recaption target course not found: %r", selector)
+
+    await message.delete()
+
+
+@router.channel_post(~F.reply_to_message, F.text.regexp(STATS_COMMAND).as_("command"))
+async def on_stats(message: Message, command: re.Match[str], tenant: Tenant) -> None:
+    """Post the batch's download statistics; a `#الفصل_<name>` selector limits the top titles to one semester."""
+    logger.info("Stats command (%s) received", message.text)
+
+    selector = (command.group("selector") or "").strip()
+    semester = Ordinal.get_semester(selector, tenant.startYear) if selector else None
+    await downloads.flush()
+    await message.answer(await download_report(tenant.namespace, semester))
+    await message.delete()
+
+
+@router.channel_post(~F.reply_to_message, F.text.regexp(VERIFY_COMMAND).as_("command"))
+async def on_verify(message: Message, bot: Bot, command: re.Match[str], tenant: Tenant) -> None:
+    """Check every file archived in this channel in the background; `pull` deletes the missing ones instead."""
+    logger.info("Verify command (%s) received", message.text)
+
+    pull = bool(command.group("mode"))
+    run_in_background(verifier.verify_all(bot, tenant.archiveChatId, pull=pull), name="archive-verify")
+    await message.delete()
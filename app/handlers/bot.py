@@ -5,10 +5,15 @@ from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart
 from aiogram.types import Message, ReplyKeyboardRemove, User
 
+from app.middlewares import ThrottlingMiddleware
 from app.scene import SceneRegistry, register_scene
 
 router = Router(name="bot")
 router.message.filter(F.chat.type == "private")
+
+throttling = ThrottlingMiddleware()
+router.message.outer_middleware(throttling)
+router.callback_query.outer_middleware(throttling)
 registry = SceneRegistry(router)
 
 
@@ -1,31 +1,37 @@
 from __future__ import annotations
 
 import asyncio
+import html
 import logging
 from typing import TYPE_CHECKING
 
 from aiogram import Bot, F, Router
-from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import ReplyParameters
 
-from app.config import ARCHIVE_CHANNEL, CHANNEL_ID
-from app.database.models.course import CAPTION_PATTERN, Course, CourseFile, MessageType
-from app.filters import IdFilter
+from app.config import DUPLICATE_FILE_REPORT
+from app.database.models.course import CAPTION_PATTERN, Course, CourseFile, MessageType, archive_link
+from app.filters import TenantFilter
+from app.metrics import DUPLICATE_FILES
+from app.pacing import caption_edits
 
 if TYPE_CHECKING:
     import re
 
     from aiogram.types import Message, MessageId
 
+    from app.database.models.tenant import Tenant
+
 router = Router(name=__name__)
 
 logger = logging.getLogger(__name__)
 
-router.channel_post.filter(IdFilter(CHANNEL_ID))
-router.edited_channel_post.filter(IdFilter(CHANNEL_ID))
+router.channel_post.filter(TenantFilter("source"))
+router.edited_channel_post.filter(TenantFilter("source"))
 
 
 @router.channel_post(F.content_type.in_(MessageType))
-async def handle_media(message: Message, bot: Bot, media_events: list[Message]) -> None:
+async def handle_media(message: Message, bot: Bot, media_events: list[Message], tenant: Tenant) -> None:
     """Handle new media posts with caption."""
     logger.info("Handling new media post")
 
@@ -33,11 +39,11 @@ async def handle_media(message: Message, bot: Bot, media_events: list[Message])
 
     for name, files in course_files.items():
         caption = course_captions[name]
-        if course := await Course.get_course(name, caption):
+        if course := await Course.get_course(name, caption, tenant):
             copied_files: list[CourseFile] = []
-            for file in files:
+            for file in await _new_files(bot, tenant, course, files):
                 try:
-                    copied = await _copy_to_archive(bot, file, course.formatted_info(file.title))
+                    copied = await _copy_to_archive(bot, tenant, file, course.formatted_info(file.title))
                 except TelegramBadRequest:
                     logger.exception(
                         "Failed to copy message_id %d to archive; skipping file.",
@@ -45,7 +51,7 @@ async def handle_media(message: Message, bot: Bot, media_events: list[Message])
                     )
                     continue
 
-                file.archiveTelegramMessageId = copied.message_id
+                file.chatId, file.archiveTelegramMessageId = tenant.archiveChatId, copied.message_id
                 copied_files.append(file)
 
                 logger.info("Archived new file: message_id %d -> %d.", message.message_id, copied.message_id)
@@ -54,11 +60,55 @@ async def handle_media(message: Message, bot: Bot, media_events: list[Message])
             logger.info("Parsed %d file(s) for course '%s'", len(copied_files), name)
 
 
-async def _copy_to_archive(bot: Bot, file: CourseFile, caption: str) -> MessageId:
-    """Copy a message to the archive channel, retrying once on flood-wait."""
+async def _new_files(bot: Bot, tenant: Tenant, course: Course, files: list[CourseFile]) -> list[CourseFile]:
+    """Return the files of `files` whose content isn't archived under `course` yet, handling the rest as duplicates."""
+    archived = await CourseFile.find_duplicates(course.id, files)
+    seen: set[tuple[str, int]] = set()
+    new_files: list[CourseFile] = []
+    for file in files:
+        if (key := file.content_key) and (original := archived.get(key)):
+            await _on_duplicate(bot, tenant, file, original)
+        elif key and key in seen:
+            DUPLICATE_FILES.inc()
+            logger.info("Skipping message_id %d: same file twice in one post.", file.originalTelegramMessageId)
+        else:
+            if key:
+                seen.add(key)
+            new_files.append(file)
+    return new_files
+
+
+async def _on_duplicate(bot: Bot, tenant: Tenant, file: CourseFile, original: CourseFile) -> None:
+    """Link a reposted file to its archived copy instead of archiving it again, optionally telling the poster."""
+    DUPLICATE_FILES.inc()
+    logger.info(
+        "Linking duplicate message_id %d to archived %d (%r).",
+        file.originalTelegramMessageId,
+        original.archiveTelegramMessageId,
+        original.title,
+    )
+    await original.add_alias(file)
+    if not DUPLICATE_FILE_REPORT:
+        return
+
+    text = f"هذا الملف مؤرشف مسبقاً باسم «{html.escape(original.title)}»:\n"
+    try:
+        await bot.send_message(
+            file.fromChatId,
+            text + archive_link(tenant.archiveChatId, original.archiveTelegramMessageId),
+            reply_parameters=ReplyParameters(
+                message_id=file.originalTelegramMessageId, allow_sending_without_reply=True
+            ),
+        )
+    except TelegramAPIError as e:
+        logger.warning("Could not report duplicate message_id %d: %s", file.originalTelegramMessageId, e)
+
+
+async def _copy_to_archive(bot: Bot, tenant: Tenant, file: CourseFile, caption: str) -> MessageId:
+    """Copy a message to the tenant's archive channel, retrying once on flood-wait."""
     try:
         return await bot.copy_message(
-            ARCHIVE_CHANNEL,
+            tenant.archiveChatId,
             file.fromChatId,
             file.originalTelegramMessageId,
             caption=caption,
@@ -67,7 +117,7 @@ async def _copy_to_archive(bot: Bot, file: CourseFile, caption: str) -> MessageI
         logger.warning("Rate limited; sleeping for %s seconds", e.retry_after)
         await asyncio.sleep(e.retry_after)
         return await bot.copy_message(
-            ARCHIVE_CHANNEL,
+            tenant.archiveChatId,
             file.fromChatId,
             file.originalTelegramMessageId,
             caption=caption,
@@ -78,32 +128,37 @@ async def _copy_to_archive(bot: Bot, file: CourseFile, caption: str) -> MessageI
     F.content_type.in_(MessageType),
     F.caption.regexp(CAPTION_PATTERN).as_("match"),
 )
-async def on_edit(message: Message, bot: Bot, match: re.Match[str]) -> None:
-    """Handle edited media posts."""
+async def on_edit(message: Message, bot: Bot, match: re.Match[str], tenant: Tenant) -> None:
+    """Handle edited media posts, coalescing quick successive edits of the same post into one."""
     logger.info("Editing media post")
+    caption_edits.submit((message.chat.id, message.message_id), lambda: _apply_edit(message, bot, match, tenant))
 
-    course_name: str = match.group("course")
-    if course := await Course.get_course(course_name, match.string):
-        if file := course.find_file_by_original_id(message.message_id):
-            new_title = match.group("title")
-            if file.title == new_title:
-                logger.info("Title unchanged for message_id %d, skipping.", file.originalTelegramMessageId)
-                return
-
-            file.title = new_title
-            await bot.edit_message_caption(
-                chat_id=ARCHIVE_CHANNEL,
-                message_id=file.archiveTelegramMessageId,
-                caption=course.formatted_info(file.title),
-            )
-            await course.save()
-            logger.info("Updated title for message_id %d.", file.originalTelegramMessageId)
-        else:
-            file = await CourseFile.from_message(message, match)
-            copied = await _copy_to_archive(bot, file, course.formatted_info(file.title))
-            file.archiveTelegramMessageId = copied.message_id
-            course.files.append(file)
-            await course.save()
-            logger.info("Archived new file: message_id %d -> %d.", message.message_id, copied.message_id)
-    else:
+
+async def _apply_edit(message: Message, bot: Bot, match: re.Match[str], tenant: Tenant) -> None:
+    """Apply the latest edit of a source post to its archived copy and course."""
+    course_name, title = match.group("course"), match.group("title")
+    if not (course := await Course.get_course(course_name, match.string, tenant)):
         logger.warning("Course not found for name: %s. Ignoring edit.", course_name)
+        return
+
+    if edited := await course.retitle_file_by_original_id(message.chat.id, message.message_id, title):
+        if edited.previousTitle == title:
+            logger.info("Title unchanged for message_id %d, skipping.", message.message_id)
+            return
+
+        await bot.edit_message_caption(
+            chat_id=tenant.archiveChatId,
+            message_id=edited.archiveTelegramMessageId,
+            caption=course.formatted_info(title),
+        )
+        logger.info("Updated title for message_id %d.", message.message_id)
+        return
+
+    # Not archived under this course yet: archive it as a new file, unless its content already is.
+    file = await CourseFile.from_message(message, match, chatId=tenant.archiveChatId)
+    if not await _new_files(bot, tenant, course, [file]):
+        return
+    copied = await _copy_to_archive(bot, tenant, file, course.formatted_info(file.title))
+    file.archiveTelegramMessageId = copied.message_id
+    await course.upsert_files([file])
+    logger.info("Archived new file: message_id %d -> %d.", message.message_id, copied.message_id)
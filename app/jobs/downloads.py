@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Any
+
+from beanie.operators import In
+from pymongo import UpdateMany
+from pymongo.errors import PyMongoError
+
+from app.config import DOWNLOAD_FLUSH_INTERVAL
+from app.database.models.course import Course, CourseFile
+from app.database.models.ordinal import Ordinal
+from app.metrics import QUEUE_DEPTH
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable, Iterable
+
+    from beanie import PydanticObjectId
+    from pymongo.asynchronous.collection import AsyncCollection
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCounter:
+    """Count file downloads in memory and add them to MongoDB in bulk every `interval` seconds.
+
+    A flush is one `bulk_write` of `$inc` updates per collection (files, then
+    courses), with one update per distinct count (and, for files, archive chat)
+    rather than per document.
+    Counts whose write fails are kept and retried on the next flush.
+    """
+
+    def __init__(self, interval: float = DOWNLOAD_FLUSH_INTERVAL) -> None:
+        self.interval = interval
+        self._files: Counter[tuple[int, int]] = Counter()
+        self._courses: Counter[PydanticObjectId | None] = Counter()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._files) + len(self._courses)
+
+    def record(self, course_id: PydanticObjectId | None, archive_chat: int, archive_ids: Iterable[int]) -> None:
+        """Count one download of the files archived in `archive_chat` under `archive_ids`, all of one course."""
+        self._courses[course_id] += 1
+        self._files.update((archive_chat, archive_id) for archive_id in archive_ids)
+
+    async def flush(self) -> None:
+        """Write the counts gathered so far."""
+        async with self._lock:
+            files, self._files = self._files, Counter()
+            courses, self._courses = self._courses, Counter()
+            if not await _increment(CourseFile.get_pymongo_collection(), _file_ops(files), len(files)):
+                self._files.update(files)
+            if not await _increment(Course.get_pymongo_collection(), _course_ops(courses), len(courses)):
+                self._courses.update(courses)
+
+    async def run(self) -> None:
+        """Flush every `interval` seconds, forever."""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+def _file_ops(counts: Counter[tuple[int, int]]) -> list[UpdateMany]:
+    """One `$inc` per (archive chat, count) pair, covering every file downloaded that many times."""
+    ids_by_count: defaultdict[tuple[int, int], list[int]] = defaultdict(list)
+    for (chat_id, archive_id), count in counts.items():
+        ids_by_count[(chat_id, count)].append(archive_id)
+    return [
+        UpdateMany({"chatId": chat_id, "archiveTelegramMessageId": {"$in": ids}}, {"$inc": {"downloads": count}})
+        for (chat_id, count), ids in ids_by_count.items()
+    ]
+
+
+def _course_ops(counts: Counter[Any]) -> list[UpdateMany]:
+    """One `$inc` per distinct count, covering every course downloaded that many times."""
+    ids_by_count: defaultdict[int, list[Hashable]] = defaultdict(list)
+    for course_id, count in counts.items():
+        ids_by_count[count].append(course_id)
+    return [UpdateMany({"_id": {"$in": ids}}, {"$inc": {"downloads": count}}) for count, ids in ids_by_count.items()]
+
+
+async def _increment(collection: AsyncCollection, ops: list[UpdateMany], counted: int) -> bool:
+    """Write the `$inc` updates of `counted` documents' downloads; return False if the write failed."""
+    if not ops:
+        return True
+
+    try:
+        await collection.bulk_write(ops, ordered=False)
+    except PyMongoError:
+        logger.exception("Failed to write %d download count(s) to %s; retrying next flush", counted, collection.name)
+        return False
+    return True
+
+
+async def download_report(namespace: str, semester: int | None = None, limit: int = 10) -> str:
+    """Downloads per semester and the most downloaded titles of a batch (of one semester, when given), for admins."""
+    query: dict[str, Any] = {"namespace": namespace}
+    heading = "<b>الأكثر تنزيلاً</b>"
+    if semester is not None:
+        query["semester"] = semester
+        heading = f"<b>الأكثر تنزيلاً - الفصل {Ordinal.get_name(semester)}</b>"
+    course_ids = await Course.get_pymongo_collection().distinct("_id", query)
+    top = await CourseFile.most_downloaded(course_ids, limit)
+    names = {course.id: course.courseName async for course in Course.find(In(Course.id, [row[0] for row in top]))}
+    by_semester = await Course.downloads_by_semester(namespace)
+
+    lines = ["<b>إحصائيات التنزيل</b>"]
+    lines += [f"الفصل {Ordinal.get_name(number)}: {count}" for number, count in by_semester.items()]
+    lines += ["", heading]
+    lines += [
+        f"{rank}. {html.escape(names.get(course_id, '?'))} | {html.escape(title)}: {count}"
+        for rank, (course_id, title, count) in enumerate(top, 1)
+    ] or ["لا توجد تنزيلات بعد."]
+    return "\n".join(lines)
+
+
+downloads = DownloadCounter()
+"""Shared counter of files sent from the browse menus."""
+QUEUE_DEPTH.set_function(lambda: len(downloads), queue="download_counts")
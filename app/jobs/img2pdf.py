@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import tempfile
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from app.config import (
+    IMG2PDF_MAX_CONCURRENT,
+    IMG2PDF_MAX_IMAGES,
+    IMG2PDF_MAX_PIXELS,
+    IMG2PDF_PREFETCH_CONCURRENCY,
+    IMG2PDF_PREFETCH_NORMALIZE,
+    IMG2PDF_PREFETCH_PER_USER,
+)
+from app.metrics import QUEUE_DEPTH
+from app.pacing import run_in_background
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Coroutine, Iterable
+
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionError(ValueError):
+    """A conversion over the per-job limits; the message is shown to the user."""
+
+
+@dataclass(eq=False)
+class ConversionJob:
+    """One queued image-to-PDF conversion."""
+
+    user_id: int
+    work: Callable[[], Coroutine[Any, Any, object]]
+    """Runs the conversion once the job is admitted to a slot."""
+
+    notify: Callable[[int], Awaitable[object]]
+    """Told the job's queue position whenever it changes (0 once it starts running)."""
+
+    position: int = -1
+    task: asyncio.Task | None = None
+
+
+class ConversionQueue:
+    """Run image-to-PDF conversions with a global concurrency cap, taking turns across users.
+
+    Each user has their own FIFO of waiting jobs and free slots go to users in
+    round-robin order, so one user queueing several conversions can't starve
+    the others. A user runs at most one job at a time, since their jobs share
+    an output path. Jobs over the image-count or total-pixel limits are refused
+    up front by `admit`.
+    """
+
+    def __init__(
+        self,
+        max_running: int = IMG2PDF_MAX_CONCURRENT,
+        max_images: int = IMG2PDF_MAX_IMAGES,
+        max_pixels: int = IMG2PDF_MAX_PIXELS,
+    ) -> None:
+        self.max_running = max_running
+        self.max_images = max_images
+        self.max_pixels = max_pixels
+        self._waiting: OrderedDict[int, deque[ConversionJob]] = OrderedDict()
+        self._running: set[ConversionJob] = set()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(jobs) for jobs in self._waiting.values())
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def admit(self, image_count: int, pixels: int) -> None:
+        """Refuse a job with more than `max_images` images or `max_pixels` pixels in total."""
+        if image_count > self.max_images:
+            raise AdmissionError(f"الحد الأقصى للتحويل {self.max_images} صورة، أرسلت {image_count}.")
+        if pixels > self.max_pixels:
+            raise AdmissionError("الحجم الإجمالي للصور أكبر من المسموح، قلل عدد الصور ثم حاول مجدداً.")
+
+    def submit(self, job: ConversionJob) -> int:
+        """Queue `job` and return its position (0 if it started right away)."""
+        self._waiting.setdefault(job.user_id, deque()).append(job)
+        self._dispatch()
+        return job.position
+
+    def cancel(self, user_id: int) -> int:
+        """Drop every waiting job of `user_id` and cancel the running ones; return how many were stopped."""
+        stopped = len(self._waiting.pop(user_id, ()))
+        for job in list(self._running):
+            if job.user_id == user_id and job.task:
+                job.task.cancel()
+                stopped += 1
+        if stopped:
+            logger.info("Cancelled %d conversion(s) of user %d", stopped, user_id)
+            self._notify_positions()
+        return stopped
+
+    def _dispatch(self) -> None:
+        """Start waiting jobs while slots are free, then tell the rest where they stand."""
+        while len(self._running) < self.max_running:
+            busy = {job.user_id for job in self._running}
+            if (user_id := next((user for user in self._waiting if user not in busy), None)) is None:
+                break
+            jobs = self._waiting[user_id]
+            job = jobs.popleft()
+            if jobs:
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+
+            self._running.add(job)
+            job.position = 0
+            job.task = run_in_background(self._run(job), name=f"img2pdf-{job.user_id}")
+            # A done callback (unlike a `finally`) also fires when the task is cancelled before it starts.
+            job.task.add_done_callback(lambda _, job=job: self._release(job))
+        self._notify_positions()
+
+    async def _run(self, job: ConversionJob) -> None:
+        await job.notify(0)
+        await job.work()
+
+    def _release(self, job: ConversionJob) -> None:
+        """Free the slot of a finished, failed or cancelled job and start the next one."""
+        self._running.discard(job)
+        if job.user_id in self._waiting:
+            # The user just had their turn: their next job waits behind those of users without one.
+            self._waiting.move_to_end(job.user_id)
+        self._dispatch()
+
+    def _order(self) -> list[ConversionJob]:
+        """Waiting jobs in the order they will start: one per user per round.
+
+        Users with a running job come last, as `_dispatch` skips them and
+        `_release` sends them to the back.
+        """
+        busy = {job.user_id for job in self._running}
+        users = sorted(self._waiting, key=lambda user: user in busy)
+        queues = [list(self._waiting[user]) for user in users]
+        return [queue[i] for i in range(max(map(len, queues), default=0)) for queue in queues if i < len(queue)]
+
+    def _notify_positions(self) -> None:
+        for position, job in enumerate(self._order(), 1):
+            if job.position != position:
+                job.position = position
+                run_in_background(job.notify(position), name=f"img2pdf-position-{job.user_id}")
+
+
+conversions = ConversionQueue()
+"""Shared queue for every image-to-PDF conversion."""
+QUEUE_DEPTH.set_function(lambda: conversions.waiting, queue="img2pdf_waiting")
+QUEUE_DEPTH.set_function(lambda: conversions.running, queue="img2pdf_running")
+
+
+@dataclass(eq=False)
+class _Download:
+    """One download of an image, shared by every caller fetching it meanwhile."""
+
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class ImagePrefetcher:
+    """Download img2pdf images in the background as soon as they are sent, so converting mostly assembles pages.
+
+    At most `max_concurrent` downloads run at once overall and each user has
+    at most `per_user` prefetches pending; images beyond that are fetched when
+    the user converts. Concurrent fetches of one image share a single
+    download, written under a temporary name and renamed when complete, so a
+    cancelled download never leaves a truncated image.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_concurrent: int = IMG2PDF_PREFETCH_CONCURRENCY,
+        per_user: int = IMG2PDF_PREFETCH_PER_USER,
+        normalize: bool = IMG2PDF_PREFETCH_NORMALIZE,
+    ) -> None:
+        self.directory = directory
+        self.per_user = per_user
+        self.normalize = normalize
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._pending: dict[int, dict[str, asyncio.Task]] = {}
+        self._downloads: dict[str, _Download] = {}
+
+    def __len__(self) -> int:
+        return sum(len(tasks) for tasks in self._pending.values())
+
+    def path(self, file_id: str) -> Path:
+        return self.directory / file_id
+
+    def prefetch(self, bot: Bot, user_id: int, file_ids: Iterable[str]) -> None:
+        """Start downloading `file_ids` for `user_id`, within the user's budget."""
+        pending = self._pending.setdefault(user_id, {})
+        for file_id in file_ids:
+            if file_id in pending or self.path(file_id).exists():
+                continue
+            if len(pending) >= self.per_user:
+                break
+            task = run_in_background(self._prefetch(bot, file_id), name=f"img2pdf-prefetch-{user_id}")
+            task.add_done_callback(lambda _, file_id=file_id: pending.pop(file_id, None))
+            pending[file_id] = task
+
+        if not pending:
+            self._pending.pop(user_id, None)
+
+    def cancel(self, user_id: int) -> int:
+        """Cancel every pending prefetch of `user_id`; return how many were cancelled."""
+        tasks = self._pending.pop(user_id, {})
+        for task in tasks.values():
+            task.cancel()
+        return len(tasks)
+
+    async def collect(self, bot: Bot, user_id: int, file_ids: Iterable[str]) -> list[Path]:
+        """Paths of `file_ids`, in order, waiting for their prefetches and fetching whatever is missing."""
+        pending = self._pending.get(user_id, {})
+        paths: list[Path] = []
+        for file_id in file_ids:
+            if task := pending.get(file_id):
+                # Waits without raising, even if the prefetch failed or was cancelled: `fetch` retries it.
+                await asyncio.wait({task})
+            paths.append(await self.fetch(bot, file_id))
+        return paths
+
+    async def fetch(self, bot: Bot, file_id: str) -> Path:
+        """Download `file_id` unless it is already on disk, joining the download in flight if there is one.
+
+        The download is cancelled only once every caller waiting for it is.
+        """
+        path = self.path(file_id)
+        if path.exists():
+            return path
+
+        if (download := self._downloads.get(file_id)) is None:
+            download = self._downloads[file_id] = _Download(asyncio.create_task(self._download(bot, file_id)))
+            download.task.add_done_callback(lambda _: self._downloads.pop(file_id, None))
+        download.waiters += 1
+        try:
+            await asyncio.shield(download.task)
+        except asyncio.CancelledError:
+            if download.waiters == 1:
+                download.task.cancel()
+            raise
+        finally:
+            download.waiters -= 1
+        return path
+
+    async def _download(self, bot: Bot, file_id: str) -> None:
+        path = self.path(file_id)
+        async with self._semaphore:
+            if path.exists():
+                return
+            # Unique, so a normalize thread outliving a cancelled download can't clobber the next one's file.
+            part = path.with_name(f"{file_id}.{uuid.uuid4().hex}.part")
+            try:
+                await bot.download(file_id, part)
+                if self.normalize:
+                    await asyncio.to_thread(normalize_image, part)
+                part.replace(path)
+            finally:
+                part.unlink(missing_ok=True)
+
+    async def _prefetch(self, bot: Bot, file_id: str) -> None:
+        try:
+            await self.fetch(bot, file_id)
+        except Exception as e:  # noqa: BLE001 - the conversion fetches it again
+            logger.warning("Prefetching image %s failed: %s", file_id, e)
+
+
+def normalize_image(path: Path) -> None:
+    """Re-save the image at `path` as an RGB JPEG, so conversion doesn't have to convert it."""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        if image.mode == "RGB" and image.format == "JPEG":
+            return
+        rgb = image.convert("RGB")
+    rgb.save(path, format="JPEG", quality=90)
+
+
+prefetcher = ImagePrefetcher(Path(tempfile.gettempdir()))
+"""Shared prefetcher for images sent to the img2pdf scene."""
+QUEUE_DEPTH.set_function(lambda: len(prefetcher), queue="img2pdf_prefetch")
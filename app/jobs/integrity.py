@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from aiogram.exceptions import TelegramBadRequest
+
+from app.config import ARCHIVE_VERIFY_CHAT, ARCHIVE_VERIFY_INTERVAL
+from app.database.models.course import Course, CourseFile
+from app.pacing import Pacer, run_in_background
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+COPY_BATCH = 100
+"""Most messages one copyMessages call accepts."""
+
+LOG_EVERY = 10
+"""Log the verifier's progress after this many batches."""
+
+
+def _is_missing(error: TelegramBadRequest) -> bool:
+    """Whether a failed copy means an archive post no longer exists (rather than e.g. an unreachable chat)."""
+    text = error.message.lower()
+    return ("message" in text and "not found" in text) or "message_id_invalid" in text
+
+
+async def _isolate(
+    ids: list[int], copy: Callable[[list[int]], Awaitable[int]], *, exact: bool
+) -> tuple[int, list[int]]:
+    """Copy `ids`, splitting the batch in halves whenever it fails, until the posts that can't be copied are isolated.
+
+    `copy` returns how many posts it copied. A batch fails when the copy raises
+    a "not found" error or, if `exact` is set, copies fewer posts than asked.
+
+    Returns:
+        A tuple of (copied, missing archive ids).
+    """
+    try:
+        copied = await copy(ids)
+    except TelegramBadRequest as e:
+        if not _is_missing(e):
+            raise
+        copied = None
+
+    if copied is not None and (copied == len(ids) or not exact):
+        return copied, []
+    if len(ids) == 1:
+        return 0, ids
+
+    middle = len(ids) // 2
+    left_copied, left_missing = await _isolate(ids[:middle], copy, exact=exact)
+    right_copied, right_missing = await _isolate(ids[middle:], copy, exact=exact)
+    return left_copied + right_copied, left_missing + right_missing
+
+
+class ArchiveVerifier:
+    """Find files whose archive posts were deleted by hand, and mark them missing (or pull them).
+
+    The Bot API can't read a channel post directly, so posts are checked by
+    copying them, a batch at a time, to `chat_id` and deleting the copies right
+    away; a batch that comes up short is bisected down to the missing posts.
+    Every call goes through a pacer of `interval` seconds.
+    """
+
+    def __init__(self, chat_id: int | None = ARCHIVE_VERIFY_CHAT, interval: float = ARCHIVE_VERIFY_INTERVAL) -> None:
+        self.chat_id = chat_id
+        self._pacer = Pacer(interval)
+        self._lock = asyncio.Lock()
+
+    async def probe(self, bot: Bot, archive_chat: int, archive_ids: list[int]) -> list[int]:
+        """Return the ids among `archive_ids` whose posts in `archive_chat` no longer exist."""
+        chat_id = self.chat_id
+        if not chat_id:
+            return []
+
+        async def copy(ids: list[int]) -> int:
+            copies = await self._pacer.call(
+                lambda: bot.copy_messages(chat_id, archive_chat, ids, disable_notification=True, remove_caption=True)
+            )
+            if copies:
+                message_ids = [sent.message_id for sent in copies]
+                await self._pacer.call(lambda: bot.delete_messages(chat_id, message_ids))
+            return len(copies)
+
+        _, missing = await _isolate(archive_ids, copy, exact=True)
+        return missing
+
+    async def check(self, bot: Bot, archive_chat: int, archive_ids: list[int], *, pull: bool = False) -> int:
+        """Probe `archive_ids` of `archive_chat` and drop the missing ones; return how many were dropped."""
+        if not (missing := await self.probe(bot, archive_chat, archive_ids)):
+            return 0
+
+        dropped = await Course.drop_missing_files(archive_chat, missing, pull=pull)
+        logger.warning("Archive posts %s are gone; %s %d file(s)", missing, "pulled" if pull else "marked", dropped)
+        return dropped
+
+    def suspect(self, bot: Bot, archive_chat: int, archive_ids: list[int]) -> None:
+        """Check `archive_ids` in the background, e.g. after a delivery sent fewer posts than asked."""
+        if self.chat_id:
+            run_in_background(self.check(bot, archive_chat, archive_ids), name="archive-verify-suspects")
+
+    async def verify_all(self, bot: Bot, archive_chat: int, *, pull: bool = False) -> None:
+        """Walk every file of `archive_chat` in archive order, `COPY_BATCH` posts per probe, dropping the missing ones."""
+        if not self.chat_id:
+            logger.warning("ARCHIVE_VERIFY_CHAT is not set; archive verification is disabled")
+            return
+        if self._lock.locked():
+            logger.warning("Archive verification is already running")
+            return
+
+        async with self._lock:
+            collection = CourseFile.get_pymongo_collection()
+            started, last_id, batches, checked, dropped = time.monotonic(), 0, 0, 0, 0
+            logger.info(
+                "Archive verification of %d started (%s missing files)", archive_chat, "pulling" if pull else "marking"
+            )
+            while True:
+                # Keyset pagination, so no cursor stays open while the probes are paced.
+                query = {"chatId": archive_chat, "archiveTelegramMessageId": {"$gt": last_id}, "missingSince": None}
+                documents = collection.find(query, {"archiveTelegramMessageId": 1}).sort("archiveTelegramMessageId")
+                if not (ids := [d["archiveTelegramMessageId"] for d in await documents.limit(COPY_BATCH).to_list()]):
+                    break
+
+                dropped += await self.check(bot, archive_chat, ids, pull=pull)
+                last_id, batches, checked = ids[-1], batches + 1, checked + len(ids)
+                if batches % LOG_EVERY == 0:
+                    rate = checked / max(time.monotonic() - started, 1e-9)
+                    logger.info("Archive verification: %d checked, %d dropped (%.1f posts/s)", checked, dropped, rate)
+
+            logger.info("Archive verification finished: %d checked, %d dropped", checked, dropped)
+
+
+async def deliver(bot: Bot, chat_id: int, archive_chat: int, archive_ids: list[int]) -> int:
+    """Copy posts of `archive_chat` to `chat_id`, isolating the ones that fail so the rest are still delivered.
+
+    Posts found missing along the way are marked; when Telegram silently skips
+    some posts instead, the batch is handed to the verifier to find out which.
+
+    Returns:
+        The number of posts delivered.
+    """
+
+    async def copy(ids: list[int]) -> int:
+        return len(await bot.copy_messages(chat_id, archive_chat, ids, remove_caption=True))
+
+    copied, missing = 0, []
+    for start in range(0, len(archive_ids), COPY_BATCH):
+        batch_copied, batch_missing = await _isolate(archive_ids[start : start + COPY_BATCH], copy, exact=False)
+        copied, missing = copied + batch_copied, missing + batch_missing
+
+    if missing:
+        dropped = await Course.drop_missing_files(archive_chat, missing)
+        logger.warning("Archive posts %s are gone; marked %d file(s)", missing, dropped)
+    elif copied < len(archive_ids):
+        verifier.suspect(bot, archive_chat, archive_ids)
+    return copied
+
+
+verifier = ArchiveVerifier()
+"""Shared verifier of the archive channels' posts."""
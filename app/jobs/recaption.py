@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, Any
+
+from beanie import PydanticObjectId  # noqa: TC002
+from beanie.operators import In
+from pydantic import BaseModel, Field
+
+from app.config import COURSE_FILES_DUAL_READ, TENANT_NAMESPACE
+from app.database.models.course import Course, CourseFile
+from app.database.models.jobs import JobStatus, RecaptionJob
+from app.pacing import archive_pacer, edit_caption, run_in_background
+from app.tenants import tenants
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_EVERY = 20
+"""Persist progress (and log throughput) after this many processed files."""
+
+_worker_lock = asyncio.Lock()
+
+
+class CourseId(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+
+
+class FileCaption(BaseModel):
+    archiveTelegramMessageId: int
+    title: str
+
+
+class CaptionSource(BaseModel):
+    """Projection of just what's needed to rebuild a course's archive captions."""
+
+    courseName: str
+    tutorName: str
+    semester: int
+    namespace: str = TENANT_NAMESPACE
+
+
+async def count_files(query: dict[str, Any]) -> int:
+    """Count the files of every course matching `query`."""
+    course_ids = [c.id async for c in Course.find(query, projection_model=CourseId)]
+    return await CourseFile.find(In(CourseFile.courseId, course_ids)).count()
+
+
+async def start_recaption(
+    bot: Bot,
+    *,
+    course_ids: Iterable[PydanticObjectId] = (),
+    semesters: Iterable[int] = (),
+    namespace: str | None = None,
+    description: str = "",
+) -> RecaptionJob:
+    """Create a re-captioning job for the selected courses (of one batch, when given) and run it in the background."""
+    job = RecaptionJob(
+        courseIds=list(course_ids), semesters=list(semesters), namespace=namespace, description=description
+    )
+    if COURSE_FILES_DUAL_READ:
+        await Course.migrate_embedded_files(job.course_query())
+    job.total = await count_files(job.course_query())
+    await job.insert()
+
+    logger.info("Queued recaption job %s (%s): %d file(s)", job.id, description or "all", job.total)
+    run_in_background(run_recaption(bot, job), name=f"recaption-{job.id}")
+    return job
+
+
+async def resume_recaption_jobs(bot: Bot) -> None:
+    """Resume every job left pending or running by a previous process."""
+    jobs = await RecaptionJob.find(In(RecaptionJob.status, [JobStatus.PENDING, JobStatus.RUNNING])).to_list()
+    for job in sorted(jobs, key=lambda j: j.createdAt):
+        logger.info("Resuming recaption job %s at %d/%d", job.id, job.processed, job.total)
+        await run_recaption(bot, job)
+
+
+async def run_recaption(bot: Bot, job: RecaptionJob) -> None:
+    """Re-caption every affected archive post, checkpointing progress as it goes.
+
+    Jobs run one at a time, since they all share the archive channel's pacer.
+    """
+    async with _worker_lock:
+        job.status = JobStatus.RUNNING
+        job.startedAt = job.startedAt or datetime.now(UTC)
+        await job.save()
+
+        started, processed_at_start = time.monotonic(), job.processed
+        try:
+            if COURSE_FILES_DUAL_READ:  # a job queued before the migration may still target embedded files
+                await Course.migrate_embedded_files(job.course_query())
+
+            # Fetch ids up front and each course on its own, so no cursor is held open while pacing.
+            course_ids = [c.id async for c in Course.find(job.course_query(), projection_model=CourseId).sort("_id")]
+            for course_id in course_ids:
+                course = await Course.find_one({"_id": course_id}, projection_model=CaptionSource)
+                if not course:
+                    continue
+
+                # Message ids only mean something in their own batch's archive, so never fall back to another one.
+                if not (tenant := tenants.by_namespace(course.namespace)):
+                    logger.warning(
+                        "Recaption job %s: skipping course %s of unserved batch %r", job.id, course_id, course.namespace
+                    )
+                    continue
+
+                archive_chat = tenant.archiveChatId
+                if course_id != job.lastCourseId:
+                    job.lastCourseId, job.lastMessageId = course_id, 0
+
+                files = CourseFile.find(
+                    CourseFile.courseId == course_id,
+                    CourseFile.archiveTelegramMessageId > job.lastMessageId,
+                    projection_model=FileCaption,
+                ).sort(+CourseFile.archiveTelegramMessageId)
+                for file in await files.to_list():
+                    caption = Course.format_caption(course.courseName, course.tutorName, course.semester, file.title)
+                    if await edit_caption(bot, archive_chat, file.archiveTelegramMessageId, caption, archive_pacer):
+                        job.edited += 1
+                    else:
+                        job.failed += 1
+                    job.lastMessageId = file.archiveTelegramMessageId
+
+                    if job.processed % CHECKPOINT_EVERY == 0:
+                        await job.save()
+                        logger.info("Recaption job %s: %s", job.id, _progress(job, started, processed_at_start))
+
+            job.status = JobStatus.DONE
+            job.finishedAt = datetime.now(UTC)
+        except Exception:
+            job.status = JobStatus.FAILED
+            raise
+        finally:
+            await job.save()
+
+        logger.info("Recaption job %s finished: %s", job.id, _progress(job, started, processed_at_start))
+
+
+def _progress(job: RecaptionJob, started: float, processed_at_start: int) -> str:
+    """Describe the job's progress with this run's throughput and the resulting ETA."""
+    elapsed = time.monotonic() - started
+    rate = (job.processed - processed_at_start) / elapsed if elapsed > 0 else 0.0
+    remaining = max(job.total - job.processed, 0)
+    eta = f"{int(remaining / rate // 60)}m{int(remaining / rate % 60):02d}s" if rate > 0 else "?"
+    return f"{job.processed}/{job.total} ({job.failed} failed, {rate:.2f} edits/s, ETA {eta})"
@@ -1,40 +1,131 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import copy
 import html
+import json
 import logging
+import queue
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from logging.handlers import QueueHandler, QueueListener
 from typing import TYPE_CHECKING
 
-from app.config import LOG_CHANNEL_ID
+from app.config import LOG_CHANNEL_ID, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_SAMPLING
+from app.metrics import LOG_RECORDS_DROPPED, QUEUE_DEPTH
+from app.pacing import Pacer
 
 if TYPE_CHECKING:
     from aiogram import Bot
-    from aiogram.types import Message
 
 _CHUNK_SIZE = 3000
 _TELEGRAM_MESSAGE_LIMIT = 4096
 
+_QUEUE_SIZE = 100
+_DEDUP_WINDOW = 60.0
+_SEND_INTERVAL = 3.0  # Telegram allows ~20 messages/minute per chat
+
+_TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s\n%(message)s"
+
+_handlers: list[TelegramLogHandler] = []
+_listeners: list[tuple[QueueHandler, QueueListener]] = []
+
+
+@dataclass
+class _Seen:
+    """Repeats of one record fingerprint within the current dedup window."""
+
+    started: float
+    record: logging.LogRecord
+    repeats: int = 0
+
 
 class TelegramLogHandler(logging.Handler):
-    """Forward ERROR+ log records to a Telegram chat, split into safe-sized chunks."""
+    """Forward ERROR+ log records to a Telegram chat, split into safe-sized chunks.
 
-    def __init__(self, bot: Bot, chat_id: int | None) -> None:
+    Messages go through a bounded queue drained by a single paced sender task.
+    Records are fingerprinted by exception type and location; repeats within
+    `window` seconds are collapsed into one "×N in last 60s" summary, and when
+    the queue is full new messages are dropped (and the drop count reported).
+    Records logged from other threads are handed to the sender's loop.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int | None,
+        max_queue: int = _QUEUE_SIZE,
+        window: float = _DEDUP_WINDOW,
+        send_interval: float = _SEND_INTERVAL,
+    ) -> None:
         super().__init__(level=logging.ERROR)
         self.bot = bot
         self.chat_id = chat_id
-        self._tasks: set[asyncio.Task[Message]] = set()
+        self.max_queue = max_queue
+        self.window = window
+        self.dropped = 0
+        self._pacer = Pacer(send_interval, max_retries=1)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[str] | None = None
+        self._sender: asyncio.Task[None] | None = None
+        self._seen: dict[tuple[str, ...], _Seen] = {}
 
     def emit(self, record: logging.LogRecord) -> None:
         if not self.chat_id:
             return
 
         try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is not None and running is (self._loop or running):
+            self._handle(record)
+        elif self._loop and not self._loop.is_closed():
+            # The queue and dedup windows belong to the sender's loop; hand the record over thread-safely.
+            with contextlib.suppress(RuntimeError):  # the loop closed in the meantime
+                self._loop.call_soon_threadsafe(self._handle, record)
+
+    def _handle(self, record: logging.LogRecord) -> None:
+        """Dedup `record` and queue its messages; runs on the sender's loop."""
+        if not self._ensure_sender():
+            return
+
+        try:
+            key = self._fingerprint(record)
+            now = time.monotonic()
+            if (seen := self._seen.get(key)) and now - seen.started < self.window:
+                seen.repeats += 1
+                seen.record = record
+                return
+
+            if seen:
+                self._enqueue_summary(seen)
+            self._seen[key] = _Seen(started=now, record=record)
+
             message = self.format(record)
             for text in self._build_messages(record, message):
-                self._schedule_send(text)
+                self._enqueue(text)
         except Exception:  # noqa: BLE001
             self.handleError(record)
 
+    @staticmethod
+    def _fingerprint(record: logging.LogRecord) -> tuple[str, ...]:
+        """Identify "the same error": exception type plus where it was raised, or else where it was logged."""
+        if record.exc_info and (exc := record.exc_info[1]):
+            tb = exc.__traceback__
+            while tb and tb.tb_next:
+                tb = tb.tb_next
+            location = f"{tb.tb_frame.f_code.co_filename}:{tb.tb_lineno}" if tb else ""
+            return type(exc).__qualname__, location, f"{record.pathname}:{record.lineno}"
+        return record.levelname, f"{record.pathname}:{record.lineno}"
+
+    @staticmethod
+    def _header(record: logging.LogRecord, part: str = "") -> str:
+        return f"<b>{record.levelname}</b>{part} · <code>{html.escape(record.name)}</code> · <code>{record.filename}:{record.lineno}</code>\n\n"
+
     def _build_messages(self, record: logging.LogRecord, message: str) -> list[str]:
         """Split raw `message` into chunks and wrap each as a readable Telegram message.
 
@@ -47,7 +138,7 @@ class TelegramLogHandler(logging.Handler):
         texts = []
         for idx, chunk in enumerate(raw_chunks, start=1):
             part = f" <code>{idx}/{total}</code>" if total > 1 else ""
-            header = f"<b>{record.levelname}</b>{part} · <code>{html.escape(record.name)}</code> · <code>{record.filename}:{record.lineno}</code>\n\n"
+            header = self._header(record, part)
 
             code = f'<pre><code class="language-python">{html.escape(chunk)}</code></pre>'
             body = f"<blockquote expandable>{code}</blockquote>"
@@ -55,32 +146,197 @@ class TelegramLogHandler(logging.Handler):
             texts.append((header + body)[:_TELEGRAM_MESSAGE_LIMIT])  # defensive hard cap
         return texts
 
-    def _schedule_send(self, text: str) -> None:
-        """Fire-and-forget the send, keeping a reference so the task isn't GC'd mid-flight."""
+    def _enqueue_summary(self, seen: _Seen) -> None:
+        """Report how many repeats of a fingerprint were collapsed during its window."""
+        if not seen.repeats:
+            return
+
+        last = seen.record.getMessage().splitlines()[0] if seen.record.getMessage() else ""
+        text = f"{self._header(seen.record)}×{seen.repeats} in last {self.window:.0f}s: <code>{html.escape(last[:_CHUNK_SIZE])}</code>"
+        self._enqueue(text[:_TELEGRAM_MESSAGE_LIMIT])
+
+    def _enqueue(self, text: str) -> None:
+        """Queue a message, dropping it (and counting the drop) if the queue is full."""
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _sweep(self, force: bool = False) -> None:
+        """Emit summaries for dedup windows that have closed (or all of them, when `force` is set)."""
+        now = time.monotonic()
+        for key, seen in list(self._seen.items()):
+            if force or now - seen.started >= self.window:
+                self._enqueue_summary(seen)
+                del self._seen[key]
+
+    def _ensure_sender(self) -> bool:
+        """Start the sender task on the running loop; returns False when there's no loop to ship from."""
+        if self._sender and not self._sender.done():
+            return True
+
         try:
             loop = asyncio.get_running_loop()
         except RuntimeError:
-            return
+            return False
+
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._loop = loop
+        self._sender = loop.create_task(self._send_loop(), name="telegram-log-sender")
+        return True
+
+    async def _send_loop(self) -> None:
+        """Drain the queue one paced message at a time, closing dedup windows while idle."""
+        assert self._queue is not None
+        while True:
+            try:
+                text = await asyncio.wait_for(self._queue.get(), timeout=self.window / 4)
+            except TimeoutError:
+                self._sweep()
+                continue
+
+            try:
+                await self._send(text)
+            finally:
+                self._queue.task_done()
 
-        if chat_id := self.chat_id:
-            task = loop.create_task(self.bot.send_message(chat_id, text))
-            self._tasks.add(task)
-            task.add_done_callback(self._on_send_done)
+            if self.dropped and self._queue.empty():
+                dropped, self.dropped = self.dropped, 0
+                await self._send(f"<b>WARNING</b> · log queue full, dropped {dropped} message(s)")
 
-    def _on_send_done(self, task: asyncio.Task[Message]) -> None:
-        self._tasks.discard(task)
-        if not task.cancelled() and (exc := task.exception()):
+    async def _send(self, text: str) -> None:
+        if not (chat_id := self.chat_id):
+            return
+        try:
+            await self._pacer.call(lambda: self.bot.send_message(chat_id, text))
+        except Exception as exc:  # noqa: BLE001
             # Print rather than log, to avoid feeding back into this same handler.
             print(f"[TelegramLogHandler] failed to deliver log message: {exc!r}")
 
+    def qsize(self) -> int:
+        """Number of messages waiting to be sent."""
+        return self._queue.qsize() if self._queue else 0
+
+    async def aclose(self, timeout: float = 5.0) -> None:
+        """Flush pending summaries and queued messages, then stop the sender task."""
+        if self._queue is None or not self._sender:
+            return
+
+        self._sweep(force=True)
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._queue.join(), timeout)
+
+        self._sender.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._sender
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records to a `QueueListener` thread, so formatting and I/O happen off the event loop.
+
+    Only `msg % args` is merged at enqueue time, so the message reflects the
+    arguments as they were when logged. The queue is in-process, so unlike
+    `QueueHandler`'s default the record keeps its `exc_info` and the traceback
+    is formatted on the listener thread. When the queue is full the record is
+    dropped and counted rather than blocking the caller.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records below WARNING from the given loggers (and their children).
+
+    Sampling is deterministic: a logger sampled at 0.25 keeps every fourth record.
+    """
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+        self._credit: dict[str, float] = {}
+
+    def _rate(self, name: str) -> tuple[str, float] | None:
+        """The configured logger that `name` falls under (itself or its closest ancestor), with its rate."""
+        while name:
+            if name in self.rates:
+                return name, self.rates[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not (sampled := self._rate(record.name)):
+            return True
+
+        name, rate = sampled
+        credit = self._credit.get(name, 0.0) + rate
+        keep = credit >= 1.0
+        self._credit[name] = credit - 1.0 if keep else credit
+        return keep
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f"{record.pathname}:{record.lineno}",
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
 
 def setup_logging(bot: Bot) -> None:
-    """Configure root logging and forward ERROR+ records to LOG_CHANNEL_ID."""
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(levelname)s | %(name)s\n%(message)s",
-    )
+    """Configure root logging through a background listener and forward ERROR+ records to LOG_CHANNEL_ID."""
+    console = logging.StreamHandler()
+    console.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(_TEXT_FORMAT))
+
+    records: queue.Queue[logging.LogRecord] = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(records)
+    if LOG_SAMPLING:
+        queue_handler.addFilter(SamplingFilter(LOG_SAMPLING))
+    listener = QueueListener(records, console, respect_handler_level=True)
+    listener.start()
+    _listeners.append((queue_handler, listener))
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
     logging.getLogger("pymongo").setLevel(logging.WARNING)
+    QUEUE_DEPTH.set_function(records.qsize, queue="log_records")
+
     telegram_handler = TelegramLogHandler(bot, LOG_CHANNEL_ID)
-    logging.getLogger("aiogram").addHandler(telegram_handler)
+    # aiogram's loggers propagate to the root logger, so one handler there sees both.
     logging.getLogger().addHandler(telegram_handler)
+    _handlers.append(telegram_handler)
+    QUEUE_DEPTH.set_function(telegram_handler.qsize, queue="telegram_log")
+
+
+async def shutdown_logging() -> None:
+    """Flush and stop every Telegram log handler and console listener installed by `setup_logging`."""
+    while _handlers:
+        handler = _handlers.pop()
+        logging.getLogger().removeHandler(handler)
+        await handler.aclose()
+
+    while _listeners:
+        queue_handler, listener = _listeners.pop()
+        logging.getLogger().removeHandler(queue_handler)
+        # Stopping drains the queue, so write out what's left from a thread rather than on the loop.
+        await asyncio.to_thread(listener.stop)
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Base for a labelled metric rendered in the Prometheus text exposition format."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """A value per label set that can go up and down, or be read from callbacks at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Read this label set's value from `function` whenever metrics are rendered."""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        items += [(key, function()) for key, function in functions]
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed observations (plus sum and count) per label set."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = [(key, (list(counts), totals[0])) for key, (counts, totals) in self._values.items()]
+
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts, strict=True):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of every metric, rendered together for the `/metrics` endpoint."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name!r} is already registered")
+        self._metrics[metric.name] = metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Run `collector` right before every render, to refresh values sampled at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds",
+    "Time spent processing one Telegram update, from dispatch to response.",
+    ["event_type"],
+)
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds",
+    "Time spent in a matched handler, by router and handler.",
+    ["router", "handler"],
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total",
+    "Exceptions raised by handlers, by router, handler and exception type.",
+    ["router", "handler", "error"],
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency as reported by the driver.",
+    ["command", "status"],
+)
+TELEGRAM_API_DURATION = Histogram(
+    "telegram_api_duration_seconds",
+    "Telegram Bot API call latency, by method and outcome.",
+    ["method", "status"],
+)
+TELEGRAM_API_ERRORS = Counter(
+    "telegram_api_errors_total",
+    "Telegram Bot API errors, by method and error type.",
+    ["method", "error"],
+)
+QUEUE_DEPTH = Gauge(
+    "bot_queue_depth",
+    "Items currently waiting in in-process queues.",
+    ["queue"],
+)
+CACHE_HITS = Counter(
+    "bot_cache_hits_total",
+    "Hits of in-process caches.",
+    ["cache"],
+)
+CACHE_MISSES = Counter(
+    "bot_cache_misses_total",
+    "Misses of in-process caches.",
+    ["cache"],
+)
+CACHE_HIT_RATIO = Gauge(
+    "bot_cache_hit_ratio",
+    "Lifetime hit ratio of in-process caches.",
+    ["cache"],
+)
+IMG2PDF_DURATION = Histogram(
+    "img2pdf_job_duration_seconds",
+    "Wall time of an image-to-PDF conversion, by outcome.",
+    ["status"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+IMG2PDF_IMAGES = Histogram(
+    "img2pdf_job_images",
+    "Number of images per image-to-PDF conversion.",
+    buckets=(1, 2, 5, 10, 20, 50, 100),
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up from a timed sleep.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+SLOW_UPDATES = Counter(
+    "bot_slow_updates_total",
+    "Updates slower than the tracing threshold.",
+)
+DUPLICATE_UPDATES = Counter(
+    "bot_duplicate_updates_total",
+    "Updates dropped as repeats, by where the earlier claim was found.",
+    ["source"],
+)
+STARTUP_DURATION = Gauge(
+    "bot_startup_step_seconds",
+    "Duration of each step of the last startup.",
+    ["step"],
+)
+THROTTLED_ACTIONS = Counter(
+    "bot_throttled_actions_total",
+    "User actions dropped by the throttling middleware, by action class and the limit hit.",
+    ["action", "limit"],
+)
+THROTTLE_LIMITS = Gauge(
+    "bot_throttle_limit",
+    "Configured per-user throttling limits, by action class and kind (rate, burst, in_flight).",
+    ["action", "kind"],
+)
+DUPLICATE_FILES = Counter(
+    "bot_duplicate_files_total",
+    "Source posts not archived because the course already holds the same file.",
+)
+LOG_RECORDS_DROPPED = Counter(
+    "bot_log_records_dropped_total",
+    "Log records dropped because the console logging queue was full.",
+)
+
+
+class CacheStats:
+    """Turn `cache_info()` snapshots (which reset on `cache_clear`) into lifetime hit/miss counters."""
+
+    def __init__(self) -> None:
+        self._caches: dict[str, Callable[[], object]] = {}
+        self._seen: dict[str, tuple[int, int]] = {}
+        self._totals: dict[str, tuple[int, int]] = {}
+        REGISTRY.add_collector(self.collect)
+
+    def track(self, name: str, cache_info: Callable[[], object]) -> None:
+        self._caches[name] = cache_info
+        CACHE_HIT_RATIO.set_function(lambda: self.ratio(name), cache=name)
+
+    def collect(self) -> None:
+        """Fold the hits/misses since the last collection into the counters; call before clearing a cache."""
+        for name, cache_info in self._caches.items():
+            info = cache_info()
+            hits, misses = info.hits, info.misses  # pyright: ignore[reportAttributeAccessIssue]
+            seen_hits, seen_misses = self._seen.get(name, (0, 0))
+            new_hits, new_misses = hits - seen_hits, misses - seen_misses
+            if new_hits or new_misses:
+                CACHE_HITS.inc(new_hits, cache=name)
+                CACHE_MISSES.inc(new_misses, cache=name)
+                total_hits, total_misses = self._totals.get(name, (0, 0))
+                self._totals[name] = (total_hits + new_hits, total_misses + new_misses)
+            self._seen[name] = (hits, misses)
+
+    def reset_seen(self) -> None:
+        """Forget the last snapshot after the tracked caches were cleared."""
+        self._seen.clear()
+
+    def ratio(self, name: str) -> float:
+        hits, misses = self._totals.get(name, (0, 0))
+        return hits / (hits + misses) if hits + misses else 0.0
+
+
+CACHE_STATS = CacheStats()
@@ -1,15 +1,58 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
 
 from aiogram import BaseMiddleware
-from aiogram.types import Message, TelegramObject
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.fsm.scene import SceneHandlerWrapper
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update, User
+from aiogram.types.update import UpdateTypeLookupError
+
+from app.config import (
+    THROTTLE_CONVERT_BURST,
+    THROTTLE_CONVERT_RATE,
+    THROTTLE_DOWNLOAD_BURST,
+    THROTTLE_DOWNLOAD_RATE,
+    THROTTLE_MAX_IN_FLIGHT,
+    THROTTLE_NAVIGATION_BURST,
+    THROTTLE_NAVIGATION_RATE,
+    UPDATE_DEDUP_SHARED,
+    UPDATE_DEDUP_WINDOW,
+)
+from app.database.models import ProcessedUpdate
+from app.metrics import (
+    DUPLICATE_UPDATES,
+    HANDLER_DURATION,
+    HANDLER_ERRORS,
+    QUEUE_DEPTH,
+    TELEGRAM_API_DURATION,
+    TELEGRAM_API_ERRORS,
+    THROTTLE_LIMITS,
+    THROTTLED_ACTIONS,
+    UPDATE_DURATION,
+)
+from app.scene.browse import BrowseScene
+from app.scene.models import Action
+from app.tracing import keep_if_slow, trace
 
 if TYPE_CHECKING:
     from collections.abc import Awaitable, Callable
 
-    from aiogram import Dispatcher
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.middlewares.base import NextRequestMiddlewareType
+    from aiogram.dispatcher.event.handler import HandlerObject
+    from aiogram.fsm.context import FSMContext
+    from aiogram.methods import Response, TelegramMethod
+    from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
 
 
 # Source - https://stackoverflow.com/a/77894659
@@ -43,10 +86,302 @@ class MediaMiddleware(BaseMiddleware):
         return await handler(event, data)
 
 
+class DeduplicationMiddleware(BaseMiddleware):
+    """Outer middleware dropping updates that were already processed, before any handler runs.
+
+    Every update is keyed by its `update_id`, and channel posts also by chat and
+    message id (so the same post delivered under another update id is dropped
+    too). Keys live in a bounded in-memory window and, when `shared` is set, are
+    also claimed in MongoDB so concurrent workers don't both handle a retry.
+    """
+
+    def __init__(self, window: int = UPDATE_DEDUP_WINDOW, shared: bool = UPDATE_DEDUP_SHARED) -> None:
+        self.window = window
+        self.shared = shared
+        self._seen: OrderedDict[str, None] = OrderedDict()
+
+    @staticmethod
+    def keys(update: Update) -> list[str]:
+        keys = [f"update:{update.update_id}"]
+        if post := update.channel_post:
+            keys.append(f"post:{post.chat.id}:{post.message_id}")
+        return keys
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, object]], Awaitable[object]],
+        event: TelegramObject,
+        data: dict[str, object],
+    ) -> object:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        keys = self.keys(event)
+        if any(key in self._seen for key in keys):
+            DUPLICATE_UPDATES.inc(source="memory")
+            logger.info("Dropping repeated update %d", event.update_id)
+            return None
+        self._remember(keys)
+
+        if self.shared and not await self._claim(keys):
+            DUPLICATE_UPDATES.inc(source="store")
+            logger.info("Dropping update %d already claimed by another worker", event.update_id)
+            return None
+
+        return await handler(event, data)
+
+    def _remember(self, keys: list[str]) -> None:
+        for key in keys:
+            self._seen[key] = None
+        while len(self._seen) > self.window:
+            self._seen.popitem(last=False)
+
+    @staticmethod
+    async def _claim(keys: list[str]) -> bool:
+        """Claim the keys in the shared store, failing open when it is unavailable."""
+        try:
+            return await ProcessedUpdate.claim(keys)
+        except Exception:
+            logger.warning("Couldn't claim update keys %s; processing anyway", keys, exc_info=True)
+            return True
+
+
+@dataclass
+class TokenBucket:
+    """Allow `burst` actions at once, refilled at `rate` actions per second."""
+
+    rate: float
+    burst: int
+    tokens: float = field(init=False)
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self) -> None:
+        self.tokens = self.burst
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer middleware limiting how fast and how much at once each user can act in private chats.
+
+    Actions are classed as `navigation`, `download` (picking a file in the
+    browse scene) or `convert` (starting an img2pdf conversion); each class has
+    its own token bucket per user, and a user's updates are also capped by
+    `max_in_flight` (an album counts once, as its first item). Dropped actions get one short notice per `notice_interval`
+    and never reach the handlers, so they cost no database or Bot API calls.
+    """
+
+    NOTICE = "الرجاء الانتظار قليلاً قبل المحاولة مرة أخرى."
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, int]] | None = None,
+        max_in_flight: int = THROTTLE_MAX_IN_FLIGHT,
+        notice_interval: float = 10.0,
+        max_users: int = 10_000,
+    ) -> None:
+        self.limits = limits or {
+            "navigation": (THROTTLE_NAVIGATION_RATE, THROTTLE_NAVIGATION_BURST),
+            "download": (THROTTLE_DOWNLOAD_RATE, THROTTLE_DOWNLOAD_BURST),
+            "convert": (THROTTLE_CONVERT_RATE, THROTTLE_CONVERT_BURST),
+        }
+        self.max_in_flight = max_in_flight
+        self.notice_interval = notice_interval
+        self.max_users = max_users
+        self._buckets: OrderedDict[tuple[int, str], TokenBucket] = OrderedDict()
+        self._in_flight: dict[int, int] = {}
+        self._noticed: dict[int, float] = {}
+        self._albums: OrderedDict[str, None] = OrderedDict()
+
+        for action, (rate, burst) in self.limits.items():
+            THROTTLE_LIMITS.set(rate, action=action, kind="rate")
+            THROTTLE_LIMITS.set(burst, action=action, kind="burst")
+        THROTTLE_LIMITS.set(max_in_flight, action="all", kind="in_flight")
+
+    @staticmethod
+    async def classify(event: TelegramObject, data: dict[str, Any]) -> str:
+        """Class of the action `event` triggers, judged from the event and the user's scene state."""
+        if isinstance(event, CallbackQuery):
+            return "convert" if event.data == Action.convert else "navigation"
+
+        if data.get("raw_state") == BrowseScene.__scene_config__.state and isinstance(event, Message):
+            state: FSMContext = data["state"]  # pyright: ignore[reportAssignmentType]
+            answers = await state.get_value("answers", {})
+            if len(answers) == len(BrowseScene.STEPS) - 1 and event.text not in BrowseScene.NAVIGATION_ACTIONS:
+                return "download"
+        return "navigation"
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[object]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> object:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        if not isinstance(user, User) or (chat is not None and chat.type != "private") or self._in_album(event):
+            return await handler(event, data)
+
+        action = await self.classify(event, data)
+        if self._in_flight.get(user.id, 0) >= self.max_in_flight:
+            return await self._reject(event, user.id, action, "in_flight")
+        if not self._bucket(user.id, action).take(time.monotonic()):
+            return await self._reject(event, user.id, action, "rate")
+
+        self._in_flight[user.id] = self._in_flight.get(user.id, 0) + 1
+        try:
+            return await handler(event, data)
+        finally:
+            if (count := self._in_flight.pop(user.id) - 1) > 0:
+                self._in_flight[user.id] = count
+
+    def _in_album(self, event: TelegramObject) -> bool:
+        """Whether `event` is a later item of an album, which is handled (and limited) with its first item."""
+        if not isinstance(event, Message) or not (group := event.media_group_id):
+            return False
+        if group in self._albums:
+            return True
+        self._albums[group] = None
+        while len(self._albums) > self.max_users:
+            self._albums.popitem(last=False)
+        return False
+
+    def _bucket(self, user_id: int, action: str) -> TokenBucket:
+        key = (user_id, action)
+        if bucket := self._buckets.get(key):
+            self._buckets.move_to_end(key)
+            return bucket
+
+        rate, burst = self.limits[action]
+        bucket = self._buckets[key] = TokenBucket(rate, burst)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    async def _reject(self, event: TelegramObject, user_id: int, action: str, limit: str) -> None:
+        THROTTLED_ACTIONS.inc(action=action, limit=limit)
+        logger.info("Throttled %s action of user %d (%s limit)", action, user_id, limit)
+
+        now = time.monotonic()
+        if now - self._noticed.get(user_id, -self.notice_interval) < self.notice_interval:
+            return
+        self._noticed[user_id] = now
+        if len(self._noticed) > self.max_users:
+            self._noticed = {uid: t for uid, t in self._noticed.items() if now - t < self.notice_interval}
+
+        with contextlib.suppress(TelegramAPIError):
+            if isinstance(event, (CallbackQuery, Message)):
+                await event.answer(self.NOTICE)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer middleware timing each update end to end and recording it as a root trace span."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, object]], Awaitable[object]],
+        event: TelegramObject,
+        data: dict[str, object],
+    ) -> object:
+        event_type, update_id = type(event).__name__, None
+        if isinstance(event, Update):
+            update_id = event.update_id
+            with contextlib.suppress(UpdateTypeLookupError):
+                event_type = event.event_type
+        with trace("update", event_type=event_type, update_id=update_id) as root:
+            try:
+                return await handler(event, data)
+            finally:
+                root.finish()
+                UPDATE_DURATION.observe(root.duration or 0.0, event_type=event_type)
+                keep_if_slow(root)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing the matched handler (labelled by its router and name) as a trace span."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, object]], Awaitable[object]],
+        event: TelegramObject,
+        data: dict[str, object],
+    ) -> object:
+        router = getattr(data.get("event_router"), "name", "")
+        name = handler_name(data.get("handler"))  # pyright: ignore[reportArgumentType]
+        with trace(f"handler {name}", router=router) as span:
+            try:
+                return await handler(event, data)
+            except Exception as e:
+                HANDLER_ERRORS.inc(router=router, handler=name, error=type(e).__name__)
+                span.attributes["error"] = type(e).__name__
+                raise
+            finally:
+                HANDLER_DURATION.observe(time.perf_counter() - span.started, router=router, handler=name)
+
+
+def handler_name(handler: HandlerObject | None) -> str:
+    """Readable name of a handler, unwrapping aiogram's scene handler wrappers."""
+    if handler is None:
+        return ""
+    callback = handler.callback
+    if isinstance(callback, SceneHandlerWrapper):
+        callback = callback.handler.callback
+    return getattr(callback, "__qualname__", type(callback).__name__)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware timing every Bot API call as a trace span and counting its errors."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = type(method).__name__
+        status = "ok"
+        with trace(f"api {name}") as span:
+            try:
+                return await make_request(bot, method)
+            except TelegramAPIError as e:
+                status = type(e).__name__
+                TELEGRAM_API_ERRORS.inc(method=name, error=status)
+                raise
+            except Exception:
+                status = "network"
+                TELEGRAM_API_ERRORS.inc(method=name, error=status)
+                raise
+            finally:
+                span.attributes["status"] = status
+                TELEGRAM_API_DURATION.observe(time.perf_counter() - span.started, method=name, status=status)
+
+
 middlewares = [MediaMiddleware]
+observed_events = ("message", "channel_post", "edited_channel_post", "callback_query")
 
 
 async def setup_middlewares(dp: Dispatcher) -> None:
+    media_middlewares: list[MediaMiddleware] = []
     for middleware in middlewares:
-        dp.channel_post.middleware(middleware())
-        dp.message.middleware(middleware())
+        for observer in (dp.channel_post, dp.message):
+            instance = middleware()
+            observer.middleware(instance)
+            if isinstance(instance, MediaMiddleware):
+                media_middlewares.append(instance)
+
+    QUEUE_DEPTH.set_function(lambda: sum(len(m.medias) for m in media_middlewares), queue="media_groups")
+
+    dp.update.outer_middleware(DeduplicationMiddleware())
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    for event in observed_events:
+        dp.observers[event].middleware(HandlerMetricsMiddleware())
+
+
+def setup_session_middlewares(bot: Bot) -> None:
+    bot.session.middleware(ApiMetricsMiddleware())
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from app.config import ARCHIVE_EDIT_INTERVAL, CAPTION_EDIT_DEBOUNCE
+from app.metrics import QUEUE_DEPTH
+from app.tracing import detached_context
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Coroutine, Hashable, Mapping
+
+    from aiogram import Bot
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+_background_tasks: set[asyncio.Task] = set()
+QUEUE_DEPTH.set_function(lambda: len(_background_tasks), queue="background_tasks")
+
+
+class Pacer:
+    """Space out Telegram API calls so bulk operations stay under flood limits.
+
+    Every call waits for its own slot (`interval` seconds after the previous one)
+    and a `TelegramRetryAfter` pushes the next slot back by `retry_after` before
+    the call is retried.
+    """
+
+    def __init__(self, interval: float, max_retries: int = 3) -> None:
+        self.interval = interval
+        self.max_retries = max_retries
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        """Sleep until the next free slot and reserve it."""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def backoff(self, seconds: float) -> None:
+        """Push every pending slot back by `seconds` after a flood-wait."""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+    async def call(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """Run `factory()` in the next slot, retrying on flood-wait."""
+        for attempt in range(self.max_retries + 1):
+            await self.wait()
+            try:
+                return await factory()
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("Rate limited; pausing paced calls for %s seconds", e.retry_after)
+                self.backoff(e.retry_after)
+
+        raise AssertionError("unreachable")
+
+
+archive_pacer = Pacer(ARCHIVE_EDIT_INTERVAL)
+"""Shared pacer for bulk edits in the archive channel."""
+
+
+async def edit_caption(bot: Bot, chat_id: int, message_id: int, caption: str, pacer: Pacer) -> bool:
+    """Edit one caption in the next paced slot.
+
+    Returns:
+        True if the caption was edited or was already up to date.
+    """
+    try:
+        await pacer.call(lambda: bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=caption))
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message.lower():
+            logger.warning("Failed to edit caption of message_id %d: %s", message_id, e.message)
+            return False
+    return True
+
+
+async def edit_captions(bot: Bot, chat_id: int, captions: Mapping[int, str], pacer: Pacer) -> tuple[int, int]:
+    """Apply `message_id -> caption` edits one paced call at a time.
+
+    Returns:
+        A tuple of (edited, failed) counts. Captions that are already up to
+        date count as edited.
+    """
+    edited = failed = 0
+    for message_id, caption in captions.items():
+        if await edit_caption(bot, chat_id, message_id, caption, pacer):
+            edited += 1
+        else:
+            failed += 1
+
+    return edited, failed
+
+
+@dataclass
+class _Pending:
+    factory: Callable[[], Awaitable[object]]
+    first: float
+    last: float
+
+
+class Debouncer:
+    """Coalesce bursts of work per key, so only the latest submission runs.
+
+    Work for a key runs once no new submission arrived for `delay` seconds,
+    but never later than `max_delay` seconds after the first one of the burst.
+    """
+
+    def __init__(self, delay: float, max_delay: float | None = None) -> None:
+        self.delay = delay
+        self.max_delay = max_delay if max_delay is not None else delay * 5
+        self._pending: dict[Hashable, _Pending] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, key: Hashable, factory: Callable[[], Awaitable[object]]) -> None:
+        """Schedule `factory()` for `key`, replacing any submission still waiting for that key."""
+        now = time.monotonic()
+        if pending := self._pending.get(key):
+            pending.factory, pending.last = factory, now
+            return
+
+        self._pending[key] = _Pending(factory, now, now)
+        run_in_background(self._run_when_quiet(key), name=f"debounce-{key}")
+
+    async def _run_when_quiet(self, key: Hashable) -> None:
+        while pending := self._pending.get(key):
+            remaining = min(pending.last + self.delay, pending.first + self.max_delay) - time.monotonic()
+            if remaining <= 0:
+                del self._pending[key]
+                await pending.factory()
+                return
+            await asyncio.sleep(remaining)
+
+    async def flush(self) -> None:
+        """Run every waiting submission now (e.g. on shutdown)."""
+        pending, self._pending = self._pending, {}
+        for key, item in pending.items():
+            try:
+                await item.factory()
+            except Exception:
+                logger.exception("Debounced work for %r failed", key)
+
+
+caption_edits = Debouncer(CAPTION_EDIT_DEBOUNCE)
+"""Coalesces bursts of caption edits per source message."""
+QUEUE_DEPTH.set_function(lambda: len(caption_edits), queue="caption_edits")
+
+
+@dataclass
+class _Batch:
+    items: list[Any] = field(default_factory=list)
+    done: asyncio.Future[Any] = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class Batcher:
+    """Coalesce work submitted under the same key within `window` seconds into one call of `flush`.
+
+    Every submitter awaits the shared outcome, so a failed write surfaces to
+    each caller. Batches for the same key are flushed one at a time, in order.
+    """
+
+    def __init__(self, window: float, flush: Callable[[Hashable, list[Any]], Awaitable[Any]]) -> None:
+        self.window = window
+        self.flush = flush
+        self._pending: dict[Hashable, _Batch] = {}
+        self._flushing: dict[Hashable, asyncio.Future[Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, key: Hashable, items: list[Any]) -> Any:
+        """Add `items` to the batch for `key` and wait for that batch to be flushed."""
+        if not (batch := self._pending.get(key)):
+            batch = self._pending[key] = _Batch()
+            run_in_background(self._flush_later(key, batch), name=f"batch-{key}")
+        batch.items.extend(items)
+        return await asyncio.shield(batch.done)
+
+    async def _flush_later(self, key: Hashable, batch: _Batch) -> None:
+        await asyncio.sleep(self.window)
+        del self._pending[key]
+
+        if previous := self._flushing.get(key):
+            await asyncio.wait([previous])
+        self._flushing[key] = batch.done
+
+        try:
+            batch.done.set_result(await self.flush(key, batch.items))
+        except Exception as e:  # noqa: BLE001 - re-raised in every submitter
+            batch.done.set_exception(e)
+        finally:
+            if self._flushing.get(key) is batch.done:
+                del self._flushing[key]
+
+
+def run_in_background(coro: Coroutine, name: str | None = None) -> asyncio.Task:
+    """Schedule `coro` as a task, keeping a reference so it isn't GC'd mid-flight.
+
+    The task starts outside the caller's trace, so long jobs don't grow the span that spawned them.
+    """
+    task = asyncio.create_task(coro, name=name, context=detached_context())
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+def _on_background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and (exc := task.exception()):
+        logger.error("Background task %r failed", task.get_name(), exc_info=exc)
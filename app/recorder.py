@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from pathlib import Path
+from typing import Any
+
+from app.config import WEBHOOK_RECORD_PATH
+
+logger = logging.getLogger(__name__)
+
+# Fields that identify a person beyond their (pseudonymized) id.
+_PERSONAL_FIELDS = frozenset({"first_name", "last_name", "username", "phone_number", "bio"})
+# Payload parts that carry personal data and are never needed to replay a flow.
+_DROPPED_FIELDS = frozenset({"contact", "location", "venue", "live_location", "users_shared", "chat_shared"})
+
+
+class WebhookRecorder:
+    """Append sanitized webhook payloads to a JSON-lines file for offline replay.
+
+    User ids and private chat ids are replaced by stable pseudonyms (an HMAC
+    with a per-process key, so one user keeps the same id within a recording),
+    names are blanked and contact/location payloads dropped. Channel ids,
+    captions and texts are kept since routing and the flows depend on them.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._key = secrets.token_bytes(16)
+        self._file = path.open("a", encoding="utf-8")
+
+    def record(self, payload: dict[str, Any]) -> None:
+        line = json.dumps({"t": time.time(), "update": self.sanitize(payload)}, ensure_ascii=False)
+        try:
+            self._file.write(line + "\n")
+            self._file.flush()
+        except OSError:
+            logger.exception("Failed to record webhook payload to %s", self.path)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def sanitize(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self.sanitize(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        # Users always carry `is_bot`; private chats are the user's own chat.
+        personal = "is_bot" in value or value.get("type") == "private"
+        sanitized = {}
+        for key, item in value.items():
+            if key in _DROPPED_FIELDS:
+                continue
+            if personal and key in _PERSONAL_FIELDS:
+                if key == "first_name":
+                    sanitized[key] = "user"
+                continue
+            if personal and key in ("id", "user_id") and isinstance(item, int):
+                sanitized[key] = self._pseudonym(item)
+                continue
+            sanitized[key] = self.sanitize(item)
+        return sanitized
+
+    def _pseudonym(self, user_id: int) -> int:
+        digest = hmac.new(self._key, str(user_id).encode(), hashlib.sha256).digest()
+        return 10**9 + int.from_bytes(digest[:4]) % 10**9
+
+
+recorder = WebhookRecorder(Path(WEBHOOK_RECORD_PATH)) if WEBHOOK_RECORD_PATH else None
@@ -8,16 +8,21 @@ from aiogram.fsm.scene import Scene, on
 from aiogram.types import KeyboardButton, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from aiogram.utils.keyboard import ReplyKeyboardBuilder
 
-from app.config import ARCHIVE_CHANNEL
-from app.database.models.course import Course, CourseType
+from app.config import BROWSE_POPULAR_FIRST
+from app.database.models.course import Course, CourseFile, CourseType
 from app.database.models.ordinal import Ordinal
+from app.jobs.downloads import downloads
+from app.jobs.integrity import deliver
 from app.scene.models import Action
+from app.tenants import tenants
 
 if TYPE_CHECKING:
     from collections.abc import Awaitable, Callable
 
     from aiogram.fsm.context import FSMContext
 
+    from app.database.models.tenant import Tenant
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,9 +32,13 @@ class BrowseScene(Scene, state="browse"):
     Each entry in `STEPS` names an answer key; the matching `_prompt_<key>_selection`
     method returns the prompt text and the options to show for that step. Once every
     step has an answer, the extra "virtual" step triggers `_handle_file_download`.
+    A step with a single option (the batch, when only one is served) is answered
+    without asking; such answers are remembered under `auto` and are invisible to
+    navigation: they don't count as steps for the Back button and Back skips them.
     """
 
-    STEPS: ClassVar[tuple[str, ...]] = ("level", "term", "type", "course", "file")
+    STEPS: ClassVar[tuple[str, ...]] = ("batch", "level", "term", "type", "course", "file")
+    AUTO_STEPS: ClassVar[set[str]] = {"batch"}
     NAVIGATION_ACTIONS: ClassVar[set[Action]] = {Action.back, Action.restart, Action.exit}
 
     def _step_prompt(self, step_key: str) -> Callable[[dict], Awaitable[tuple[str, list[str]]]]:
@@ -37,12 +46,28 @@ class BrowseScene(Scene, state="browse"):
 
     @staticmethod
     async def _go_back(state: FSMContext, answers: dict) -> None:
-        """Drop the most recent answer, returning the user to the previous step."""
-        answers.popitem()
+        """Drop the most recent answer the user gave (and any auto-answered steps after it)."""
+        auto = set(await state.get_value("auto", []))
+        if all(key in auto for key in answers):
+            return
+
+        while answers and answers.popitem()[0] in auto:
+            pass
         await state.update_data(answers=answers)
 
+    @staticmethod
+    async def _answered(state: FSMContext, answers: dict) -> int:
+        """How many steps the user answered themselves."""
+        auto = set(await state.get_value("auto", []))
+        return sum(key not in auto for key in answers)
+
+    @staticmethod
+    def _tenant(answers: dict) -> Tenant:
+        """The batch chosen in `answers`, or the default one if it is no longer served."""
+        return tenants.by_label(answers.get("batch", "")) or tenants.default
+
     async def _get_matching_courses(self, answers: dict, course_name: str | None = None) -> list[Course]:
-        """Resolve semester/type from `answers` and fetch matching courses."""
+        """Resolve batch/semester/type from `answers` and fetch matching courses."""
         semester, is_practical = (
             Ordinal.to_semester(
                 Ordinal.get_value(answers["level"]),
@@ -50,7 +75,7 @@ class BrowseScene(Scene, state="browse"):
             ),
             answers["type"] == CourseType.PRACTICAL.value,
         )
-        return await Course.get_courses(semester, is_practical, course_name)
+        return await Course.get_courses(self._tenant(answers).namespace, semester, is_practical, course_name)
 
     def build_keyboard(self, options: list[str], step: int) -> ReplyKeyboardMarkup:
         """Build a reply keyboard with the given options plus navigation buttons."""
@@ -68,11 +93,14 @@ class BrowseScene(Scene, state="browse"):
         kb.row(KeyboardButton(text=Action.exit))
         return kb.as_markup(resize_keyboard=True)
 
-    async def _prompt_level_selection(self, _: dict) -> tuple[str, list[str]]:
-        return "اختر المستوى:", Ordinal.available_levels()
+    async def _prompt_batch_selection(self, _: dict) -> tuple[str, list[str]]:
+        return "اختر الدفعة:", [tenant.label for tenant in tenants.all]
+
+    async def _prompt_level_selection(self, answers: dict) -> tuple[str, list[str]]:
+        return "اختر المستوى:", Ordinal.available_levels(self._tenant(answers).startYear)
 
-    async def _prompt_term_selection(self, _: dict) -> tuple[str, list[str]]:
-        return "اختر الفصل:", Ordinal.available_terms()
+    async def _prompt_term_selection(self, answers: dict) -> tuple[str, list[str]]:
+        return "اختر الفصل:", Ordinal.available_terms(self._tenant(answers).startYear)
 
     async def _prompt_type_selection(self, _: dict) -> tuple[str, list[str]]:
         return "اختر النوع:", [option.value for option in CourseType]
@@ -80,21 +108,24 @@ class BrowseScene(Scene, state="browse"):
     async def _prompt_course_selection(self, answers: dict) -> tuple[str, list[str]]:
         """Return available courses for the chosen level/term/type."""
         courses = await self._get_matching_courses(answers)
-        options = [course.courseName for course in courses if course.files]
+        with_files = await CourseFile.course_ids_with_files(tuple(course.id for course in courses))
+        options = [course.courseName for course in courses if course.id in with_files]
 
         if not options:
             return "لم يتم إضافة مواد لهذا الاختيار بعد.", []
         return "اختر المقرر:", options
 
     async def _prompt_file_selection(self, answers: dict) -> tuple[str, list[str]]:
-        """Return available files for the selected course."""
+        """Return available files for the selected course, most downloaded first when `BROWSE_POPULAR_FIRST` is set."""
         courses = await self._get_matching_courses(answers, answers["course"])
 
-        if not courses or not courses[0].files:
+        if not courses or not (options := await CourseFile.titles(courses[0].id)):
             return "لا توجد ملفات للمقرر المحدد.", []
 
-        options = {file.title for file in courses[0].files}
-        return "اختر المادة:", sorted(options)
+        if BROWSE_POPULAR_FIRST:
+            counts = await CourseFile.title_downloads(courses[0].id)
+            options = sorted(options, key=lambda title: -counts.get(title, 0))
+        return "اختر المادة:", options
 
     async def _handle_file_download(self, message: Message, bot: Bot, answers: dict) -> None:
         """Send the selected file's messages to the user."""
@@ -106,12 +137,16 @@ class BrowseScene(Scene, state="browse"):
                 await message.answer("المقرر غير موجود.")
                 return
 
-            file_ids = [file.archiveTelegramMessageId for file in courses[0].files if file.title == title]
+            file_ids = await CourseFile.archive_ids(courses[0].id, title)
             if not file_ids:
                 await message.answer("الملف غير موجود.")
                 return
 
-            await bot.copy_messages(message.chat.id, ARCHIVE_CHANNEL, file_ids, remove_caption=True)
+            archive_chat = self._tenant(answers).archiveChatId
+            if not await deliver(bot, message.chat.id, archive_chat, file_ids):
+                await message.answer("الملف غير متوفر حالياً.")
+                return
+            downloads.record(courses[0].id, archive_chat, file_ids)
 
         except Exception:
             logger.exception("Error while fetching files (%s - %s)", course, title)
@@ -135,15 +170,22 @@ class BrowseScene(Scene, state="browse"):
 
         prompt, options = await self._step_prompt(self.STEPS[step])(answers)
 
+        if self.STEPS[step] in self.AUTO_STEPS and len(options) == 1:
+            answers[self.STEPS[step]] = options[0]
+            auto = {*await state.get_value("auto", []), self.STEPS[step]}
+            await state.update_data(answers=answers, auto=sorted(auto))
+            return await self.wizard.retake()
+
         if not options:
             # This answer led to a dead end (e.g. no files for the chosen course) - undo it.
-            if step > 0:
+            if answers:
                 await self._go_back(state, answers)
             await message.answer(prompt)
             return await self.wizard.retake()
 
         await state.update_data(preoptions=options)
-        await message.answer(prompt, reply_markup=self.build_keyboard(options, step))
+        keyboard = self.build_keyboard(options, await self._answered(state, answers))
+        await message.answer(prompt, reply_markup=keyboard)
 
     @on.message(F.text.in_(NAVIGATION_ACTIONS))
     async def on_navigation(self, message: Message, state: FSMContext) -> None:
@@ -173,7 +215,8 @@ class BrowseScene(Scene, state="browse"):
             return await self.on_unknown_message(message)
 
         answers[self.STEPS[step]] = text
-        await state.update_data(answers=answers)
+        auto = [key for key in await state.get_value("auto", []) if key != self.STEPS[step]]
+        await state.update_data(answers=answers, auto=auto)
         await self.wizard.retake()
 
     @on.message()
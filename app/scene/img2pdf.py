@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import logging
 import tempfile
+import time
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 from aiogram import Bot, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.scene import Scene, on
 from aiogram.types import (
     BufferedInputFile,
@@ -14,15 +19,20 @@ from aiogram.types import (
     Message,
     PhotoSize,
     ReplyKeyboardRemove,
+    User,
 )
-from PIL import Image
 
+from app.jobs.img2pdf import AdmissionError, ConversionJob, conversions, prefetcher
+from app.metrics import IMG2PDF_DURATION, IMG2PDF_IMAGES
 from app.scene.models import Action, File
 
 if TYPE_CHECKING:
     from collections.abc import Iterable
 
     from aiogram.fsm.context import FSMContext
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
 
 
 class Img2PdfScene(Scene, state="img2pdf"):
@@ -63,6 +73,11 @@ class Img2PdfScene(Scene, state="img2pdf"):
     )
     """Inline keyboard for editing generated PDF."""
 
+    CANCEL_KEYBOARD: InlineKeyboardMarkup = InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="❌ إلغاء", callback_data=Action.cancel)]]
+    )
+    """Inline keyboard for a queued or running conversion."""
+
     async def send_pdf_result(self, message: Message, state: FSMContext, file: File):
         """Send the generated PDF to the user."""
         answer = await message.answer_document(
@@ -74,15 +89,18 @@ class Img2PdfScene(Scene, state="img2pdf"):
         await self._delete_previous_answer(state)
         await state.update_data(answer=answer, file=file)
 
-    async def _store_images(self, state: FSMContext, new_ids: Iterable[str]) -> list[str]:
-        """Store image file_ids in state while preserving order."""
+    async def _store_images(self, bot: Bot, user_id: int, state: FSMContext, photos: Iterable[PhotoSize]) -> list[str]:
+        """Store image file_ids (and their pixel counts) in state while preserving order, and start prefetching them."""
         images: list[str] = await state.get_value("images", [])
+        pixels: dict[str, int] = await state.get_value("pixels", {})
 
-        for file_id in new_ids:
-            if file_id not in images:
-                images.append(file_id)
+        for photo in photos:
+            if photo.file_id not in images:
+                images.append(photo.file_id)
+                pixels[photo.file_id] = photo.width * photo.height
 
-        await state.update_data(images=images)
+        await state.update_data(images=images, pixels=pixels)
+        prefetcher.prefetch(bot, user_id, images)
         return images
 
     async def _send_status(self, message: Message, state: FSMContext, count: int):
@@ -112,11 +130,20 @@ class Img2PdfScene(Scene, state="img2pdf"):
             )
             await state.update_data(answer=answer)
 
+    @on.callback_query.exit()
+    @on.message.exit()
+    async def on_exit_any(self, event: Message | CallbackQuery) -> None:
+        """Stop prefetching the user's images once they leave the scene."""
+        if event.from_user:
+            prefetcher.cancel(event.from_user.id)
+
     @on.message(F.photo, F.media_group_id)
-    async def on_album(self, message: Message, media_events: list[Message], state: FSMContext) -> None:
+    async def on_album(
+        self, message: Message, media_events: list[Message], state: FSMContext, bot: Bot, event_from_user: User
+    ) -> None:
         """Handle photo albums."""
-        new_ids = [event.photo[-1].file_id for event in media_events if event.photo]
-        images = await self._store_images(state, new_ids)
+        photos = [event.photo[-1] for event in media_events if event.photo]
+        images = await self._store_images(bot, event_from_user.id, state, photos)
         await self._send_status(message, state, len(images))
 
     @on.message(F.photo.as_("photo"))
@@ -125,51 +152,81 @@ class Img2PdfScene(Scene, state="img2pdf"):
         message: Message,
         state: FSMContext,
         photo: list[PhotoSize],
+        bot: Bot,
+        event_from_user: User,
     ) -> None:
         """Handle a single photo."""
-        images = await self._store_images(state, [photo[-1].file_id])
+        images = await self._store_images(bot, event_from_user.id, state, [photo[-1]])
         await self._send_status(message, state, len(images))
 
     @on.callback_query(F.data == Action.clear, F.message.as_("message"))
     async def on_clear(self, callback: CallbackQuery, message: Message):
         """Clear all stored images and restart the scene."""
+        conversions.cancel(callback.from_user.id)
+        prefetcher.cancel(callback.from_user.id)
         await callback.answer("تم حذف جميع الصور")
         await message.delete()
         await self.wizard.retake()
 
     @on.callback_query(F.data == Action.convert, F.message.as_("message"))
     async def on_convert(self, callback: CallbackQuery, message: Message, state: FSMContext, bot: Bot):
-        """Convert stored images into a single PDF."""
+        """Queue a conversion of the stored images into a single PDF."""
         stored_images: list[str] = await state.get_value("images", [])
         if not stored_images:
             return await callback.answer("لا توجد صور للتحويل")
 
-        await callback.answer("يتم التحويل...")
-
-        image_paths: list[Path] = []
-        for file_id in stored_images:
-            path = self.TMP / file_id
-            if not path.exists():
-                await bot.download(file_id, path)
-            image_paths.append(path)
-
-        pdf_path = self.TMP / f"{callback.from_user.id}.pdf"
-        images: list[Image.Image] = []
+        pixels: dict[str, int] = await state.get_value("pixels", {})
         try:
-            for path in image_paths:
-                images.append(Image.open(path).convert("RGB"))
-
-            images[0].save(
-                pdf_path,
-                format="PDF",
-                save_all=True,
-                append_images=images[1:],
-            )
+            conversions.admit(len(stored_images), sum(pixels.get(file_id, 0) for file_id in stored_images))
+        except AdmissionError as e:
+            return await callback.answer(str(e), show_alert=True)
+
+        user_id = callback.from_user.id
+        job = ConversionJob(
+            user_id,
+            work=lambda: self._run_conversion(bot, message, state, stored_images, user_id),
+            notify=lambda position: self._show_progress(message, position),
+        )
+        position = conversions.submit(job)
+        await callback.answer("يتم التحويل..." if position == 0 else f"تمت إضافتك إلى قائمة الانتظار ({position})")
+
+    @on.callback_query(F.data == Action.cancel, F.message.as_("message"))
+    async def on_cancel(self, callback: CallbackQuery, message: Message, state: FSMContext):
+        """Stop the user's queued or running conversion and show the stored images again."""
+        conversions.cancel(callback.from_user.id)
+        await callback.answer("تم إلغاء التحويل")
+        await self._send_status(message, state, len(await state.get_value("images", [])))
+
+    async def _show_progress(self, message: Message, position: int) -> None:
+        """Edit the conversion's queue position (or that it started) into the status message."""
+        text = "⚙️ جارٍ التحويل..." if position == 0 else f"⏳ في قائمة الانتظار، ترتيبك: {position}"
+        with contextlib.suppress(TelegramBadRequest):
+            await message.edit_text(text, reply_markup=self.CANCEL_KEYBOARD)
+
+    async def _run_conversion(
+        self, bot: Bot, message: Message, state: FSMContext, file_ids: list[str], user_id: int
+    ) -> None:
+        """Convert the images and send the PDF; runs in a conversion slot."""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            pdf_path = await self._convert(bot, user_id, file_ids, self.TMP / f"{user_id}.pdf")
+            await self.send_pdf_result(message, state, File(filepath=pdf_path))
+            status = "ok"
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception:
+            logger.exception("Image-to-PDF conversion failed for user %d", user_id)
+            await message.answer("حدث خطأ أثناء التحويل. الرجاء المحاولة لاحقاً.")
         finally:
-            for img in images:
-                img.close()
+            IMG2PDF_DURATION.observe(time.perf_counter() - started, status=status)
+            IMG2PDF_IMAGES.observe(len(file_ids))
 
-        await self.send_pdf_result(message, state, File(filepath=pdf_path))
+    async def _convert(self, bot: Bot, user_id: int, file_ids: list[str], pdf_path: Path) -> Path:
+        """Collect the images (mostly prefetched already) and combine them into `pdf_path`."""
+        image_paths = await prefetcher.collect(bot, user_id, file_ids)
+        return await asyncio.to_thread(images_to_pdf, image_paths, pdf_path)
 
     @on.callback_query(F.data.in_({Action.caption, Action.filename}))
     async def on_edit_request(self, callback: CallbackQuery, state: FSMContext):
@@ -199,3 +256,25 @@ class Img2PdfScene(Scene, state="img2pdf"):
 
         await self.send_pdf_result(message, state, file)
         await state.update_data(edit_mode=None)
+
+
+def images_to_pdf(image_paths: list[Path], pdf_path: Path) -> Path:
+    """Combine the images at `image_paths`, in order, into a single PDF at `pdf_path`."""
+    from PIL import Image  # deferred: Pillow is only needed once someone converts
+
+    images: list[Image.Image] = []
+    try:
+        for path in image_paths:
+            images.append(Image.open(path).convert("RGB"))
+
+        images[0].save(
+            pdf_path,
+            format="PDF",
+            save_all=True,
+            append_images=images[1:],
+        )
+    finally:
+        for img in images:
+            img.close()
+
+    return pdf_path
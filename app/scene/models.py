@@ -27,6 +27,7 @@ class File(BaseModel):
 class Action(StrEnum):
     clear = "clear"
     convert = "convert"
+    cancel = "cancel"
 
     filename = "filename"
     caption = "caption"
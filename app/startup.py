@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING, Any
+
+from app.database.base import database
+from app.metrics import STARTUP_DURATION
+from app.tracing import trace
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable
+
+    from aiogram import Bot
+    from aiogram.types import BotCommand, BotCommandScopeUnion
+
+    from app.tracing import Span
+
+logger = logging.getLogger(__name__)
+
+STATE_COLLECTION = "bot_state"
+"""Raw collection remembering what was last sent to Telegram, so it can be read before `init_beanie`."""
+
+STATE_MAX_AGE = timedelta(days=1)
+"""Re-send remembered settings anyway after this long, in case they were changed outside the bot."""
+
+
+def fingerprint(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def _is_unchanged(key: str, value: str) -> bool:
+    state = await database[STATE_COLLECTION].find_one({"_id": key})
+    if not state or state.get("fingerprint") != value:
+        return False
+    return datetime.now(UTC) - state["updatedAt"].replace(tzinfo=UTC) < STATE_MAX_AGE
+
+
+async def _remember(key: str, value: str | None) -> None:
+    if value is None:
+        await database[STATE_COLLECTION].delete_one({"_id": key})
+        return
+    await database[STATE_COLLECTION].update_one(
+        {"_id": key},
+        {"$set": {"fingerprint": value, "updatedAt": datetime.now(UTC)}},
+        upsert=True,
+    )
+
+
+async def sync_commands(bot: Bot, commands: list[BotCommand], scope: BotCommandScopeUnion) -> bool:
+    """Set the bot's commands unless the same list was already set; return whether Telegram was called."""
+    key = f"commands:{bot.id}:{scope.type}"
+    value = fingerprint([command.model_dump() for command in commands])
+    if await _is_unchanged(key, value):
+        return False
+
+    await bot.set_my_commands(commands, scope=scope)
+    await _remember(key, value)
+    return True
+
+
+async def sync_webhook(bot: Bot, url: str | None, secret: str) -> bool:
+    """Point the webhook at `url` (or delete it when None) unless already done; return whether Telegram was called."""
+    key = f"webhook:{bot.id}"
+    if url is None:
+        await bot.delete_webhook()
+        await _remember(key, None)
+        return True
+
+    # Only a hash of the secret is stored; a new secret must be sent to Telegram.
+    value = fingerprint({"url": url, "secret": secret})
+    if await _is_unchanged(key, value):
+        return False
+
+    await bot.set_webhook(url, secret_token=secret)
+    await _remember(key, value)
+    return True
+
+
+async def timed_step(name: str, step: Awaitable[Any]) -> Any:
+    """Await one startup step as a child span of the startup trace."""
+    with trace(name) as span:
+        result = await step
+        if result is False:
+            span.attributes["skipped"] = True
+    return result
+
+
+def report_startup(root: Span) -> None:
+    """Export and log how long each startup step took."""
+    STARTUP_DURATION.set(root.duration or 0.0, step="total")
+    steps = []
+    for span in root.children:
+        if span.name.startswith(("mongo ", "api ")):
+            continue
+        STARTUP_DURATION.set(span.duration or 0.0, step=span.name)
+        skipped = " (unchanged)" if span.attributes.get("skipped") else ""
+        steps.append(f"{span.name} {span.duration or 0.0:.2f}s{skipped}")
+    logger.info("Started in %.2fs: %s", root.duration or 0.0, ", ".join(steps))
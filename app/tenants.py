@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from pymongo.errors import PyMongoError
+
+from app.config import ARCHIVE_CHANNEL, CHANNEL_ID, SEMESTER_START_YEAR, TENANT_NAMESPACE, TENANT_RELOAD_INTERVAL
+from app.database.models.course import Course, CourseFile
+from app.database.models.tenant import Tenant
+
+logger = logging.getLogger(__name__)
+
+LEGACY_ARCHIVE_INDEX = "archiveTelegramMessageId_1"
+"""Unique index on the archive message id alone, from before files were keyed by archive chat too."""
+
+
+@dataclass(frozen=True)
+class RoutingTable:
+    """Every tenant, indexed by each key an update or request can carry."""
+
+    by_namespace: dict[str, Tenant] = field(default_factory=dict)
+    by_source: dict[int, Tenant] = field(default_factory=dict)
+    by_archive: dict[int, Tenant] = field(default_factory=dict)
+    by_label: dict[str, Tenant] = field(default_factory=dict)
+
+    @classmethod
+    def of(cls, tenants: list[Tenant]) -> RoutingTable:
+        table = cls()
+        for tenant in tenants:
+            table.by_namespace[tenant.namespace] = tenant
+            table.by_source[tenant.sourceChatId] = tenant
+            table.by_archive[tenant.archiveChatId] = tenant
+            table.by_label[tenant.label] = tenant
+        return table
+
+
+class TenantRegistry:
+    """The batches served by this process, routed by dict lookups.
+
+    The channels from the environment form the default tenant, which is always
+    served; more tenants are loaded from the `tenants` collection and reloaded
+    every `interval` seconds. A reload swaps the whole routing table at once.
+    """
+
+    def __init__(self, default: Tenant, interval: float = TENANT_RELOAD_INTERVAL) -> None:
+        self.default = default
+        self.interval = interval
+        self._table = RoutingTable.of([default])
+
+    @property
+    def all(self) -> list[Tenant]:
+        """Every tenant, the default first."""
+        return list(self._table.by_namespace.values())
+
+    def by_namespace(self, namespace: str) -> Tenant | None:
+        return self._table.by_namespace.get(namespace)
+
+    def by_source(self, chat_id: int) -> Tenant | None:
+        return self._table.by_source.get(chat_id)
+
+    def by_archive(self, chat_id: int) -> Tenant | None:
+        return self._table.by_archive.get(chat_id)
+
+    def by_label(self, label: str) -> Tenant | None:
+        return self._table.by_label.get(label)
+
+    async def load(self) -> None:
+        """Rebuild the routing table from the `tenants` collection."""
+        tenants = [self.default]
+        keys = {self.default.namespace, self.default.sourceChatId, self.default.archiveChatId, self.default.label}
+        for tenant in await Tenant.find_all().sort("namespace").to_list():
+            if tenant.namespace == self.default.namespace:
+                continue
+            if clash := keys & {tenant.sourceChatId, tenant.archiveChatId, tenant.label}:
+                logger.warning("Ignoring tenant %r: %s already used by another batch", tenant.namespace, clash)
+                continue
+            keys |= {tenant.namespace, tenant.sourceChatId, tenant.archiveChatId, tenant.label}
+            tenants.append(tenant)
+
+        if [t.model_dump() for t in tenants] != [t.model_dump() for t in self.all]:
+            self._table = RoutingTable.of(tenants)
+            Course.catalog_version += 1
+            logger.info("Loaded %d tenant(s)", len(tenants))
+
+    async def run(self) -> None:
+        """Reload every `interval` seconds, forever, keeping the last table when a reload fails."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.load()
+            except PyMongoError:
+                logger.exception("Failed to reload tenants; keeping the current routing table")
+
+
+async def setup_tenants() -> None:
+    """Adopt the data stored before batches existed into the default tenant, then load the routing table.
+
+    Courses without a namespace join the default batch, and files recorded
+    under the default source channel are re-keyed to its archive channel (the
+    chat their archive message ids belong to). Safe to re-run.
+    """
+    default = tenants.default
+    courses = await Course.get_pymongo_collection().update_many(
+        {"namespace": {"$exists": False}}, {"$set": {"namespace": default.namespace}}
+    )
+    files = CourseFile.get_pymongo_collection()
+    moved = 0
+    if default.sourceChatId != default.archiveChatId:
+        result = await files.update_many({"chatId": default.sourceChatId}, {"$set": {"chatId": default.archiveChatId}})
+        moved = result.modified_count
+    if LEGACY_ARCHIVE_INDEX in await files.index_information():
+        await files.drop_index(LEGACY_ARCHIVE_INDEX)
+        logger.info("Dropped index %s", LEGACY_ARCHIVE_INDEX)
+
+    if courses.modified_count or moved:
+        logger.info(
+            "Adopted %d course(s) and %d file(s) into tenant %r", courses.modified_count, moved, default.namespace
+        )
+        Course.invalidate_caches()
+    await tenants.load()
+
+
+tenants = TenantRegistry(
+    Tenant.model_construct(
+        namespace=TENANT_NAMESPACE,
+        sourceChatId=CHANNEL_ID,
+        archiveChatId=ARCHIVE_CHANNEL,
+        startYear=SEMESTER_START_YEAR,
+    )
+)
+"""Routing table of the batches served by this process."""
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from app.config import LOOP_LAG_INTERVAL, TRACE_BUFFER_SIZE, TRACE_SLOW_THRESHOLD
+from app.metrics import EVENT_LOOP_LAG, SLOW_UPDATES
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """One timed step of an update (the update itself, a handler, a DB or API call)."""
+
+    name: str
+    attributes: dict[str, Any] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    duration: float | None = None
+    children: list[Span] = field(default_factory=list)
+
+    def finish(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+
+    def to_dict(self, origin: float | None = None) -> dict[str, Any]:
+        """Serialize the span tree, with offsets in milliseconds relative to the root span."""
+        origin = self.started if origin is None else origin
+        return {
+            "name": self.name,
+            "offset_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            **({"attributes": self.attributes} if self.attributes else {}),
+            **({"children": [c.to_dict(origin) for c in self.children]} if self.children else {}),
+        }
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+slow_updates: deque[dict[str, Any]] = deque(maxlen=TRACE_BUFFER_SIZE)
+"""Ring buffer of the most recent updates slower than `TRACE_SLOW_THRESHOLD`."""
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time a block as a child of the current span (or as a new root span)."""
+    span = Span(name, attributes)
+    if parent := _current_span.get():
+        parent.children.append(span)
+
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        span.finish()
+        _current_span.reset(token)
+
+
+def record_span(name: str, duration: float, **attributes: Any) -> None:
+    """Attach an already-measured step (e.g. from a driver callback) to the current span."""
+    if parent := _current_span.get():
+        span = Span(name, attributes, started=time.perf_counter() - duration, duration=duration)
+        parent.children.append(span)
+
+
+def detached_context() -> Context:
+    """A copy of the current context with no current span, for tasks that outlive the span that started them.
+
+    Without it a background job keeps attaching its spans to the (finished)
+    handler span that spawned it, for as long as the job runs.
+    """
+    context = copy_context()
+    context.run(_current_span.set, None)
+    return context
+
+
+def keep_if_slow(root: Span) -> None:
+    """Keep a finished update's span tree in the ring buffer if it crossed the slow threshold."""
+    if root.duration is not None and root.duration >= TRACE_SLOW_THRESHOLD:
+        SLOW_UPDATES.inc()
+        slow_updates.append({"at": time.time(), **root.to_dict()})
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Measure how late the event loop wakes up from a fixed sleep, as a proxy for blocking calls."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - expected, 0.0)
+        EVENT_LOOP_LAG.observe(lag)
+        if lag >= TRACE_SLOW_THRESHOLD:
+            logger.warning("Event loop was blocked for %.3fs", lag)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import random
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING
+
+from aiogram.types import Chat, Document, Message
+from beanie.odm.utils.init import Initializer
+from PIL import Image
+
+from app.database.base import database
+from app.database.models.course import Course, CourseFile, MessageType
+from app.database.models.ordinal import Ordinal
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+SOURCE_CHANNEL = -1001234567890
+ARCHIVE_CHANNEL = -1000987654321
+
+SUBJECTS = [
+    "البرمجة",
+    "هياكل البيانات",
+    "الخوارزميات",
+    "قواعد البيانات",
+    "الشبكات",
+    "نظم التشغيل",
+    "الذكاء الاصطناعي",
+    "هندسة البرمجيات",
+    "الرياضيات المتقطعة",
+    "التفاضل والتكامل",
+    "الجبر الخطي",
+    "الإحصاء والاحتمالات",
+    "أمن المعلومات",
+    "الرسوميات",
+    "المترجمات",
+]
+QUALIFIERS = ["", " 1", " 2", " المتقدمة", " التطبيقية"]
+TUTORS = ["د. أحمد محمد", "د. فاطمة علي", "أ. خالد سعيد", "د. مريم حسن", "م. يوسف عمر"]
+TITLES = ["المحاضرة", "ملخص", "تمارين", "نموذج امتحان", "تسجيل"]
+
+
+class _OfflineInitializer(Initializer):
+    """Beanie's initializer minus its server round trips, so documents can be built without MongoDB."""
+
+    async def _load_cached_info(self) -> None:
+        self._database_major_version = 7
+
+
+async def init_models() -> None:
+    await _OfflineInitializer(database=database, document_models=[Course, CourseFile], skip_indexes=True)
+
+
+def course_names(count: int = 60, seed: int = 7) -> list[str]:
+    """Distinct, realistic Arabic course names."""
+    rng = random.Random(seed)
+    names = [subject + qualifier for subject in SUBJECTS for qualifier in QUALIFIERS]
+    rng.shuffle(names)
+    return names[:count]
+
+
+def typo(name: str, seed: int = 7) -> str:
+    """`name` with one character dropped, as admins tend to type it."""
+    rng = random.Random(seed)
+    index = rng.randrange(len(name))
+    return name[:index] + name[index + 1 :]
+
+
+def caption(course: str, title: str, semester: int = 3) -> str:
+    return f"{course} ({TUTORS[0]}) | {title}\n\n#المستوى_{Ordinal.get_name((semester + 1) // 2)} #الفصل_{Ordinal.get_name(semester)}"
+
+
+def course_file(message_id: int, title: str) -> CourseFile:
+    return CourseFile(
+        title=title,
+        archiveTelegramMessageId=message_id,
+        chatId=ARCHIVE_CHANNEL,
+        originalTelegramMessageId=message_id,
+        fromChatId=SOURCE_CHANNEL,
+        fileId=f"BQACAgQAAxkBAAI{message_id:08d}",
+        originalName=f"lecture_{message_id}.pdf",
+        mimeType="application/pdf",
+        telegramMessageType=MessageType.DOCUMENT,
+        extension="pdf",
+        sizeBytes=1_500_000 + message_id,
+    )
+
+
+def course_files(file_count: int) -> list[CourseFile]:
+    """`file_count` files of one course, spread over ~1/4 as many titles."""
+    return [course_file(i, f"{TITLES[i % len(TITLES)]} {i // 4}") for i in range(1, file_count + 1)]
+
+
+def legacy_course(file_count: int, name: str = "هياكل البيانات") -> Course:
+    """A course still holding `file_count` embedded files, as before the `course_files` migration."""
+    return Course(
+        courseName=name,
+        tutorName=TUTORS[0],
+        semester=Ordinal(3),
+        isPractical=False,
+        files=[f.model_dump(exclude={"id", "revision_id", "courseId"}) for f in course_files(file_count)],
+        createdAt=datetime.now(UTC),
+        updatedAt=datetime.now(UTC),
+    )
+
+
+def media_group(size: int, courses: list[str]) -> list[Message]:
+    """An album of documents; only the last message carries the caption, as Telegram sends them."""
+    messages = []
+    for i in range(size):
+        course = courses[i % len(courses)]
+        messages.append(
+            Message(
+                message_id=1000 + i,
+                date=datetime.now(UTC),
+                chat=Chat(id=SOURCE_CHANNEL, type="channel"),
+                media_group_id="13579",
+                caption=caption(course, f"المحاضرة {i}") if i % 3 == 0 or i == size - 1 else None,
+                document=Document(
+                    file_id=f"BQACAgQAAxkBAAI{i:08d}",
+                    file_unique_id=f"AgAD{i:06d}",
+                    file_name=f"lecture_{i}.pdf",
+                    mime_type="application/pdf",
+                    file_size=1_500_000 + i,
+                ),
+            )
+        )
+    return messages
+
+
+def images(directory: Path, count: int, size: tuple[int, int] = (1240, 1754)) -> list[Path]:
+    """`count` noisy JPEG pages (A4 at 150 dpi), written once and reused."""
+    paths = []
+    for i in range(count):
+        path = directory / f"page_{size[0]}x{size[1]}_{i}.jpg"
+        if not path.exists():
+            Image.effect_noise(size, 40 + i % 20).convert("RGB").save(path, quality=85)
+        paths.append(path)
+    return paths
@@ -0,0 +1,297 @@
+"""Micro-benchmarks for the bot's hot paths.
+
+Usage:
+    python -m benchmarks.run                 # run everything and print results
+    python -m benchmarks.run --save          # ...and store them as the baseline
+    python -m benchmarks.run --compare       # ...and compare against the stored baseline
+    python -m benchmarks.run -k similarity   # only benchmarks whose name contains "similarity"
+
+Nothing here talks to MongoDB or Telegram: beanie is initialised without its server
+round trips and no benchmark awaits a query, so only in-process work is measured.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "0:benchmark")
+
+from app.database.models.course import (
+    CAPTION_PATTERN,
+    Course,
+    CourseFile,
+    _merge_embedded,
+    _resolve_course_similarity,
+)
+from app.database.models.ordinal import Ordinal
+from app.scene.browse import BrowseScene
+from app.scene.img2pdf import images_to_pdf
+from benchmarks import data
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+asyncio.run(data.init_models())
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+IMAGE_DIR = Path(tempfile.gettempdir()) / "batchlibrarybot-bench"
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[[], Any]
+    repeats: int = 7
+    min_time: float = 0.2
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def benchmark(name: str, repeats: int = 7, min_time: float = 0.2):
+    def decorator(func: Callable[[], Any]) -> Callable[[], Any]:
+        BENCHMARKS.append(Benchmark(name, func, repeats, min_time))
+        return func
+
+    return decorator
+
+
+# --- course resolution -------------------------------------------------------------------------
+
+NAMES = data.course_names(60)
+
+
+@benchmark("similarity/exact_match")
+def bench_similarity_exact():
+    _resolve_course_similarity(NAMES[42], NAMES)
+
+
+@benchmark("similarity/typo_match")
+def bench_similarity_typo():
+    _resolve_course_similarity(data.typo(NAMES[42]), NAMES)
+
+
+@benchmark("similarity/no_match")
+def bench_similarity_miss():
+    _resolve_course_similarity("مقرر غير موجود نهائيا", NAMES)
+
+
+# --- caption parsing ---------------------------------------------------------------------------
+
+CAPTION = data.caption(NAMES[3], "المحاضرة الخامسة - الجزء الثاني")
+
+
+@benchmark("caption/pattern_search")
+def bench_caption_pattern():
+    CAPTION_PATTERN.search(CAPTION)
+
+
+@benchmark("caption/get_semester")
+def bench_get_semester():
+    Ordinal.get_semester(CAPTION)
+
+
+@benchmark("caption/format_info")
+def bench_format_caption():
+    Course.format_caption(NAMES[3], data.TUTORS[0], 3, "المحاضرة الخامسة")
+
+
+# --- ingest ------------------------------------------------------------------------------------
+
+ALBUM = data.media_group(10, NAMES[:3])
+
+
+@benchmark("ingest/group_media_by_course[10]")
+async def bench_group_media():
+    await CourseFile.group_media_by_course(ALBUM)
+
+
+INCOMING_FILES = [data.course_file(i, f"عنوان {i}") for i in range(290, 310)]
+
+
+@benchmark("ingest/upsert_ops[20]")
+def bench_upsert_ops():
+    CourseFile.upsert_ops(INCOMING_FILES, None)
+
+
+# --- course files ------------------------------------------------------------------------------
+
+STORED_FILES = data.course_files(300)
+LEGACY_COURSE = data.legacy_course(300)
+
+
+@benchmark("files/dual_read_merge[300+300]")
+def bench_dual_read_merge():
+    embedded = [CourseFile.model_validate({**f, "courseId": LEGACY_COURSE.id}) for f in LEGACY_COURSE.files]
+    _merge_embedded(STORED_FILES, embedded)
+
+
+# --- browse ------------------------------------------------------------------------------------
+
+SCENE = BrowseScene.__new__(BrowseScene)
+FILE_TITLES = sorted({f.title for f in STORED_FILES})
+
+
+@benchmark("browse/build_keyboard[courses]")
+def bench_keyboard_courses():
+    SCENE.build_keyboard(NAMES[:12], 3)
+
+
+@benchmark("browse/build_keyboard[files]")
+def bench_keyboard_files():
+    SCENE.build_keyboard(FILE_TITLES, 4)
+
+
+# --- img2pdf -----------------------------------------------------------------------------------
+
+
+def _img2pdf(count: int) -> Callable[[], Any]:
+    def run() -> None:
+        IMAGE_DIR.mkdir(exist_ok=True)
+        images_to_pdf(data.images(IMAGE_DIR, count), IMAGE_DIR / f"out_{count}.pdf")
+
+    return run
+
+
+for _count, _repeats in ((1, 5), (10, 3), (50, 3)):
+    benchmark(f"img2pdf/convert[{_count}]", repeats=_repeats, min_time=0.0)(_img2pdf(_count))
+
+
+# --- harness -----------------------------------------------------------------------------------
+
+
+def measure(bench: Benchmark, loop: asyncio.AbstractEventLoop) -> dict[str, Any]:
+    """Time `bench`, calibrating the inner loop count so each repeat runs for at least `min_time`."""
+    if inspect.iscoroutinefunction(bench.func):
+
+        async def repeat(n: int) -> None:
+            for _ in range(n):
+                await bench.func()
+
+        def run(n: int) -> None:
+            loop.run_until_complete(repeat(n))
+    else:
+
+        def run(n: int) -> None:
+            for _ in range(n):
+                bench.func()
+
+    run(1)  # warm up caches, lazily created files, etc.
+
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        run(loops)
+        elapsed = time.perf_counter() - started
+        if elapsed >= bench.min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(bench.min_time / elapsed) + 1))
+
+    timings = [elapsed / loops]
+    for _ in range(bench.repeats - 1):
+        started = time.perf_counter()
+        run(loops)
+        timings.append((time.perf_counter() - started) / loops)
+
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "loops": loops,
+        "repeats": len(timings),
+    }
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+def compare(results: dict[str, dict[str, Any]], baseline: dict[str, dict[str, Any]], threshold: float) -> int:
+    """Print a comparison against `baseline` and return the number of regressions."""
+    regressions = 0
+    print(f"\n{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in results.items():
+        if not (base := baseline.get(name)):
+            print(f"{name:<40} {'-':>12} {format_time(result['median_s']):>12} {'new':>9}")
+            continue
+
+        ratio = result["median_s"] / base["median_s"]
+        verdict = ""
+        if ratio > 1 + threshold:
+            verdict, regressions = "  REGRESSED", regressions + 1
+        elif ratio < 1 - threshold:
+            verdict = "  improved"
+        print(
+            f"{name:<40} {format_time(base['median_s']):>12} {format_time(result['median_s']):>12} "
+            f"{(ratio - 1) * 100:+8.1f}%{verdict}"
+        )
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the bot's micro-benchmarks.")
+    parser.add_argument("-k", "--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, type=Path, help="Save results as a baseline")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, type=Path, help="Compare with a baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    parser.add_argument("--quick", action="store_true", help="Fewer repeats, for a fast sanity check")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    loop = asyncio.new_event_loop()
+
+    results: dict[str, dict[str, Any]] = {}
+    for bench in BENCHMARKS:
+        if args.filter not in bench.name:
+            continue
+        if args.quick:
+            bench.repeats, bench.min_time = min(bench.repeats, 3), min(bench.min_time, 0.05)
+
+        results[bench.name] = measure(bench, loop)
+        print(f"{bench.name:<40} {format_time(results[bench.name]['median_s'])}  (x{results[bench.name]['loops']})")
+
+    regressions = 0
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        args.save.write_text(
+            json.dumps(
+                {
+                    "meta": {
+                        "created": datetime.now(UTC).isoformat(),
+                        "python": sys.version.split()[0],
+                        "platform": platform.platform(),
+                        "machine": platform.machine(),
+                    },
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+        print(f"\nSaved baseline to {args.save}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
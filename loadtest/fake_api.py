@@ -0,0 +1,190 @@
+"""A fake Telegram Bot API server for offline load tests.
+
+Point the bot at it with `TELEGRAM_API_URL=http://127.0.0.1:8081`. Every method
+answers after a simulated latency with a minimal but well-formed result, a
+configurable share of calls fail with a 429 carrying `retry_after`, and file
+downloads return a generated JPEG.
+
+Usage:
+    python -m loadtest.fake_api --port 8081 --latency 0.05 --flood-ratio 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any
+
+from aiohttp import web
+
+_MESSAGE_METHODS = {
+    "sendMessage",
+    "sendDocument",
+    "sendPhoto",
+    "sendVideo",
+    "sendAudio",
+    "sendVoice",
+    "forwardMessage",
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageReplyMarkup",
+    "editMessageMedia",
+}
+_MESSAGE_ID_METHODS = {"copyMessage"}
+_MESSAGE_ID_LIST_METHODS = {"copyMessages", "forwardMessages"}
+
+
+class FakeBotApi:
+    """In-process Bot API stand-in that counts calls per method."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        flood_ratio: float = 0.0,
+        retry_after: int = 1,
+        seed: int | None = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_ratio = flood_ratio
+        self.retry_after = retry_after
+        self.calls: Counter[str] = Counter()
+        self.floods: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(1_000_000)
+        self._file_bytes: bytes | None = None
+        self._runner: web.AppRunner | None = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle_method)
+        self.app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """Start serving and return the base URL to use as `TELEGRAM_API_URL`."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _delay(self) -> None:
+        await asyncio.sleep(max(0.0, self._random.gauss(self.latency, self.jitter)))
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {key: _decode(value) for key, value in (await request.post()).items()}
+        self.calls[method] += 1
+        await self._delay()
+
+        if self.flood_ratio and self._random.random() < self.flood_ratio:
+            self.floods[method] += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        return web.json_response({"ok": True, "result": self.result(method, params)})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls["downloadFile"] += 1
+        await self._delay()
+        return web.Response(body=self._sample_file(), content_type="image/jpeg")
+
+    def result(self, method: str, params: dict[str, Any]) -> Any:
+        """Build the `result` of a successful call to `method`."""
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        if method == "getFile":
+            file_id = str(params.get("file_id", "file"))
+            return {
+                "file_id": file_id,
+                "file_unique_id": f"u{abs(hash(file_id))}",
+                "file_size": len(self._sample_file()),
+                "file_path": f"photos/{file_id}.jpg",
+            }
+        if method in _MESSAGE_ID_METHODS:
+            return {"message_id": next(self._message_ids)}
+        if method in _MESSAGE_ID_LIST_METHODS:
+            return [{"message_id": next(self._message_ids)} for _ in params.get("message_ids", [])]
+        if method == "sendMediaGroup":
+            return [self._message(params) for _ in params.get("media", [])]
+        if method in _MESSAGE_METHODS:
+            if "inline_message_id" in params:
+                return True
+            return self._message(params)
+        return True
+
+    def _message(self, params: dict[str, Any]) -> dict[str, Any]:
+        chat_id = int(params.get("chat_id", 0))
+        message: dict[str, Any] = {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "channel"},
+        }
+        if "text" in params:
+            message["text"] = str(params["text"])
+        if "caption" in params:
+            message["caption"] = str(params["caption"])
+        if "document" in params:
+            message["document"] = {"file_id": f"doc{message['message_id']}", "file_unique_id": "doc"}
+        return message
+
+    def _sample_file(self) -> bytes:
+        if self._file_bytes is None:
+            from PIL import Image
+
+            buffer = io.BytesIO()
+            Image.new("RGB", (1280, 960), (200, 180, 160)).save(buffer, "JPEG", quality=80)
+            self._file_bytes = buffer.getvalue()
+        return self._file_bytes
+
+
+def _decode(value: Any) -> Any:
+    """Form fields hold JSON for lists/objects/numbers and raw strings for text."""
+    if not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run a fake Telegram Bot API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean simulated latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Standard deviation of the latency")
+    parser.add_argument("--flood-ratio", type=float, default=0.0, help="Share of calls answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after sent with simulated 429s")
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    api = FakeBotApi(args.latency, args.jitter, args.flood_ratio, args.retry_after)
+    print(f"Fake Bot API listening on {await api.start(args.host, args.port)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.stop()
+        print("\n".join(f"{method:<28} {count:>8}" for method, count in api.calls.most_common()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,208 @@
+"""Replay recorded webhook traffic against `main.app`, with the Bot API faked.
+
+Record traffic in production by setting `WEBHOOK_RECORD_PATH`, then replay it
+against a scratch database (MONGO_NAME) with the same CHANNEL_ID/ARCHIVE_CHANNEL:
+
+    python -m loadtest.replay updates.jsonl --speed 4
+    python -m loadtest.replay updates.jsonl --speed 0 --concurrency 32 --flood-ratio 0.02
+
+The harness starts the fake Bot API (see `loadtest.fake_api`) and the FastAPI
+app under uvicorn in this process, POSTs each update to the webhook at its
+recorded offset divided by `--speed` (0 = as fast as possible) and reports
+updates/sec, p50/p99 latency and MongoDB / Bot API calls per update for the
+channel-ingest, browse and img2pdf flows. Call counts come from each update's
+trace span tree, so tracing is switched to keep every update.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import secrets
+import socket
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import aiohttp
+
+from loadtest.fake_api import FakeBotApi
+
+INGEST, BROWSE, IMG2PDF, OTHER = "channel-ingest", "browse", "img2pdf", "other"
+
+
+@dataclass
+class Sample:
+    flow: str
+    update_id: int
+    latency: float
+    ok: bool
+
+
+@dataclass
+class FlowClassifier:
+    """Attribute updates to a flow, following each private chat's last command."""
+
+    chats: dict[int, str] = field(default_factory=dict)
+
+    def classify(self, update: dict[str, Any]) -> str:
+        if "channel_post" in update or "edited_channel_post" in update:
+            return INGEST
+
+        if callback := update.get("callback_query"):
+            return self.chats.get(callback["from"]["id"], OTHER)
+
+        message = update.get("message")
+        if not message:
+            return OTHER
+
+        chat_id, text = message["chat"]["id"], message.get("text", "")
+        if text.startswith("/img2pdf"):
+            self.chats[chat_id] = IMG2PDF
+        elif text.startswith(("/browse", "/start")):
+            self.chats[chat_id] = BROWSE
+        return self.chats.get(chat_id, OTHER)
+
+
+def load_recording(path: Path) -> list[tuple[float, dict[str, Any]]]:
+    """Read (offset seconds, update) pairs from a recording, ordered by arrival."""
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    records.sort(key=lambda record: record["t"])
+    origin = records[0]["t"] if records else 0.0
+    return [(record["t"] - origin, record["update"]) for record in records]
+
+
+def count_spans(span: dict[str, Any], prefix: str) -> int:
+    return int(span["name"].startswith(prefix)) + sum(count_spans(c, prefix) for c in span.get("children", ()))
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of `values` (0 < q <= 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered) / 100) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay recorded webhook updates against the bot.")
+    parser.add_argument("recording", type=Path, help="JSON-lines file written via WEBHOOK_RECORD_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiple (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum updates in flight")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Mean fake Bot API latency in seconds")
+    parser.add_argument("--api-jitter", type=float, default=0.02)
+    parser.add_argument("--flood-ratio", type=float, default=0.0, help="Share of Bot API calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds to wait for background work at the end")
+    return parser.parse_args()
+
+
+async def replay(args: argparse.Namespace) -> None:
+    updates = load_recording(args.recording)
+    if not updates:
+        raise SystemExit(f"{args.recording} has no updates")
+
+    api = FakeBotApi(args.api_latency, args.api_jitter, args.flood_ratio, args.retry_after, seed=0)
+    api_url = await api.start(port=free_port())
+
+    app_port, secret = free_port(), secrets.token_hex(16)
+    os.environ.update(
+        TELEGRAM_API_URL=api_url,
+        HOST_URL=f"http://127.0.0.1:{app_port}",
+        WEBHOOK_SECRET=secret,
+        TRACE_SLOW_THRESHOLD="0",
+        TRACE_BUFFER_SIZE=str(len(updates) + 100),
+        LOOP_LAG_INTERVAL="3600",  # its warnings would fire on every tick with a zero threshold
+    )
+    os.environ.pop("WEBHOOK_RECORD_PATH", None)
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:loadtest")
+
+    # Imported late: the bot and tracing read the environment at import time.
+    import uvicorn
+
+    from app.config import WEBHOOK_URL
+    from app.tracing import slow_updates
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=app_port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+    api.calls.clear()
+
+    classifier = FlowClassifier()
+    samples: list[Sample] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with aiohttp.ClientSession(headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as session:
+
+        async def post(flow: str, update: dict[str, Any]) -> None:
+            async with semaphore:
+                sent = time.perf_counter()
+                try:
+                    async with session.post(WEBHOOK_URL, json=update) as response:
+                        ok = response.status == 200
+                except aiohttp.ClientError:
+                    ok = False
+                samples.append(Sample(flow, update["update_id"], time.perf_counter() - sent, ok))
+
+        print(f"Replaying {len(updates)} updates from {args.recording} at {args.speed or 'max'}x")
+        started = time.perf_counter()
+        tasks = []
+        for offset, update in updates:
+            if args.speed:
+                await asyncio.sleep(max(0.0, started + offset / args.speed - time.perf_counter()))
+            tasks.append(asyncio.create_task(post(classifier.classify(update), update)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    await asyncio.sleep(args.settle)
+    server.should_exit = True
+    await serving
+    await api.stop()
+
+    report(samples, slow_updates, elapsed, api)
+
+
+def report(samples: list[Sample], traces: Any, elapsed: float, api: FakeBotApi) -> None:
+    spans = {trace["attributes"].get("update_id"): trace for trace in traces if "attributes" in trace}
+    by_flow: dict[str, list[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_flow[sample.flow].append(sample)
+        by_flow["all"].append(sample)
+
+    header = f"{'flow':<16} {'updates':>8} {'upd/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'mongo/upd':>10} {'api/upd':>8}"
+    print(f"\n{header} {'errors':>7}")
+    for flow in (INGEST, BROWSE, IMG2PDF, OTHER, "all"):
+        if not (flow_samples := by_flow.get(flow)):
+            continue
+        latencies = [s.latency for s in flow_samples]
+        traced = [spans[s.update_id] for s in flow_samples if s.update_id in spans]
+        mongo = sum(count_spans(t, "mongo ") for t in traced) / max(len(traced), 1)
+        calls = sum(count_spans(t, "api ") for t in traced) / max(len(traced), 1)
+        print(
+            f"{flow:<16} {len(flow_samples):>8} {len(flow_samples) / elapsed:>8.1f} "
+            f"{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} "
+            f"{mongo:>10.2f} {calls:>8.2f} {sum(not s.ok for s in flow_samples):>7}"
+        )
+
+    print(f"\nFake Bot API calls ({sum(api.floods.values())} answered with 429):")
+    for method, count in api.calls.most_common():
+        print(f"  {method:<28} {count:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(replay(parse_args()))
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.types import (
     BotCommand,
@@ -14,19 +17,38 @@ from aiogram.types import (
 )
 from beanie import init_beanie
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 
-from app.config import TELEGRAM_BOT_TOKEN, WEBHOOK_EP, WEBHOOK_SECRET, WEBHOOK_URL
+from app.catalog import router as catalog_router
+from app.config import (
+    METRICS_TOKEN,
+    SKIP_INDEXES,
+    TELEGRAM_API_URL,
+    TELEGRAM_BOT_TOKEN,
+    WEBHOOK_EP,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
 from app.database.base import database
-from app.database.models import Course
+from app.database.models import Course, CourseFile, ProcessedUpdate, RecaptionJob, Tenant
+from app.debug import router as debug_router
 from app.handlers import setup_routes
-from app.logger import setup_logging
-from app.middlewares import setup_middlewares
+from app.jobs.downloads import downloads
+from app.jobs.recaption import resume_recaption_jobs
+from app.logger import setup_logging, shutdown_logging
+from app.metrics import CONTENT_TYPE, REGISTRY
+from app.middlewares import setup_middlewares, setup_session_middlewares
+from app.pacing import caption_edits, run_in_background
+from app.recorder import recorder
+from app.startup import report_startup, sync_commands, sync_webhook, timed_step
+from app.tenants import setup_tenants, tenants
+from app.tracing import monitor_loop_lag, trace
 
 logger = logging.getLogger(__name__)
 
 bot = Bot(
     TELEGRAM_BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML, link_preview_is_disabled=True),
 )
 
@@ -40,24 +62,43 @@ async def global_error_handler(event: ErrorEvent):
     logger.critical("Unhandled exception", exc_info=event.exception)
 
 
-async def init_bot() -> None:
-    setup_logging(bot)
+COMMANDS = [
+    BotCommand(command="/start", description="Start chatting"),
+    BotCommand(command="/browse", description="Browse available materials"),
+    BotCommand(command="/img2pdf", description="Convert images into a PDF"),
+]
 
-    # Init database
-    await init_beanie(database=database, document_models=[Course])
 
-    # Load middlewares and routes
-    await setup_middlewares(dp)
-    await setup_routes(dp)
+async def init_bot(webhook_url: str | None = None) -> None:
+    """Prepare the bot; the webhook is set to `webhook_url`, or deleted for polling when None."""
+    setup_logging(bot)
+
+    with trace("startup") as root:
+        # Local setup first, then the independent network steps concurrently.
+        with trace("handlers"):
+            await setup_middlewares(dp)
+            setup_session_middlewares(bot)
+            await setup_routes(dp)
+
+        await asyncio.gather(
+            timed_step(
+                "init_beanie",
+                init_beanie(
+                    database=database,
+                    document_models=[Course, CourseFile, RecaptionJob, ProcessedUpdate, Tenant],
+                    skip_indexes=SKIP_INDEXES,
+                ),
+            ),
+            timed_step("commands", sync_commands(bot, COMMANDS, BotCommandScopeAllPrivateChats())),
+            timed_step("webhook", sync_webhook(bot, webhook_url, WEBHOOK_SECRET)),
+        )
+        await timed_step("tenants", setup_tenants())
+    report_startup(root)
 
-    await bot.set_my_commands(
-        [
-            BotCommand(command="/start", description="Start chatting"),
-            BotCommand(command="/browse", description="Browse available materials"),
-            BotCommand(command="/img2pdf", description="Convert images into a PDF"),
-        ],
-        scope=BotCommandScopeAllPrivateChats(),
-    )
+    run_in_background(resume_recaption_jobs(bot), name="resume-recaption-jobs")
+    run_in_background(monitor_loop_lag(), name="event-loop-lag-monitor")
+    run_in_background(downloads.run(), name="download-counter")
+    run_in_background(tenants.run(), name="tenant-reload")
 
 
 @asynccontextmanager
@@ -69,18 +110,25 @@ async def lifespan(app: FastAPI):
             "mode via testing.py instead."
         )
 
-    await init_bot()
-    await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+    await init_bot(WEBHOOK_URL)
     logger.info("Webhook set and bot ready")
 
     yield
+    await caption_edits.flush()
+    await downloads.flush()
+
     from app.database.base import client
 
     await client.close()
     logger.info("Bot stopped")
+    if recorder:
+        recorder.close()
+    await shutdown_logging()
 
 
 app = FastAPI(lifespan=lifespan)
+app.include_router(debug_router)
+app.include_router(catalog_router)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -88,12 +136,24 @@ async def index():
     return "<h1>Bot is running</h1>"
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=403, detail="Invalid metrics token")
+
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.post(f"/{WEBHOOK_EP}", include_in_schema=False)
 async def telegram_webhook(request: Request):
     secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
     if secret != WEBHOOK_SECRET:
         raise HTTPException(status_code=403, detail="Invalid webhook secret")
 
-    update = Update.model_validate(await request.json())
+    payload = await request.json()
+    if recorder:
+        recorder.record(payload)
+
+    update = Update.model_validate(payload)
     await dp.feed_update(bot, update)
     return {"ok": True}
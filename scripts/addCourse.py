@@ -21,7 +21,6 @@ async def main():
         tutorName="",
         semester=Ordinal(3),
         isPractical=True,
-        files=[],
     ).insert()
 
     print("Adding Completed Successfully!")
@@ -0,0 +1,50 @@
+"""Add a batch (or update one) so the running bots serve it on their next tenant reload.
+
+Run:
+
+    python -m scripts.addTenant batch-2026 --title "دفعة 2026" --source -100111 --archive -100222 --start-year 2026
+
+Courses are then seeded into the batch with `scripts.seedCourses --namespace batch-2026`. The default
+batch (TENANT_NAMESPACE and the channels in the environment) needs no entry.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+from beanie import init_beanie
+
+from app.config import TENANT_NAMESPACE
+from app.database.base import database
+from app.database.models import Tenant
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Create or update a batch served by the bot.")
+    parser.add_argument("namespace", help="Key of the batch's courses and catalog")
+    parser.add_argument("--title", default="", help="Name students pick the batch by (default: the namespace)")
+    parser.add_argument("--source", type=int, required=True, help="Channel the batch's materials are posted in")
+    parser.add_argument("--archive", type=int, required=True, help="Channel the batch's files are archived in")
+    parser.add_argument("--start-year", type=int, required=True, help="Year the batch's level 1 began")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    if args.namespace == TENANT_NAMESPACE:
+        raise SystemExit(f"{args.namespace!r} is the default batch; configure it through the environment instead.")
+
+    await init_beanie(database=database, document_models=[Tenant])
+
+    tenant = await Tenant.find_one(Tenant.namespace == args.namespace) or Tenant(
+        namespace=args.namespace, sourceChatId=args.source, archiveChatId=args.archive, startYear=args.start_year
+    )
+    tenant.title = args.title
+    tenant.sourceChatId, tenant.archiveChatId, tenant.startYear = args.source, args.archive, args.start_year
+    await tenant.save()
+    print(f"Saved batch {tenant.namespace!r}: {tenant.sourceChatId} -> {tenant.archiveChatId} ({tenant.startYear})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""Find files archived more than once under the same course and merge them into their earliest copy.
+
+Two files are the same when Telegram's unique file id and the size match. Files
+stored before unique ids were recorded can have theirs looked up first with
+`--backfill` (Telegram only serves that lookup for files up to 20 MB). Run:
+
+    python -m scripts.dedupeFiles --backfill --dry-run   # record missing unique ids, then report the duplicates
+    python -m scripts.dedupeFiles --delete-posts         # merge them and delete the extra archive posts
+
+Merging keeps the earliest archive post of each group, with its title, links the
+others' source posts to it (so their edits still retitle it) and removes them from
+the course; `--delete-posts` also deletes them from their
+archive channel. Run `scripts.migrateFiles` first: embedded files are not scanned.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import defaultdict
+from itertools import chain
+from typing import TYPE_CHECKING, Any
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from beanie import init_beanie
+from pymongo import UpdateOne
+
+from app.config import TELEGRAM_API_URL, TELEGRAM_BOT_TOKEN
+from app.database.base import database
+from app.database.models.course import Course, CourseFile
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+GET_FILE_LIMIT = 20 * 1024 * 1024
+"""Largest file the Bot API's getFile serves."""
+
+DELETE_BATCH = 100
+"""Most messages one deleteMessages call accepts."""
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Merge files archived more than once under the same course.")
+    parser.add_argument("--backfill", action="store_true", help="Look up missing unique file ids first")
+    parser.add_argument("--delete-posts", action="store_true", help="Also delete the extra archive posts")
+    parser.add_argument("--batch-size", type=int, default=500, help="Files per bulk write")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report the duplicates (backfilled ids are still stored)"
+    )
+    return parser.parse_args()
+
+
+def chunks(items: list[Any], size: int) -> Iterator[list[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+async def unique_id(bot: Bot, file_id: str) -> str | None:
+    """Telegram's unique id of `file_id`, or None if it can't be looked up."""
+    try:
+        return (await bot.get_file(file_id)).file_unique_id
+    except TelegramRetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        return await unique_id(bot, file_id)
+    except TelegramBadRequest as e:
+        print(f"  cannot look up {file_id}: {e.message}")
+        return None
+
+
+async def backfill(bot: Bot, batch_size: int) -> None:
+    """Record the unique file id of every file missing one, as far as getFile allows."""
+    collection = CourseFile.get_pymongo_collection()
+    query = {"fileUniqueId": None, "sizeBytes": {"$lte": GET_FILE_LIMIT}}
+    files = await collection.find(query, {"fileId": 1}).to_list()
+    skipped = await collection.count_documents({"fileUniqueId": None, "sizeBytes": {"$gt": GET_FILE_LIMIT}})
+    print(f"Backfilling unique ids of {len(files)} file(s); {skipped} larger file(s) can't be looked up")
+
+    found = 0
+    for batch in chunks(files, batch_size):
+        ops = [
+            UpdateOne({"_id": file["_id"]}, {"$set": {"fileUniqueId": value}})
+            for file in batch
+            if (value := await unique_id(bot, file["fileId"]))
+        ]
+        found += len(ops)
+        if ops:
+            await collection.bulk_write(ops, ordered=False)
+        print(f"  {found} unique id(s) found so far")
+
+
+async def find_duplicates() -> list[dict[str, Any]]:
+    """Groups of files sharing a course, archive chat and content, with their archive ids in archive order."""
+    pipeline = [
+        {"$match": {"fileUniqueId": {"$ne": None}}},
+        {"$sort": {"archiveTelegramMessageId": 1}},
+        {
+            "$group": {
+                "_id": {
+                    "course": "$courseId",
+                    "chat": "$chatId",
+                    "fileUniqueId": "$fileUniqueId",
+                    "size": "$sizeBytes",
+                },
+                "ids": {"$push": "$archiveTelegramMessageId"},
+                "titles": {"$push": "$title"},
+                "sources": {
+                    "$push": {"fromChatId": "$fromChatId", "originalTelegramMessageId": "$originalTelegramMessageId"}
+                },
+                "aliases": {"$push": {"$ifNull": ["$aliases", []]}},
+            }
+        },
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    return await (await CourseFile.get_pymongo_collection().aggregate(pipeline)).to_list()
+
+
+async def main():
+    args = parse_args()
+    await init_beanie(database=database, document_models=[Course, CourseFile])
+
+    if await Course.get_pymongo_collection().count_documents({"files.0": {"$exists": True}}, limit=1):
+        print("Some courses still embed their files; run scripts.migrateFiles first to include them.")
+
+    bot = None
+    if args.backfill or args.delete_posts:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+        bot = Bot(TELEGRAM_BOT_TOKEN, session=session)
+
+    try:
+        if bot and args.backfill:
+            await backfill(bot, args.batch_size)
+
+        groups = await find_duplicates()
+        redundant: defaultdict[int, list[int]] = defaultdict(list)
+        links: list[UpdateOne] = []
+        for group in groups:
+            kept, *extra = group["ids"]
+            redundant[group["_id"]["chat"]].extend(extra)
+            aliases = [*group["sources"][1:], *chain.from_iterable(group["aliases"][1:])]
+            query = {"chatId": group["_id"]["chat"], "archiveTelegramMessageId": kept}
+            links.append(UpdateOne(query, {"$addToSet": {"aliases": {"$each": aliases}}}))
+            print(f"course={group['_id']['course']} keep {kept} ({group['titles'][0]!r}), merge {extra}")
+
+        extra_count = sum(len(ids) for ids in redundant.values())
+        print(
+            f"{len(groups)} duplicated file(s), {extra_count} extra cop(ies)" + (" (dry run)" if args.dry_run else "")
+        )
+        if args.dry_run or not extra_count:
+            return
+
+        for batch in chunks(links, args.batch_size):
+            await CourseFile.get_pymongo_collection().bulk_write(batch, ordered=False)
+
+        deleted = 0
+        for chat_id, ids in redundant.items():
+            for batch in chunks(ids, args.batch_size):
+                query = {"chatId": chat_id, "archiveTelegramMessageId": {"$in": batch}}
+                deleted += (await CourseFile.get_pymongo_collection().delete_many(query)).deleted_count
+        print(f"Removed {deleted} extra file(s) from their courses")
+
+        if bot and args.delete_posts:
+            for chat_id, ids in redundant.items():
+                for batch in chunks(ids, DELETE_BATCH):
+                    try:
+                        await bot.delete_messages(chat_id, batch)
+                    except TelegramBadRequest as e:
+                        print(f"  could not delete posts {batch[0]}..{batch[-1]} of {chat_id}: {e.message}")
+            print(f"Deleted {extra_count} extra archive post(s)")
+    finally:
+        if bot:
+            await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import codecs
+import json
+import re
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from beanie import PydanticObjectId, init_beanie
+from pydantic import BaseModel, Field
+from pymongo import UpdateOne
+
+from app.config import TENANT_NAMESPACE
+from app.database.base import database
+from app.database.models import Ordinal, Tenant
+from app.database.models.course import CAPTION_PATTERN, Course, CourseFile, MessageType, _resolve_course_similarity
+from app.tenants import tenants
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+MESSAGES_ARRAY = re.compile(r'"messages"\s*:\s*\[')
+
+MEDIA_TYPES = {
+    "video_file": MessageType.VIDEO,
+    "audio_file": MessageType.AUDIO,
+}
+
+
+def iter_export_messages(path: Path, progress: dict[str, int], chunk_size: int = 1 << 16) -> Iterator[dict[str, Any]]:
+    """Yield the objects of the export's top-level `messages` array one at a time.
+
+    Only the current chunk and the message being decoded are held in memory;
+    `progress["bytes"]` tracks how far into the file the reader is.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    with path.open("rb") as fp:
+
+        def read() -> bool:
+            raw = fp.read(chunk_size)
+            progress["bytes"] = fp.tell()
+            nonlocal buffer
+            buffer += utf8.decode(raw, final=not raw)
+            return bool(raw)
+
+        buffer = ""
+        while not (match := MESSAGES_ARRAY.search(buffer)):
+            if not read():
+                return
+
+        pos = match.end()
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos >= len(buffer):
+                buffer, pos = "", 0
+                if not read():
+                    return
+                continue
+
+            if buffer[pos] == "]":
+                return
+
+            try:
+                message, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                buffer, pos = buffer[pos:], 0
+                if not read():
+                    raise
+                continue
+
+            yield message
+
+            if pos > chunk_size:
+                buffer, pos = buffer[pos:], 0
+
+
+def message_caption(message: dict[str, Any]) -> str:
+    """Flatten an exported message's `text` (a string or a list of entities) into plain text."""
+    text = message.get("text", "")
+    if isinstance(text, str):
+        return text
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+
+
+def message_to_file(message: dict[str, Any], match: re.Match[str], chat_id: int) -> CourseFile | None:
+    """Build a `CourseFile` from an exported archive message, or None if it carries no supported file.
+
+    Exports don't include Telegram file ids, so `fileId` stays empty until the
+    archive post is next edited.
+    """
+    if message.get("type") != "message" or not (file := message.get("file")):
+        return None
+
+    if message.get("photo") or (media_type := message.get("media_type")) not in (*MEDIA_TYPES, None):
+        return None
+
+    file_name = message.get("file_name") or Path(file).name
+    return CourseFile(
+        title=match.group("title").strip(),
+        archiveTelegramMessageId=message["id"],
+        chatId=chat_id,
+        originalTelegramMessageId=message["id"],
+        fromChatId=chat_id,
+        fileId="",
+        originalName=file_name,
+        mimeType=message.get("mime_type") or "application/octet-stream",
+        telegramMessageType=MEDIA_TYPES.get(media_type or "", MessageType.DOCUMENT),
+        extension=Path(file_name).suffix.lstrip("."),
+        sizeBytes=message.get("file_size") or 0,
+    )
+
+
+class CourseKey(BaseModel):
+    """Projection of the fields needed to resolve a caption to a course."""
+
+    id: PydanticObjectId = Field(alias="_id")
+    courseName: str
+    semester: int
+
+
+class Importer:
+    """Resolve exported messages to courses and upsert their files in large batches."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.courses: dict[tuple[int, str], PydanticObjectId] = {}
+        self.new_courses: list[Course] = []
+        self.ops: list[UpdateOne] = []
+        self.stats = {"messages": 0, "files": 0, "skipped": 0, "unknown_course": 0, "bytes": 0}
+        self.last_message_id = 0
+        self.started = time.monotonic()
+
+    async def load_courses(self) -> None:
+        """Load every (semester, name) -> id mapping of the batch's courses in a single query."""
+        async for course in Course.find(Course.namespace == self.args.namespace, projection_model=CourseKey):
+            self.courses[(course.semester, course.courseName)] = course.id
+
+    def resolve_course(self, match: re.Match[str], caption: str) -> PydanticObjectId | None:
+        semester = Ordinal.get_semester(caption, self.args.start_year)
+        names = [name for sem, name in self.courses if sem == semester]
+        name = _resolve_course_similarity(match.group("course").strip(), names)
+
+        if (course_id := self.courses.get((semester, name))) or not self.args.create_missing:
+            return course_id
+
+        course = Course(
+            id=PydanticObjectId(),
+            courseName=name,
+            tutorName=(match.group("tutor") or "").strip(),
+            semester=Ordinal(semester),
+            isPractical=self.args.practical,
+            namespace=self.args.namespace,
+        )
+        self.new_courses.append(course)
+        self.courses[(semester, name)] = course.id
+        return course.id
+
+    def add(self, message: dict[str, Any]) -> None:
+        self.stats["messages"] += 1
+        self.last_message_id = message.get("id", self.last_message_id)
+
+        caption = message_caption(message)
+        if not (match := CAPTION_PATTERN.search(caption)) or not (
+            file := message_to_file(message, match, self.args.chat_id)
+        ):
+            self.stats["skipped"] += 1
+            return
+
+        if not (course_id := self.resolve_course(match, caption)):
+            self.stats["unknown_course"] += 1
+            return
+
+        self.stats["files"] += 1
+        file.courseId = course_id
+        self.ops.append(
+            UpdateOne(
+                {"chatId": file.chatId, "archiveTelegramMessageId": file.archiveTelegramMessageId},
+                {"$setOnInsert": file.model_dump(exclude={"id", "revision_id"})},
+                upsert=True,
+            )
+        )
+
+    async def flush(self) -> None:
+        """Write the pending batch (new courses first) and checkpoint the last message id."""
+        if not self.args.dry_run:
+            if self.new_courses:
+                await Course.insert_many(self.new_courses)
+            if self.ops:
+                await CourseFile.get_pymongo_collection().bulk_write(self.ops, ordered=False)
+            save_state(self.args.state, self.last_message_id)
+
+        self.new_courses, self.ops = [], []
+        self.report()
+
+    def report(self) -> None:
+        elapsed = time.monotonic() - self.started
+        percent = self.stats["bytes"] / self.args.total_bytes * 100 if self.args.total_bytes else 100
+        print(
+            f"[{percent:5.1f}%] messages={self.stats['messages']} files={self.stats['files']} "
+            f"skipped={self.stats['skipped']} unknown_course={self.stats['unknown_course']} "
+            f"last_id={self.last_message_id} ({self.stats['messages'] / max(elapsed, 1e-9):.0f} msg/s)"
+        )
+
+
+def load_state(path: Path) -> int:
+    """Return the last message id committed by a previous run, or 0."""
+    try:
+        return json.loads(path.read_text())["last_message_id"]
+    except (FileNotFoundError, KeyError, json.JSONDecodeError):
+        return 0
+
+
+def save_state(path: Path, last_message_id: int) -> None:
+    path.write_text(json.dumps({"last_message_id": last_message_id}))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the course files from a Telegram Desktop JSON export of the archive channel."
+    )
+    parser.add_argument("export", type=Path, help="Path to the export's result.json")
+    parser.add_argument("--namespace", default=TENANT_NAMESPACE, help="Batch the export belongs to (default: config)")
+    parser.add_argument("--chat-id", type=int, help="Archive channel id (default: the batch's archive channel)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Files per bulk write")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and resolve without writing")
+    parser.add_argument("--create-missing", action="store_true", help="Create courses that don't exist yet")
+    parser.add_argument("--practical", action="store_true", help="Mark created courses as practical")
+    parser.add_argument("--state", type=Path, help="Resume checkpoint file (default: <export>.import-state.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start from the top")
+    args = parser.parse_args()
+
+    args.state = args.state or args.export.with_suffix(".import-state.json")
+    args.total_bytes = args.export.stat().st_size
+    return args
+
+
+async def main():
+    args = parse_args()
+    await init_beanie(database=database, document_models=[Course, CourseFile, Tenant])
+    await tenants.load()
+    if not (tenant := tenants.by_namespace(args.namespace)):
+        raise SystemExit(f"Unknown batch {args.namespace!r}; add it with scripts.addTenant first.")
+    args.chat_id = args.chat_id or tenant.archiveChatId
+    args.start_year = tenant.startYear
+
+    importer = Importer(args)
+    await importer.load_courses()
+
+    resume_after = 0 if args.restart else load_state(args.state)
+    if resume_after:
+        print(f"Resuming after message id {resume_after}")
+
+    print("Starting Import..." + (" (dry run)" if args.dry_run else ""))
+    for message in iter_export_messages(args.export, importer.stats):
+        if message.get("id", 0) <= resume_after:
+            continue
+
+        importer.add(message)
+        if len(importer.ops) >= args.batch_size:
+            await importer.flush()
+
+    await importer.flush()
+    print("Import Completed Successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
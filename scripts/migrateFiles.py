@@ -0,0 +1,90 @@
+"""Move the files embedded in course documents into the `course_files` collection.
+
+The bot keeps working during the migration: with `COURSE_FILES_DUAL_READ` on
+(the default) reads merge in files still embedded in courses, and writes move
+the files they touch first. Run:
+
+    python -m scripts.migrateFiles --keep-embedded   # copy and verify, keep the embedded arrays
+    python -m scripts.migrateFiles --restart         # copy, verify and remove the embedded arrays
+
+Courses are processed in `_id` order, `--batch-size` files per bulk write, and
+progress is checkpointed, so an interrupted run resumes where it stopped. Once
+no course has embedded files left, set `COURSE_FILES_DUAL_READ=false`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from beanie import PydanticObjectId, init_beanie
+
+from app.database.base import database
+from app.database.models.course import Course, CourseFile
+
+
+def load_state(path: Path) -> PydanticObjectId | None:
+    """Return the last course id committed by a previous run, or None."""
+    try:
+        return PydanticObjectId(json.loads(path.read_text())["last_course_id"])
+    except (FileNotFoundError, KeyError, json.JSONDecodeError):
+        return None
+
+
+def save_state(path: Path, last_course_id: PydanticObjectId) -> None:
+    path.write_text(json.dumps({"last_course_id": str(last_course_id)}))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Move embedded course files into the course_files collection.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Files per bulk write")
+    parser.add_argument(
+        "--keep-embedded", action="store_true", help="Copy and verify only; leave the embedded arrays in place"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be migrated")
+    parser.add_argument("--state", type=Path, default=Path("migrate-files.state.json"), help="Resume checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start from the top")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    await init_beanie(database=database, document_models=[Course, CourseFile])
+
+    query: dict = {"files.0": {"$exists": True}}
+    if not args.restart and (resume_after := load_state(args.state)):
+        print(f"Resuming after course {resume_after}")
+        query["_id"] = {"$gt": resume_after}
+
+    courses = await Course.get_pymongo_collection().find(query, {"files": {"$size": "$files"}}).sort("_id").to_list()
+    total = sum(course["files"] for course in courses)
+    print(f"{len(courses)} course(s) with {total} embedded file(s) to migrate" + (" (dry run)" if args.dry_run else ""))
+    if args.dry_run:
+        return
+
+    copied = verified = 0
+    started = time.monotonic()
+    for index, course in enumerate(courses, 1):
+        course_copied, course_verified = await Course.migrate_embedded_files(
+            {"_id": course["_id"]}, unset=not args.keep_embedded, batch_size=args.batch_size
+        )
+        copied, verified = copied + course_copied, verified + course_verified
+        save_state(args.state, course["_id"])
+
+        elapsed = time.monotonic() - started
+        print(
+            f"[{index}/{len(courses)}] course={course['_id']} files={course['files']} copied={copied} "
+            f"verified={verified} ({index / max(elapsed, 1e-9):.1f} courses/s)"
+        )
+
+    failed = len(courses) - verified
+    print(f"Migration finished: {copied} file(s) copied, {verified} course(s) verified, {failed} to retry.")
+    if failed:
+        args.state.unlink(missing_ok=True)  # the next run must revisit the courses that failed verification
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from beanie import init_beanie
+from pydantic import BaseModel, field_validator
+from pymongo import UpdateOne
+
+from app.config import TENANT_NAMESPACE
+from app.database.base import database
+from app.database.models import Ordinal, Tenant
+from app.database.models.course import Course, CourseType
+from app.tenants import tenants
+
+TRUE_VALUES = {"1", "true", "yes", "y", CourseType.PRACTICAL.value}
+
+
+class CourseSeed(BaseModel):
+    """A single course entry from the manifest."""
+
+    courseName: str
+    tutorName: str = ""
+    semester: Ordinal
+    isPractical: bool = False
+
+    @field_validator("courseName", "tutorName", mode="before")
+    @classmethod
+    def strip_text(cls, value: Any) -> str:
+        return str(value or "").strip()
+
+    @field_validator("semester", mode="before")
+    @classmethod
+    def parse_semester(cls, value: Any) -> Ordinal:
+        """Accept either a semester number (`3`) or its Arabic ordinal name (`الثالث`)."""
+        if isinstance(value, str) and not value.strip().isdigit():
+            return Ordinal(Ordinal.get_value(value.strip()))
+        return Ordinal(int(value))
+
+    @field_validator("isPractical", mode="before")
+    @classmethod
+    def parse_bool(cls, value: Any) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in TRUE_VALUES
+        return bool(value)
+
+    @property
+    def key(self) -> tuple[int, str]:
+        return self.semester.value, self.courseName
+
+
+class ExistingCourse(BaseModel):
+    """Projection of the seeded fields of a stored course."""
+
+    courseName: str
+    tutorName: str
+    semester: int
+    isPractical: bool
+
+
+def load_manifest(path: Path) -> list[CourseSeed]:
+    """Read course entries from a CSV or YAML manifest."""
+    if path.suffix.lower() in {".yaml", ".yml"}:
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit("Reading YAML manifests requires PyYAML (`pip install pyyaml`); or use CSV.") from None
+
+        data = yaml.safe_load(path.read_text(encoding="utf-8")) or []
+        rows = data.get("courses", []) if isinstance(data, dict) else data
+    else:
+        with path.open(encoding="utf-8", newline="") as fp:
+            rows = list(csv.DictReader(fp))
+
+    seeds: dict[tuple[int, str], CourseSeed] = {}
+    for row in rows:
+        seed = CourseSeed.model_validate(row)
+        if seed.key in seeds:
+            raise SystemExit(f"Duplicate manifest entry: {seed.courseName!r} (semester {seed.semester.value})")
+        seeds[seed.key] = seed
+
+    return list(seeds.values())
+
+
+async def plan(
+    seeds: list[CourseSeed], namespace: str
+) -> tuple[list[CourseSeed], list[tuple[CourseSeed, ExistingCourse]]]:
+    """Diff the manifest against the batch's courses in a single query.
+
+    Returns:
+        A tuple of (courses to create, (course, stored version) pairs to update).
+    """
+    query = {
+        "namespace": namespace,
+        "$or": [{"courseName": s.courseName, "semester": s.semester.value} for s in seeds],
+    }
+    existing = {(c.semester, c.courseName): c async for c in Course.find(query, projection_model=ExistingCourse)}
+
+    to_create: list[CourseSeed] = []
+    to_update: list[tuple[CourseSeed, ExistingCourse]] = []
+    for seed in seeds:
+        if not (stored := existing.get(seed.key)):
+            to_create.append(seed)
+        elif (stored.tutorName, stored.isPractical) != (seed.tutorName, seed.isPractical):
+            to_update.append((seed, stored))
+
+    return to_create, to_update
+
+
+def print_plan(
+    seeds: list[CourseSeed],
+    to_create: list[CourseSeed],
+    to_update: list[tuple[CourseSeed, ExistingCourse]],
+) -> None:
+    for seed in to_create:
+        kind = CourseType.PRACTICAL if seed.isPractical else CourseType.THEORETICAL
+        print(f"  + {seed.courseName} ({seed.tutorName}) [{seed.semester.name}, {kind}]")
+
+    for seed, stored in to_update:
+        changes = []
+        if stored.tutorName != seed.tutorName:
+            changes.append(f"tutor: {stored.tutorName!r} -> {seed.tutorName!r}")
+        if stored.isPractical != seed.isPractical:
+            changes.append(f"isPractical: {stored.isPractical} -> {seed.isPractical}")
+        print(f"  ~ {seed.courseName} [{seed.semester.name}]: {', '.join(changes)}")
+
+    unchanged = len(seeds) - len(to_create) - len(to_update)
+    print(f"Plan: {len(to_create)} to create, {len(to_update)} to update, {unchanged} unchanged.")
+
+
+async def apply(seeds: list[CourseSeed], namespace: str) -> None:
+    """Upsert every changed course of the batch with a single bulk write."""
+    now = datetime.now(UTC)
+    ops = [
+        UpdateOne(
+            {"namespace": namespace, "courseName": seed.courseName, "semester": seed.semester.value},
+            {
+                "$set": {"tutorName": seed.tutorName, "isPractical": seed.isPractical, "updatedAt": now},
+                "$setOnInsert": {"createdAt": now},
+            },
+            upsert=True,
+        )
+        for seed in seeds
+    ]
+    result = await Course.get_pymongo_collection().bulk_write(ops, ordered=False)
+    print(f"Applied: {result.upserted_count} created, {result.modified_count} updated.")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Create or update courses from a CSV/YAML manifest.")
+    parser.add_argument(
+        "manifest", type=Path, help="CSV or YAML file with courseName, tutorName, semester, isPractical"
+    )
+    parser.add_argument("--namespace", default=TENANT_NAMESPACE, help="Batch the courses belong to (default: config)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the plan")
+    parser.add_argument("-y", "--yes", action="store_true", help="Apply without asking for confirmation")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    if not (seeds := load_manifest(args.manifest)):
+        raise SystemExit("Manifest contains no courses.")
+
+    # init_beanie creates any missing `Course.Settings.indexes`.
+    await init_beanie(database=database, document_models=[Course, Tenant])
+    await tenants.load()
+    if not tenants.by_namespace(args.namespace):
+        raise SystemExit(f"Unknown batch {args.namespace!r}; add it with scripts.addTenant first.")
+
+    to_create, to_update = await plan(seeds, args.namespace)
+    print_plan(seeds, to_create, to_update)
+
+    changes = to_create + [seed for seed, _ in to_update]
+    if not changes or args.dry_run:
+        return
+
+    if not args.yes and input("Apply these changes? [y/N] ").strip().lower() != "y":
+        print("Aborted.")
+        return
+
+    await apply(changes, args.namespace)
+    print("Seeding Completed Successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
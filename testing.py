@@ -3,17 +3,23 @@ from __future__ import annotations
 import asyncio
 import logging
 
+from app.jobs.downloads import downloads
+from app.logger import shutdown_logging
+from app.pacing import caption_edits
 from main import bot, dp, init_bot
 
 logger = logging.getLogger(__name__)
 
 
 async def main() -> None:
-    await bot.delete_webhook()
-
     await init_bot()
     logger.info("Bot is running in polling mode")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await caption_edits.flush()
+        await downloads.flush()
+        await shutdown_logging()
 
 
 if __name__ == "__main__":